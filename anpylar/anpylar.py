@@ -10,18 +10,12 @@
 # chase-seibert.github.io/blog/2014/03/21/python-multilevel-argparse.html
 
 import argparse
+import importlib
 import sys
 
-from . import application
-from . import bundle
-from . import component
-from . import module
-from . import paketize
-from . import pip
-from . import serve
-from . import syntaxcheck
-from . import version
-from . import webpack
+# the modules of the commands are imported when run, to let a build be handed
+# over to the daemon without loading the rest
+from . import daemon
 
 
 _debug = False
@@ -46,11 +40,13 @@ class AnPyLar(object):
         ('application', 'Generate application skeleton'),
         ('bundle', 'Create an AnPyLar  bundle'),
         ('component', 'Generate component code'),
+        ('daemon', 'Keep a build server running for faster builds'),
         ('paketize', 'Paketize an application'),
         ('module', 'Generate module code'),
         ('webpack', 'Pack the application for web deployment'),
         ('pip', 'Install packages with pip into an app'),
         ('serve', 'Serve an application'),
+        ('stdlib', 'Convert brython_stdlib.js to an indexed container'),
         ('syntaxcheck', 'Check files/directories for syntax errors'),
         ('version', 'Display version information'),
     )
@@ -92,14 +88,22 @@ class AnPyLar(object):
             sys.exit(1)
 
         command = cmds[0]
+        cmdargs = sys.argv[2:]
+        if command in daemon.COMMANDS and '--watch' not in cmdargs:
+            # handed over to a running daemon, else run here
+            code = daemon.request([command] + cmdargs)
+            if code is not None:
+                sys.exit(code)
+
         try:
-            mod = sys.modules[__package__ + '.' + self.modules[command]]
+            mod = importlib.import_module('.' + self.modules[command],
+                                          __package__)
         except KeyError as e:
             debugout(e)
             parser.print_help()
             sys.exit(1)
 
-        mod.run(sys.argv[2:], name=_NAME + '-' + command)
+        mod.run(cmdargs, name=_NAME + '-' + command)
 
 
 def run():
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+# Library interface to the build commands, for builds run inside a long lived
+# process:
+#
+#     from anpylar import api
+#
+#     result = api.webpack('myapp', split_vendor=True, precompress=True)
+#     print(result.outputs, result.size, result.timings)
+#
+# The keyword arguments are the options of the command line with "_" in place
+# of "-" (--hash-names -> hash_names=True) and take the same defaults. Options
+# which can be given several times take a list. Relative paths are relative
+# to the working directory of the process.
+#
+# Each function returns a BuildResult (see result.py) with the outputs, their
+# sizes and the time taken by each phase of the build.
+#
+# Unknown options raise TypeError and values the command line would reject
+# (e.g. not one of the choices) ValueError, before anything is built.
+#
+# Errors raise BuildError instead of ending the process and nothing is printed
+# for them. Logging is not configured: the messages of the builds go where the
+# logging configuration of the process sends them.
+#
+# The functions can be called repeatedly and from several threads at the same
+# time, as long as concurrent builds do not write the same outputs. The cache
+# of paketized files is shared by the builds using the same cache directory
+import argparse
+import logging
+import threading
+
+from .cache import BuildCache
+from . import bundle as _bundle
+from . import paketize as _paketize
+from . import pip as _pip
+from .result import BuildResult
+from .utils import CommandError, set_silent_errors
+from . import webpack as _webpack
+
+__all__ = ['BuildError', 'BuildResult', 'webpack', 'bundle', 'paketize',
+           'pip']
+
+
+# Options of the command line which are not for the api
+_CLI_ONLY = ('watch', 'watch_interval', 'quiet', 'verbose')
+
+
+class BuildError(Exception):
+    # A build which failed. The message is the error the build reported
+    def __init__(self, message, command):
+        super().__init__(message)
+        self.command = command
+
+
+_caches = {}  # cache dir -> BuildCache shared by the builds
+_caches_lock = threading.Lock()
+
+
+def _cache(args):
+    if getattr(args, 'no_cache', True):
+        return None
+
+    path = args.cache_dir or None
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = BuildCache(path)
+
+    return cache
+
+
+class _ErrorCollector(logging.Handler):
+    # Errors logged by the builds of a thread: the last is the message of
+    # the BuildError if the build bails out
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.errors = []
+
+    def filter(self, record):
+        return record.thread == self.thread
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+
+def _value(command, action, value):
+    # value of an option converted and checked as the command line does
+    if action.type is not None and value != action.default:
+        try:
+            value = action.type(value)
+        except (TypeError, ValueError):
+            raise ValueError('{}() invalid {} value for option {}: {!r}'
+                             .format(command, action.type.__name__,
+                                     action.dest, value)) from None
+
+    if action.choices is not None and value not in action.choices:
+        raise ValueError('{}() invalid choice for option {}: {!r} (choose '
+                         'from {})'.format(command, action.dest, value,
+                                           ', '.join(map(repr,
+                                                         action.choices))))
+
+    return value
+
+
+def _args(module, command, pargs, opts):
+    args, parser = module.parse_args(pargs, name='anpylar-' + command)
+    actions = {x.dest: x for x in parser._actions}
+    for name, value in opts.items():
+        if name in _CLI_ONLY or not hasattr(args, name):
+            raise TypeError('{}() got an unexpected option: {}'.format(
+                command, name))
+
+        action = actions.get(name)
+        if isinstance(action, argparse._AppendAction):
+            if isinstance(value, (str, bytes)):
+                raise TypeError('{}() option {} takes a list'.format(
+                    command, name))
+
+            value = [_value(command, action, x) for x in value]
+        elif action is not None:
+            value = _value(command, action, value)
+
+        setattr(args, name, value)
+
+    return args, parser
+
+
+def _build(command, build, args, parser, **kwargs):
+    result = BuildResult(command)
+    collector = _ErrorCollector()
+    logging.root.addHandler(collector)
+    set_silent_errors(True)
+    try:
+        build(args, parser, result=result, **kwargs)
+    except CommandError as e:
+        raise BuildError(str(e.error), command) from None
+    except SystemExit as e:
+        if e.code:  # 0: the build ended early, which is no error
+            error = collector.errors[-1] if collector.errors else None
+            error = error or '{} failed (code {})'.format(command, e.code)
+            raise BuildError(error, command) from None
+    finally:
+        set_silent_errors(False)
+        logging.root.removeHandler(collector)
+
+    return result
+
+
+def webpack(target='.', **opts):
+    # Packs the application in target for deployment
+    args, parser = _args(_webpack, 'webpack', [target], opts)
+    return _build('webpack', _webpack.build, args, parser,
+                  cache=_cache(args))
+
+
+def bundle(output, **opts):
+    # Writes an anpylar.js bundle to output
+    args, parser = _args(_bundle, 'bundle', [output], opts)
+    return _build('bundle', _bundle.build, args, parser, cache=_cache(args))
+
+
+def paketize(dir, outfile='', **opts):
+    # Paketizes the package in directory dir (to outfile)
+    pargs = [dir] + [outfile] * bool(outfile)
+    args, parser = _args(_paketize, 'paketize', pargs, opts)
+    return _build('paketize', _paketize.build, args, parser,
+                  cache=_cache(args))
+
+
+def pip(packages, target='.', **opts):
+    # Installs the packages (list) with pip into the application in target
+    args, parser = _args(_pip, 'pip', ['install'] + list(packages), opts)
+    args.target = target
+    return _build('pip', _pip.build, args, parser)
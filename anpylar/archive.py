@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import io
+import logging
+import mmap
+import os
+import os.path
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+
+from . import compress
+from .packaging import hashed_name
+
+
+ZIP_EXT = '.zip'
+TAR_EXTS = ('.tar', '.tar.gz', '.tgz')
+ARCHIVE_EXTS = (ZIP_EXT,) + TAR_EXTS
+
+# fixed timestamp for all members (the earliest a zip can hold)
+ARCHIVE_MTIME = 315532800  # 1980-01-01 00:00:00 UTC
+ARCHIVE_MODE = 0o644
+
+_BUFSIZE = 1024 * 1024
+
+
+def _file_mode():
+    # mode of a newly created file (mkstemp creates them 0600)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# mode of the written archives, as if created with open
+FILE_MODE = _file_mode()
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTS)
+
+
+def _iter_source(source):
+    # source: path to a file, bytes/str or a callable returning an iterable
+    # of bytes/str fragments. Generates bytes
+    if isinstance(source, bytes):
+        yield source
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            for buf in iter(lambda: f.read(_BUFSIZE), b''):
+                yield buf
+    else:
+        for fragment in source():
+            if not isinstance(fragment, bytes):
+                fragment = fragment.encode('utf-8')
+
+            yield fragment
+
+
+def _read_source(source):
+    if isinstance(source, bytes):
+        return source
+
+    return b''.join(_iter_source(source))
+
+
+class ArchiveWriter:
+    # Collects the files of a distribution (the same interface as DistSync
+    # plus reading/writing/renaming) and streams them to a zip or tar
+    # archive on "finish": sorted by name, with a fixed timestamp and mode to
+    # make the output depend only on the content.
+    #
+    # Copied files are read when the archive is written. Generated content
+    # can be given as a callable producing the fragments, which is called
+    # when written out. With precompress, .gz/.br members are stored next to
+    # the compressible ones (as done by compress in a dist directory)
+
+    def __init__(self, path, precompress=False, workers=None):
+        self.path = path
+        self.precompress = precompress
+        self.workers = workers
+        self.sources = {}  # rel -> source
+        self.stats = dict(members=0, size=0)
+
+    def _rel(self, *parts):
+        return '/'.join(x for part in parts for x in part.split(os.sep)
+                        if x and x != '.')
+
+    def is_output(self, path):
+        # True if path is the archive (to avoid adding it to itself)
+        return os.path.abspath(path) == os.path.abspath(self.path)
+
+    def copy_file(self, src, rel, rewritten=False):
+        if not self.is_output(src):
+            self.sources[self._rel(rel)] = src
+
+    def copy_dir(self, src, rel):
+        rel = self._rel(rel)
+        for root, dnames, fnames in os.walk(src):
+            drel = self._rel(rel, os.path.relpath(root, src))
+            for fname in fnames:
+                self.copy_file(os.path.join(root, fname), drel + '/' + fname)
+
+    def sync(self):
+        return 0  # nothing is copied before finish
+
+    def add(self, rel):
+        pass  # all members are known
+
+    def outputs(self):
+        return sorted(self.sources)
+
+    def isfile(self, rel):
+        return self._rel(rel) in self.sources
+
+    def read(self, rel):
+        return _read_source(self.sources[self._rel(rel)])
+
+    def write(self, rel, content):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+
+        self.sources[self._rel(rel)] = content
+
+    def write_iter(self, rel, fragments):
+        # fragments: callable returning an iterable of fragments
+        self.sources[self._rel(rel)] = fragments
+
+    def write_hashed(self, name, ext, fragments):
+        # Adds the content generated by fragments (callable) as
+        # name.<hash>ext. The content is generated twice (hash and archive)
+        # to avoid holding it. Returns the name
+        h = hashlib.sha256()
+        for fragment in _iter_source(fragments):
+            h.update(fragment)
+
+        rel = hashed_name(name, ext, h)
+        self.write_iter(rel, fragments)
+        return rel
+
+    def rename(self, rel, newrel):
+        self.sources[self._rel(newrel)] = self.sources.pop(self._rel(rel))
+
+    def _variants(self, rel, generated=False):
+        # returns the list of (ext, content) precompressed variants of rel.
+        # Generated content is left (None) for the writing thread: producing
+        # it concurrently with other content is not safe
+        if not self.precompress or not compress.is_compressible(rel):
+            return []
+
+        source = self.sources[rel]
+        if callable(source) and not generated:
+            return None
+
+        data = _read_source(source)
+        if len(data) < compress.MIN_SIZE:
+            return []
+
+        out = []
+        for ext, compressor in compress.COMPRESSORS:
+            cdata = compressor(data)
+            if len(cdata) <= len(data) * compress.MAX_RATIO:
+                out.append((ext, cdata))
+
+        return out
+
+    def finish(self):
+        # writes the archive to a temporary file which replaces the output
+        # only if everything went well
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmppath = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with open(fd, 'wb') as f:
+                self._write(f)
+
+            os.chmod(tmppath, FILE_MODE)
+            os.replace(tmppath, self.path)
+        except BaseException:
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+            raise
+
+    def _iter_variants(self, ex, rels):
+        # generates the variants of rels in order. They are compressed in the
+        # background, a window of members ahead of the writing, which bounds
+        # the compressed data held in memory
+        window = 2 * (self.workers or os.cpu_count() or 1)
+        pending = collections.deque()
+        for rel in rels:
+            pending.append(ex.submit(self._variants, rel))
+            if len(pending) > window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def _write(self, fileobj):
+        rels = sorted(self.sources)
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as ex:
+            variants = self._iter_variants(ex, rels)
+
+            if self.path.lower().endswith(ZIP_EXT):
+                writer = _ZipMembers(fileobj)
+            else:
+                writer = _TarMembers(fileobj, self.path)
+
+            with writer:
+                for rel, rvariants in zip(rels, variants):
+                    if rvariants is None:
+                        rvariants = self._variants(rel, generated=True)
+
+                    members = [(rel, self.sources[rel])]
+                    members += [(rel + ext, x) for ext, x in rvariants
+                                if rel + ext not in self.sources]
+                    for mrel, source in sorted(members):
+                        size = writer.add(mrel, source)
+                        logging.debug('Archived %s: %d bytes', mrel, size)
+                        self.stats['members'] += 1
+                        self.stats['size'] += size
+
+
+class _ZipMembers:
+    # Compressible members are deflated, the rest (and precompressed
+    # variants) stored
+    def __init__(self, fileobj):
+        self.zf = zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.zf.close()
+
+    def add(self, rel, source):
+        zinfo = zipfile.ZipInfo(rel, date_time=(1980, 1, 1, 0, 0, 0))
+        zinfo.external_attr = (0o100000 | ARCHIVE_MODE) << 16
+        zinfo.create_system = 3  # unix, for the attributes
+        if compress.is_compressible(rel):
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo._compresslevel = 9  # no public way for a ZipInfo
+
+        size = 0
+        with self.zf.open(zinfo, 'w') as f:
+            for buf in _iter_source(source):
+                f.write(buf)
+                size += len(buf)
+
+        return size
+
+
+class _TarMembers:
+    # tar needs the size ahead of the content. Generated content is spooled
+    def __init__(self, fileobj, path):
+        self.gz = None
+        if not path.lower().endswith('.tar'):
+            # no name and no timestamp in the gzip header
+            self.gz = fileobj = gzip.GzipFile(filename='', mode='wb',
+                                              fileobj=fileobj, mtime=0)
+
+        self.tf = tarfile.open(fileobj=fileobj, mode='w|',
+                               format=tarfile.PAX_FORMAT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.tf.close()
+        if self.gz is not None:
+            self.gz.close()
+
+    def add(self, rel, source):
+        tinfo = tarfile.TarInfo(rel)
+        tinfo.mtime = ARCHIVE_MTIME
+        tinfo.mode = ARCHIVE_MODE
+
+        if isinstance(source, bytes):
+            tinfo.size = len(source)
+            self.tf.addfile(tinfo, io.BytesIO(source))
+        elif isinstance(source, str):
+            with open(source, 'rb') as f:
+                tinfo.size = os.fstat(f.fileno()).st_size
+                self.tf.addfile(tinfo, f)
+        else:
+            with tempfile.SpooledTemporaryFile(_BUFSIZE * 8) as f:
+                for buf in _iter_source(source):
+                    f.write(buf)
+
+                tinfo.size = f.tell()
+                f.seek(0)
+                self.tf.addfile(tinfo, f)
+
+        return tinfo.size
+
+
+# method: STORED or DEFLATED. crc: only for zip members (None for tar)
+ArchiveMember = collections.namedtuple(
+    'ArchiveMember', 'name offset size csize method crc')
+
+STORED = zipfile.ZIP_STORED
+DEFLATED = zipfile.ZIP_DEFLATED
+
+# gzip header with no name, no timestamp, max compression and unknown os
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff'
+
+
+class ArchiveReader:
+    # Read only access to the members of a zip or tar archive. The archive is
+    # mapped in memory and an index name -> ArchiveMember is built once from
+    # the zip central directory/tar headers. Members are then read as slices
+    # of the map, which is safe across threads. Compressed tars are
+    # decompressed first to a temporary file (tar has no index)
+
+    def __init__(self, path):
+        self.path = path
+        self.members = {}
+        self.mtime = os.stat(path).st_mtime
+        self._lock = threading.Lock()  # for reads through the file
+
+        self._f = open(path, 'rb')
+        try:
+            if path.lower().endswith(ZIP_EXT):
+                self._map()
+                self._index_zip()
+            else:
+                if not path.lower().endswith('.tar'):
+                    tmpf = tempfile.TemporaryFile()
+                    with gzip.GzipFile(fileobj=self._f, mode='rb') as gz:
+                        shutil.copyfileobj(gz, tmpf, _BUFSIZE)
+
+                    self._f.close()
+                    self._f = tmpf
+
+                self._map()
+                self._index_tar()
+        except BaseException:
+            self.close()
+            raise
+
+    def _map(self):
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+
+    def _index_zip(self):
+        with zipfile.ZipFile(self._f) as zf:
+            for zinfo in zf.infolist():
+                if zinfo.filename.endswith('/'):
+                    continue  # directory
+
+                off = zinfo.header_offset
+                if self._mm[off:off + 4] != b'PK\x03\x04':
+                    raise zipfile.BadZipFile(
+                        'Bad local header: {}'.format(zinfo.filename))
+
+                # name/extra in the local header may differ from central dir
+                nlen, elen = struct.unpack('<HH', self._mm[off + 26:off + 30])
+                self._add(ArchiveMember(
+                    zinfo.filename, off + 30 + nlen + elen, zinfo.file_size,
+                    zinfo.compress_size, zinfo.compress_type, zinfo.CRC))
+
+    def _index_tar(self):
+        self._f.seek(0)
+        with tarfile.open(fileobj=self._f, mode='r:') as tf:
+            for tinfo in tf:
+                if tinfo.isfile():
+                    self._add(ArchiveMember(
+                        tinfo.name, tinfo.offset_data, tinfo.size, tinfo.size,
+                        STORED, None))
+
+    def _add(self, member):
+        name = member.name
+        while name.startswith('./'):
+            name = name[2:]
+
+        self.members[name] = member
+
+    def close(self):
+        view, self._view = getattr(self, '_view', None), None
+        if view is not None:
+            view.release()
+
+        mm, self._mm = getattr(self, '_mm', None), None
+        if mm is not None:
+            mm.close()
+
+        self._f.close()
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def get(self, name):
+        return self.members.get(name)
+
+    def raw(self, member):
+        # the data as stored in the archive (no copy)
+        return self._view[member.offset:member.offset + member.csize]
+
+    def read(self, member):
+        # the (uncompressed) data of the member
+        if member.method == STORED:
+            return self.raw(member)
+
+        if member.method == DEFLATED:
+            return zlib.decompress(self.raw(member), -zlib.MAX_WBITS)
+
+        with self._lock, zipfile.ZipFile(self._f) as zf:  # other methods
+            return zf.read(member.name)
+
+    def gzipped(self, member):
+        # A deflated zip member as gzip content (the deflate stream with a
+        # gzip header and trailer) without compressing anything. Returns
+        # None if not possible
+        if member.method != DEFLATED or member.crc is None:
+            return None
+
+        trailer = struct.pack('<II', member.crc, member.size & 0xffffffff)
+        return [_GZIP_HEADER, self.raw(member), trailer]
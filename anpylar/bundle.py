@@ -6,13 +6,19 @@
 # can be found in the LICENSE file at http://anpylar.com/mit-license
 ###############################################################################
 import argparse
+import functools
 import logging
 import os.path
 import sys
 
+from .cache import BuildCache
+from .fingerprint import BuildFingerprint, record_path
 from .logconfig import logconfig
-from .packaging import Bundler, ANPYLAR_JS
+from .packaging import Bundler, make_executor, ANPYLAR_JS, COLD_JS_EXT
+from .result import BuildResult
 from .utils import print_error, makefile_error, readfile_error
+from .utils import jobs_error
+from .watcher import watch_build
 
 
 def run(pargs=None, name=None):
@@ -20,7 +26,60 @@ def run(pargs=None, name=None):
 
     logconfig(args.quiet, args.verbose)  # configure logging
 
+    if not args.watch:
+        build(args, parser)
+        return
+
+    # The same cache across builds keeps the entries in memory and the
+    # pakets of the last build let only the changed files be processed
+    cache = None if args.no_cache else BuildCache(args.cache_dir or None)
+    pakets = {}
+
+    output = os.path.abspath(args.output)
+    outputs = {output, record_path(output),
+               os.path.splitext(output)[0] + COLD_JS_EXT}
+
+    watch_build(functools.partial(build, args, parser, cache=cache,
+                                  pakets=pakets),
+                input_paths(args), interval=args.watch_interval,
+                ignore=lambda x: os.path.abspath(x) in outputs)
+
+
+def input_paths(args):
+    inputs = [args.brython, args.brython_stdlib, args.anpylar_js,
+              args.anpylar_vfs, args.anpylar_auto]
+    inputs += args.json + args.vfs_js + args.auto_vfs + args.pkg_dir
+    inputs += args.trace
+    return [os.path.normpath(x) for x in inputs if x]
+
+
+def build(args, parser, cache=None, result=None, pakets=None):
+    # Returns a BuildResult (the one given, if any). pakets: dict of the
+    # paketized directories kept between builds (see Bundler.set_reuse)
+    if result is None:
+        result = BuildResult('bundle')
+
+    jobs_error(args.jobs, parser)
+    result.phase('prepare')
+    fprint = None
+    if args.output != '-':
+        fprint = BuildFingerprint(record_path(os.path.normpath(args.output)))
+        fprint.add_options(args)
+        for path in input_paths(args):
+            fprint.add_path(path)
+
+        if not args.force and fprint.is_current():
+            logging.info('No changes since the last bundle: %s', args.output)
+            result.finish(fprint.recorded, skipped=True)
+            return result
+
     bundler = Bundler()
+    if not args.no_cache:
+        bundler.set_cache(cache or BuildCache(args.cache_dir or None))
+
+    bundler.set_executor(make_executor(args.jobs))
+    if pakets is not None:
+        bundler.set_reuse(pakets)
 
     if args.debug:
         logging.info('Activating line info in brython')
@@ -76,19 +135,41 @@ def run(pargs=None, name=None):
     logging.info('Preparing bundle')
     bundler.prepare_bundle()
 
-    if args.optimize:
+    trace = None
+    if args.trace:
+        logging.info('Reading import traces: %s', ', '.join(args.trace))
+        trace = bundler.read_traces(args.trace)
+
+    if args.optimize or trace is not None:
+        result.phase('stdlib')
         logging.info('Optimizing stdlib for the bundle')
-        bundler.optimize_stdlib()
+        bundler.optimize_stdlib(trace=trace, split=args.trace_split)
 
     if args.skip_packages:
         logging.info('Skipping addition of packages to the bundle')
 
+    result.phase('bundle')
     logging.info('Writing bundle out to: %s', args.output)
     bundler.write_bundle(
         os.path.normpath(args.output),
         skip_packages=args.skip_packages,
     )
+    bundler.close()
+
+    outputs = [os.path.normpath(args.output)]
+    if trace is not None and args.trace_split:
+        coldpath = os.path.splitext(os.path.normpath(args.output))[0]
+        coldpath += COLD_JS_EXT
+        logging.info('Writing cold stdlib modules out to: %s', coldpath)
+        bundler.write_cold_stdlib(coldpath)
+        outputs.append(coldpath)
+
+    if fprint is not None:
+        fprint.record(outputs)
+
+    result.finish([x for x in outputs if x != '-'])  # not stdout
     logging.info('Done')
+    return result
 
 
 def parse_args(pargs=None, name=None):
@@ -109,7 +190,8 @@ def parse_args(pargs=None, name=None):
                         help='Use specific brython.js for the bundle')
 
     pgroup.add_argument('--brython_stdlib', action='store', default=None,
-                        help='Use specific brython_stdlib.js for the bundle')
+                        help=('Use specific brython_stdlib.js for the bundle '
+                              'or a container created with "anpylar stdlib"'))
 
     pgroup = parser.add_argument_group(title='AnPylar options')
     pgroup.add_argument('--anpylar-js', action='store', default=None,
@@ -145,10 +227,50 @@ def parse_args(pargs=None, name=None):
                         help=('Optimize the size of the anpylar.js '
                               'by packaging only the needed stdlib modules'))
 
+    pgroup.add_argument('--trace', action='append', default=[],
+                        help=('Import trace recorded with serve. Only the '
+                              'stdlib modules seen imported are packaged. '
+                              'Can be specified multiple times'))
+
+    pgroup.add_argument('--trace-split', action='store_true',
+                        help=('With --trace, the modules found by the import '
+                              'analysis which were not seen imported are '
+                              'written to a separate .cold.js file, which '
+                              'the page has to load after the bundle'))
+
     pgroup.add_argument('--skip-packages', action='store_true',
                         help=('Optimize the size of the anpylar.js '
                               'without writing the packages to the bundle'))
 
+    pgroup.add_argument('--force', action='store_true',
+                        help=('Bundle even if no input/option changed since '
+                              'the last run'))
+
+    pgroup.add_argument('--watch', action='store_true',
+                        help=('Bundle again whenever the given files or '
+                              'package directories change. Only the changed '
+                              'files of the package directories are read '
+                              'and paketized again, the rest of the bundle '
+                              'is done anew'))
+
+    pgroup.add_argument('--watch-interval', action='store', default=1.0,
+                        type=float,
+                        help='Seconds between checks for changes')
+
+    pgroup = parser.add_argument_group(title='Parallel processing')
+    pgroup.add_argument('--jobs', '-j', action='store', default=1, type=int,
+                        help=('Number of processes for paketizing files. '
+                              '0 uses as many as cpus are available'))
+
+    pgroup = parser.add_argument_group(title='Cache options')
+    pgroup.add_argument('--no-cache', action='store_true',
+                        help=('Do not use the cache of minified files and '
+                              'scanned imports'))
+
+    pgroup.add_argument('--cache-dir', action='store', default='',
+                        help=('Directory for the cache. Default: '
+                              '$XDG_CACHE_HOME/anpylar or ~/.cache/anpylar'))
+
     pgroup = parser.add_mutually_exclusive_group()
     pgroup.add_argument('--quiet', '-q', action='store_true',
                         help='Remove output (errors will be reported)')
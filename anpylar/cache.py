@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import collections
+import hashlib
+import json
+import logging
+import os
+import os.path
+import tempfile
+import threading
+
+from .__version__ import __version__
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME', '')
+    if not base:
+        if os.name == 'nt':
+            base = os.environ.get('LOCALAPPDATA', '')
+
+        if not base:
+            base = os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'anpylar')
+
+
+class BuildCache:
+    # Content addressed on-disk cache. The key is a hash of the content and
+    # of the options which produced the result (and the version of the tool)
+    # Entries are json files, sharded in subdirs with the 2 first hex chars.
+    # When the size goes over max_size, the least recently used entries are
+    # removed. The recently used entries are also kept in memory for long
+    # running processes. Only the path and sizes are pickled, to share the
+    # cache with worker processes
+
+    MAX_SIZE = 64 * 1024 * 1024
+
+    MEM_ENTRIES = 4096  # entries also kept in memory (per process)
+
+    def __init__(self, path=None, max_size=MAX_SIZE):
+        self.path = path or default_cache_dir()
+        self.max_size = max_size
+        self._written = 0
+        self._mem = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_mem'], state['_lock']  # not for the workers
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._mem = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._mem[key] = value
+            self._mem.move_to_end(key)
+            if len(self._mem) > self.MEM_ENTRIES:
+                self._mem.popitem(last=False)
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha256(__version__.encode('utf-8'))
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = str(part).encode('utf-8')
+
+            h.update(b'\0')  # separate the parts
+            h.update(part)
+
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, key):
+        # entries of this process are found in memory first. Values are
+        # shared: they must not be modified
+        with self._lock:
+            value = self._mem.get(key, None)
+            if value is not None:
+                self._mem.move_to_end(key)
+                return value
+
+        epath = self._entry_path(key)
+        try:
+            with open(epath, encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None  # missing or damaged (a damaged one will be replaced)
+
+        try:
+            os.utime(epath)  # mark as recently used for the eviction
+        except OSError:
+            pass
+
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        epath = self._entry_path(key)
+        content = json.dumps(value)
+        tmppath = None
+        try:
+            os.makedirs(os.path.dirname(epath), exist_ok=True)
+            # write + rename to never leave a partial entry behind
+            fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(epath))
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+
+            os.replace(tmppath, epath)
+        except BaseException as e:
+            if tmppath is not None:
+                try:
+                    os.remove(tmppath)
+                except OSError:
+                    pass
+
+            if not isinstance(e, OSError):
+                raise
+
+            logging.debug('Cannot store cache entry %s: %s', epath, str(e))
+            return
+
+        self._written += len(content)
+        if self._written > self.max_size // 16:  # check size now and then
+            self._written = 0
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, dnames, fnames in os.walk(self.path):
+            for fname in fnames:
+                fpath = os.path.join(root, fname)
+                try:
+                    st = os.stat(fpath)
+                except OSError:
+                    continue  # removed by someone else
+
+                entries.append((st.st_mtime, st.st_size, fpath))
+                total += st.st_size
+
+        if total <= self.max_size:
+            return
+
+        target = self.max_size * 3 // 4  # leave room before the next one
+        logging.debug('Cache size %d over %d. Evicting', total, self.max_size)
+        for mtime, size, fpath in sorted(entries):
+            try:
+                os.remove(fpath)
+            except OSError:
+                continue
+
+            total -= size
+            if total <= target:
+                break
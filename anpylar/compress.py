@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import concurrent.futures
+import gzip
+import io
+import logging
+import os
+import os.path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZ_EXT = '.gz'
+BR_EXT = '.br'
+
+# Extensions of files worth compressing (images, fonts ... already are)
+COMPRESSIBLE = (
+    '.js', '.css', '.html', '.htm', '.json', '.svg', '.txt', '.xml', '.map',
+    '.py', '.md', '.csv', '.ico', '.ttf', '.otf', '.eot', '.wasm',
+)
+
+MIN_SIZE = 256  # smaller files fit in a packet anyway
+MAX_RATIO = 0.9  # keep compressed files only if they save more than 10%
+
+
+def gzip_compress(data):
+    # deterministic output: no timestamp, no name
+    out = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+
+    return out.getvalue()
+
+
+def brotli_compress(data):
+    return brotli.compress(data, quality=11)
+
+
+# (extension, function) of the available compressions
+COMPRESSORS = [(GZ_EXT, gzip_compress)]
+if brotli is not None:
+    COMPRESSORS.append((BR_EXT, brotli_compress))
+
+
+def is_compressible(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE
+
+
+def compress_file(path, max_ratio=MAX_RATIO):
+    # Writes the compressed variants of path next to it if they pay off.
+    # Variants newer than path are kept (not compressed again)
+    # Returns the raw size and a dict ext -> size (0 if not written)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    mtime = os.stat(path).st_mtime_ns
+    sizes = {}
+    for ext, compressor in COMPRESSORS:
+        try:
+            st = os.stat(path + ext)
+        except OSError:
+            pass
+        else:
+            if st.st_mtime_ns >= mtime:
+                sizes[ext] = st.st_size
+                continue
+
+        cdata = compressor(data)
+        if len(cdata) > len(data) * max_ratio:
+            sizes[ext] = 0
+            try:
+                os.remove(path + ext)  # outdated variant
+            except OSError:
+                pass
+
+            continue
+
+        with open(path + ext, 'wb') as f:
+            f.write(cdata)
+
+        sizes[ext] = len(cdata)
+
+    return len(data), sizes
+
+
+def iter_compressible(paths, min_size=MIN_SIZE):
+    for path in paths:
+        if is_compressible(path) and os.path.getsize(path) >= min_size:
+            yield path
+
+
+def precompress(paths, workers=None, max_ratio=MAX_RATIO):
+    # Compresses the files in threads (zlib and brotli release the GIL).
+    # Returns a list of (path, raw size, {ext: size}) in the order of paths
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = [(path, ex.submit(compress_file, path, max_ratio))
+                for path in paths]
+
+        results = []
+        for path, fut in futs:
+            try:
+                size, sizes = fut.result()
+            except OSError as e:
+                logging.error('Cannot compress %s: %s', path, str(e))
+                continue
+
+            results.append((path, size, sizes))
+
+    return results
+
+
+def log_summary(results):
+    # Logs raw vs compressed sizes per file and in total
+    total = 0
+    totals = dict.fromkeys((x[0] for x in COMPRESSORS), 0)
+    for path, size, sizes in results:
+        total += size
+        out = []
+        for ext, csize in sizes.items():
+            totals[ext] += csize or size  # uncompressed if not worth it
+            out.append('{} {}'.format(ext, csize or '-'))
+
+        logging.debug('%s: %d -> %s', path, size, ', '.join(out))
+
+    logging.info('Precompressed %d files: %d bytes', len(results), total)
+    for ext, csize in totals.items():
+        logging.info('  %s: %d bytes (%.1f%%)', ext, csize,
+                     100.0 * csize / (total or 1))
+
+    if brotli is None:
+        logging.info('  .br: skipped, brotli module not available')
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import argparse
+import importlib
+import io
+import json
+import logging
+import os
+import os.path
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import traceback
+
+from .__version__ import __version__
+from .cache import BuildCache, default_cache_dir
+from .logconfig import logconfig
+from .utils import print_error, readfile_error
+
+# Commands run by the daemon when the cli finds it. The client only needs
+# this module: the commands (and packaging) are imported by the daemon
+COMMANDS = ('bundle', 'paketize', 'webpack')
+
+# socket of the daemon. "off" builds in-process even if a daemon runs
+SOCKET_ENV = 'ANPYLAR_DAEMON'
+SOCKET_OFF = 'off'
+
+# Replies are frames: tag (1 byte), payload length (4 bytes), payload
+_FRAME = struct.Struct('!cI')
+_STDOUT = b'1'
+_STDERR = b'2'
+_EXIT = b'x'  # payload: exit code
+_STALE = b'v'  # payload: version of the daemon, which did not build
+
+
+def socket_path():
+    path = os.environ.get(SOCKET_ENV, '')
+    if not path:
+        path = os.path.join(default_cache_dir(), 'daemon.sock')
+
+    return path
+
+
+def is_supported():
+    return hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork')
+
+
+def _send(sock, tag, payload=b''):
+    sock.sendall(_FRAME.pack(tag, len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    buf = b''
+    while len(buf) < size:
+        data = sock.recv(size - len(buf))
+        if not data:
+            raise EOFError('daemon connection closed')
+
+        buf += data
+
+    return buf
+
+
+def _recv(sock):
+    tag, size = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    return tag, _recv_exact(sock, size)
+
+
+class _FrameWriter(io.RawIOBase):
+    # stdout/stderr of a build, sent to the client as frames
+    def __init__(self, sock, tag):
+        self._sock = sock
+        self._tag = tag
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        _send(self._sock, self._tag, bytes(b))
+        return len(b)
+
+
+def _text_stream(sock, tag):
+    return io.TextIOWrapper(io.BufferedWriter(_FrameWriter(sock, tag)),
+                            encoding='utf-8', line_buffering=True)
+
+
+class BuildHandler(socketserver.StreamRequestHandler):
+    # Runs in a process forked from the daemon for each request, which
+    # inherits what the daemon keeps in memory. The process takes the
+    # environment and working directory of the client and sends the output
+    # back, what makes builds from different places run side by side
+
+    def handle(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)  # not the daemon's
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            return  # not a client of ours
+
+        if request.get('version') != __version__:
+            _send(self.request, _STALE, __version__.encode('utf-8'))
+            return
+
+        argv = request.get('argv', [])
+        if not argv:  # ping
+            pong = dict(pid=os.getppid(), version=__version__)
+            _send(self.request, _STDOUT, json.dumps(pong).encode('utf-8'))
+            return
+
+        _send(self.request, _EXIT, str(self.build(request)).encode('ascii'))
+
+    def build(self, request):
+        os.environ.clear()
+        os.environ.update(request.get('env', {}))
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = _text_stream(self.request, _STDOUT)
+        sys.stderr = _text_stream(self.request, _STDERR)
+        # let logconfig configure logging for the build
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+
+        command, *pargs = request['argv']
+        try:
+            os.chdir(request['cwd'])
+            if command not in COMMANDS:
+                raise ValueError('Not a daemon command: {}'.format(command))
+
+            mod = importlib.import_module('.' + command, __package__)
+            mod.run(pargs, name='anpylar-' + command)
+            code = 0
+        except SystemExit as e:
+            code = e.code
+            if code is not None and not isinstance(code, int):
+                print(code, file=sys.stderr)
+                code = 1
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            for f in (sys.stdout, sys.stderr):
+                try:
+                    f.flush()
+                except OSError:
+                    pass  # the client went away
+
+            sys.stdout, sys.stderr = stdout, stderr
+
+        return code or 0
+
+
+if hasattr(socketserver, 'ForkingMixIn'):
+    class DaemonServer(socketserver.ForkingMixIn,
+                       socketserver.UnixStreamServer):
+        max_children = 64  # concurrent builds
+
+        def handle_error(self, request, client_address):
+            if isinstance(sys.exc_info()[1], OSError):  # client went away
+                logging.debug('Build client gone: %s', sys.exc_info()[1])
+                return
+
+            super().handle_error(request, client_address)
+else:  # no fork (windows)
+    DaemonServer = None
+
+
+def request(argv, path=None):
+    # Runs the command in argv (["webpack", ...]) in the daemon listening at
+    # path, relaying its output. Returns the exit code or None if there is no
+    # (usable) daemon, for the command to be run in-process
+    path = path or socket_path()
+    if path == SOCKET_OFF or not is_supported():
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:  # not running (or a stale socket file)
+        sock.close()
+        return None
+
+    req = dict(argv=argv, cwd=os.getcwd(), env=dict(os.environ),
+               version=__version__)
+    with sock:
+        try:
+            sock.sendall(json.dumps(req).encode('utf-8') + b'\n')
+            while True:
+                tag, payload = _recv(sock)
+                if tag == _EXIT:
+                    return int(payload)
+                elif tag == _STALE:
+                    print('anpylar daemon at {} runs version {}. Building '
+                          'in-process'.format(path, payload.decode('utf-8')),
+                          file=sys.stderr)
+                    return None
+
+                out = sys.stdout if tag == _STDOUT else sys.stderr
+                out.buffer.write(payload)
+                out.flush()
+
+        except (OSError, EOFError) as e:
+            print('Lost the connection to the anpylar daemon: {}'.format(e),
+                  file=sys.stderr)
+            return 1
+
+
+def ping(path):
+    # (pid, version) of the daemon at path or None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(path)
+            req = dict(argv=[], version=__version__)
+            sock.sendall(json.dumps(req).encode('utf-8') + b'\n')
+            tag, payload = _recv(sock)
+        except (OSError, EOFError):
+            return None
+
+    if tag == _STALE:
+        return None, payload.decode('utf-8')
+
+    pong = json.loads(payload.decode('utf-8'))
+    return pong['pid'], pong['version']
+
+
+def warm(cache_dir=None):
+    # Imports the commands and parses what every build needs: the shipped
+    # anpylar packages (imports found in them) and the stdlib (its decoded
+    # modules and its import graph)
+    for command in COMMANDS:
+        importlib.import_module('.' + command, __package__)
+
+    from .packaging import Bundler, Paketizer_Json, StdlibGraph
+    from .packaging import ImportFinder, EagerImportFinder, reachable_modules
+    from .packaging import release_sources
+
+    cache = BuildCache(cache_dir)
+    for path in (Bundler.PATH_ANPYLAR_AUTO_VFS_JS,
+                 Bundler.PATH_ANPYLAR_D_AUTO_VFS_JS):
+        logging.info('Parsing: %s', path)
+        modules = Paketizer_Json(readfile_error(path), braces=2).modules
+        for finder in (ImportFinder, EagerImportFinder):
+            reachable_modules([modules], list(modules), finder=finder)
+
+    path = Bundler.PATHS[Bundler.BRSTD_JS]
+    logging.info('Decoding and loading the import graph of: %s', path)
+    content = readfile_error(path)
+    chash = StdlibGraph.content_hash(content)
+    modules = StdlibGraph.modules(content, chash)
+    StdlibGraph.get(chash=chash, modules=modules, cache=cache)
+    release_sources()  # the imports are kept, the trees are not needed
+
+
+def run(pargs=None, name=None):
+    args, parser = parse_args(pargs=pargs, name=name)
+
+    logconfig(args.quiet, args.verbose)  # configure logging
+
+    if not is_supported() or DaemonServer is None:
+        print_error('The daemon needs unix sockets and fork', parser)
+
+    path = args.socket or socket_path()
+    running = ping(path)
+    if args.status or args.stop:
+        if running is None:
+            print_error('No daemon running at: {}'.format(path))
+
+        pid, version = running
+        if args.status:
+            print('anpylar daemon {} (pid {}) at: {}'.format(version, pid,
+                                                            path))
+            return
+
+        if pid is None:
+            print_error('The daemon at {} runs version {} and cannot be '
+                        'stopped from this version'.format(path, version))
+
+        os.kill(pid, signal.SIGTERM)
+        logging.info('Stopped daemon (pid %d)', pid)
+        return
+
+    if running is not None:
+        print_error('A daemon is already running at: {}'.format(path))
+
+    try:
+        os.remove(path)  # stale socket file
+    except OSError:
+        pass
+
+    if not args.no_warm:
+        warm(args.cache_dir)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    server = DaemonServer(path, BuildHandler)
+
+    def terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    logging.info('anpylar daemon (pid %d) listening at: %s', os.getpid(),
+                 path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    logging.info('Done')
+
+
+def parse_args(pargs=None, name=None):
+    if not name:
+        name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+
+    parser = argparse.ArgumentParser(
+        prog=name,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Keep a build server running. bundle, paketize and '
+                     'webpack hand their work to it, skipping the start up '
+                     'and the parsing of anpylar and the stdlib. Builds run '
+                     'concurrently, each in a process forked from the '
+                     'daemon. Without daemon the commands run in-process. '
+                     'Set {}={} to build in-process anyway'
+                     .format(SOCKET_ENV, SOCKET_OFF))
+    )
+
+    parser.add_argument('--socket', action='store', default='',
+                        help=('Unix socket to listen at. Default: {} or '
+                              'daemon.sock in the cache directory'
+                              .format(SOCKET_ENV)))
+
+    parser.add_argument('--cache-dir', action='store', default=None,
+                        help=('Cache for the stdlib import graph. Default: '
+                              '{}'.format(default_cache_dir())))
+
+    parser.add_argument('--no-warm', action='store_true',
+                        help=('Do not parse anpylar and the stdlib at start '
+                              'up'))
+
+    pgroup = parser.add_mutually_exclusive_group()
+    pgroup.add_argument('--stop', action='store_true',
+                        help='Stop the running daemon')
+    pgroup.add_argument('--status', action='store_true',
+                        help='Report whether a daemon is running')
+
+    pgroup = parser.add_mutually_exclusive_group()
+    pgroup.add_argument('--quiet', '-q', action='store_true',
+                        help='Remove output (errors will be reported)')
+    pgroup.add_argument('--verbose', '-v', action='store_true',
+                        help='Increase verbosity level')
+
+    args = parser.parse_args(pargs)
+    return args, parser
+
+
+if __name__ == '__main__':
+    run()
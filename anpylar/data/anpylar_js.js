@@ -18,7 +18,11 @@
             if(ext != '.vfs.js')
                 throw _b_.ImportError('VFS file URL must end with .vfs.js extension')
 
-            s = {__class__: sfs_hook.$dict, path: path}
+            // a chunk loaded on demand adds its modules to the finder in place
+            var s = $B.path_importer_cache[path + '/']
+            if(s === undefined || s.__class__ !== sfs_hook.$dict)
+                s = {__class__: sfs_hook.$dict, path: path}
+
             sfs_hook.$dict.load_vfs(s, vfs)
             return s
         }
@@ -31,11 +35,33 @@
             __name__: 'VFSAutoPathFinder',
 
             load_vfs: function(s, vfs) {
-                s.vfs = vfs
+                if(s.vfs === undefined)
+                    s.vfs = vfs
+                else
+                    for(var k in vfs)
+                        s.vfs[k] = vfs[k]
+
                 $B.path_importer_cache[s.path + '/'] = s
             },
+            load_chunk: function(s, chunk, fullname) {
+                // imports are synchronous and so is fetching the chunk
+                var req = new XMLHttpRequest()
+                req.open('GET', $B.brython_path + chunk, false)
+                req.send()
+                if(req.status != 200)
+                    throw _b_.ImportError('Cannot load chunk ' + chunk +
+                                          ' for module ' + fullname)
+
+                var script = document.createElement('script')
+                script.text = req.responseText  // runs the chunk at once
+                document.getElementsByTagName('head')[0].appendChild(script)
+                return s.vfs[fullname]
+            },
             find_spec: function(s, fullname, module) {
                 var stored = s.vfs[fullname]
+                if(typeof stored == 'string')  // name of a chunk to load
+                    stored = sfs_hook.$dict.load_chunk(s, stored, fullname)
+
                 if (stored === undefined)
                     return _b_.None
 
@@ -75,6 +101,11 @@
         for(var i=0; i < autoload.length; i++)
             autoload[i]($B)
 
+    // from now on (chunks loaded on demand) run registrations immediately
+    window.__ANPYLAR__.autoload = {push: function(f) { f($B) }}
+
+    anpylar_mark('vfs')
+
     var $scripts = document.getElementsByTagName('script'),
         slen = $scripts.length
 
@@ -89,7 +120,107 @@
         script.innerHTML = 'import app; app.AppModule()'
         document.getElementsByTagName('head')[0].appendChild(script)
     }
+
+    // development services configured by the serving side (if any)
+    if(window.__ANPYLAR__.dev !== undefined)
+        anpylar_dev(window.__ANPYLAR__.dev)
+
+    anpylar_mark('bootstrap-start')
     $B.brython()
+    anpylar_mark('bootstrap')
+
+    if(window.__ANPYLAR__.dev !== undefined)
+        anpylar_dev_beacons(window.__ANPYLAR__.dev)
+};
+
+;function anpylar_mark(name) {
+    var dev = window.__ANPYLAR__.dev
+    if(dev !== undefined && dev.timings !== undefined &&
+       window.performance !== undefined && performance.mark !== undefined)
+        performance.mark('anpylar:' + name)
+};
+
+;function anpylar_beacon(url, data) {
+    data = JSON.stringify(data)
+    if(navigator.sendBeacon !== undefined)
+        navigator.sendBeacon(url, data)
+    else {
+        var xhr = new XMLHttpRequest()
+        xhr.open('POST', url, true)
+        xhr.send(data)
+    }
+};
+
+;function anpylar_dev_beacons(dev) {
+    // Startup timings: the bundle hash is set at the end of the bundle, which
+    // may not have been executed yet. Send the timings on the next tick
+    if(dev.timings !== undefined && window.performance !== undefined)
+        window.setTimeout(function() {
+            function span(start, end) {
+                var s = performance.getEntriesByName('anpylar:' + start),
+                    e = performance.getEntriesByName('anpylar:' + end)
+
+                if(!s.length || !e.length)
+                    return null
+
+                return e[0].startTime - s[0].startTime
+            }
+
+            anpylar_beacon(dev.timings, {
+                hash: dev.hash,
+                parse: span('start', 'br_js'),
+                vfs: span('br_js', 'vfs'),
+                bootstrap: span('bootstrap-start', 'bootstrap'),
+            })
+        }, 0)
+
+    // Import trace: modules seen imported after startup and when leaving
+    if(dev.imports !== undefined) {
+        var send_imports = function() {
+            anpylar_beacon(dev.imports, {
+                modules: Object.keys(__BRYTHON__.imported)
+            })
+        }
+        window.setTimeout(send_imports, 0)
+        window.addEventListener('pagehide', send_imports)
+    }
+};
+
+;function anpylar_dev(dev) {
+    // Live-reload: the server pushes the list of changed files. If all are
+    // stylesheets linked by the document, they are swapped in place, else
+    // the page is reloaded. Changed html is reloaded too: the templates are
+    // in the vfs of the bundle and rendered by the python components, which
+    // cannot render again in place with their state
+    if(dev.events !== undefined && window.EventSource !== undefined) {
+        var source = new EventSource(dev.events)
+
+        source.addEventListener('change', function(evt) {
+            var changed = JSON.parse(evt.data).changed,
+                links = document.querySelectorAll('link[rel="stylesheet"]'),
+                swaps = []
+
+            for(var i=0; i < changed.length; i++) {
+                var name = '/' + changed[i], found = false
+                if(name.slice(-4) == '.css')
+                    for(var j=0; j < links.length; j++) {
+                        var href = links[j].href.split('?')[0]
+                        if(href.slice(-name.length) == name) {
+                            swaps.push(links[j])
+                            found = true
+                        }
+                    }
+
+                if(!found) {
+                    source.close()
+                    window.location.reload()
+                    return
+                }
+            }
+            for(var i=0; i < swaps.length; i++)
+                swaps[i].href = swaps[i].href.split('?')[0] + '?t=' + Date.now()
+        })
+    }
 };
 
 // BRYTHON must already be in place
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+
+from .packaging import hashed_name
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+def manifest_path(output):
+    # hidden sync manifest next to output (never inside a distribution)
+    dirname, basename = os.path.split(os.path.normpath(output))
+    return os.path.join(dirname, '.{}.sync.json'.format(basename))
+
+COPY = 'copy'
+HARDLINK = 'hard'
+REFLINK = 'reflink'
+LINK_MODES = (COPY, HARDLINK, REFLINK)
+
+_FICLONE = 0x40049409  # linux ioctl to share the extents of a file
+
+_BUFSIZE = 1024 * 1024
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return [st.st_size, st.st_mtime_ns]
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for buf in iter(lambda: f.read(_BUFSIZE), b''):
+            h.update(buf)
+
+    return h.hexdigest()
+
+
+def _copy_hash(src, dst):
+    # copies src to dst hashing the content on the way
+    h = hashlib.sha256()
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        for buf in iter(lambda: fin.read(_BUFSIZE), b''):
+            h.update(buf)
+            fout.write(buf)
+
+    return h.hexdigest()
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError('reflinks are not supported on this platform')
+
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        fcntl.ioctl(fout.fileno(), _FICLONE, fin.fileno())
+
+
+class DistSync:
+    # Brings a distribution directory up to date with the files which are
+    # copied into it, instead of removing and copying it again entirely.
+    #
+    # The manifest (kept out of the directory, not to be deployed with it)
+    # records per output file the size/mtime of the source and of the copy
+    # and the hash of the content. A file is
+    # copied again only if the copy changed/disappeared or if the source
+    # changed and has a different hash (a touched file is not copied)
+    #
+    # Files which were neither copied nor registered as generated with "add"
+    # are removed at "finish". Files copied with a link mode are linked to
+    # the source (hard) or share its blocks (reflink, where supported) and
+    # are always replaced, never written in place
+
+    def __init__(self, distpath, link=COPY, workers=None, manifest=None):
+        self.distpath = distpath
+        self.manifest = manifest or manifest_path(distpath)
+        self.link = link
+        self.workers = workers
+        self.old = {}
+        self.entries = {}
+        self.copies = {}  # rel -> (src, rewritten)
+        self.dirs = set()
+        self.generated = set()
+        self.stats = dict(copied=0, linked=0, unchanged=0, removed=0)
+
+        try:
+            with open(self.manifest, encoding='utf-8') as f:
+                self.old = json.load(f)
+        except (OSError, ValueError):
+            pass  # first run or damaged: everything is copied
+
+    def _rel(self, *parts):
+        return '/'.join(x for part in parts for x in part.split(os.sep)
+                        if x and x != '.')
+
+    def is_output(self, path):
+        # True if path is the distribution (to avoid copying it into itself)
+        return os.path.exists(path) and os.path.samefile(path, self.distpath)
+
+    def _dst(self, rel):
+        return os.path.join(self.distpath, *rel.split('/'))
+
+    def copy_file(self, src, rel, rewritten=False):
+        # rel: name in the distribution with "/" separators. rewritten: the
+        # copy will be modified in place afterwards and cannot be a link
+        rel = self._rel(rel)
+        self.copies[rel] = (src, rewritten)
+        self.dirs.add(rel.rpartition('/')[0])
+
+    def copy_dir(self, src, rel):
+        rel = self._rel(rel)
+        self.dirs.add(rel)
+        for root, dnames, fnames in os.walk(src):
+            drel = self._rel(rel, os.path.relpath(root, src))
+            self.dirs.add(drel)
+            for fname in fnames:
+                self.copy_file(os.path.join(root, fname), drel + '/' + fname)
+
+    def add(self, rel):
+        # a file generated in the distribution (not a copy)
+        self.generated.add(self._rel(rel))
+
+    def isfile(self, rel):
+        return os.path.isfile(self._dst(rel))
+
+    def read(self, rel):
+        with open(self._dst(rel), 'rb') as f:
+            return f.read()
+
+    def write(self, rel, content):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+
+        with open(self._dst(rel), 'wb') as f:
+            f.write(content)
+
+        self.add(rel)
+
+    def write_hashed(self, name, ext, fragments):
+        # Writes the content generated by fragments (callable) as
+        # name.<hash>ext, hashing while writing. Returns the name
+        h = hashlib.sha256()
+        tmppath = self._dst('.{}{}.tmp'.format(name, ext))
+        with open(tmppath, 'wb') as f:
+            for fragment in fragments():
+                if not isinstance(fragment, bytes):
+                    fragment = fragment.encode('utf-8')
+
+                h.update(fragment)
+                f.write(fragment)
+
+        rel = hashed_name(name, ext, h)
+        os.replace(tmppath, self._dst(rel))
+        self.add(rel)
+        return rel
+
+    def rename(self, rel, newrel):
+        path, newpath = self._dst(rel), self._dst(newrel)
+        if os.path.exists(newpath) and os.path.samefile(path, newpath):
+            os.remove(path)  # renaming does nothing for hardlinks
+        else:
+            os.replace(path, newpath)
+
+        self.add(newrel)
+
+    def _sync_file(self, rel, src, rewritten):
+        dst = self._dst(rel)
+        sstat = _stat(src)
+        entry = self.old.get(rel)
+        if entry is not None and entry['dst'] == _stat(dst):
+            if entry['src'] == sstat:
+                return 'unchanged', entry
+
+            digest = hash_file(src)
+            if digest == entry['hash']:  # touched only
+                return 'unchanged', dict(entry, src=sstat)
+
+        link = COPY if rewritten else self.link
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(dst))
+        os.close(fd)
+        try:
+            digest = None
+            if link == HARDLINK:
+                try:
+                    os.remove(tmppath)
+                    os.link(src, tmppath)
+                except OSError as e:
+                    logging.debug('Cannot hardlink %s: %s', src, str(e))
+                    link = COPY
+            elif link == REFLINK:
+                try:
+                    _reflink(src, tmppath)
+                except OSError as e:
+                    logging.debug('Cannot reflink %s: %s', src, str(e))
+                    link = COPY
+
+            if link == COPY:
+                digest = _copy_hash(src, tmppath)
+            else:
+                digest = hash_file(tmppath)
+
+            if link != HARDLINK:  # mkstemp creates the file with mode 0600
+                shutil.copymode(src, tmppath)
+
+            os.replace(tmppath, dst)  # never write into a (linked) copy
+        except BaseException:
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+            raise
+
+        entry = dict(src=sstat, dst=_stat(dst), hash=digest)
+        return ('copied' if link == COPY else 'linked'), entry
+
+    def sync(self):
+        # copies the pending files in parallel. Returns the number of copies
+        for rel in sorted(self.dirs):
+            os.makedirs(self._dst(rel), exist_ok=True)
+
+        copies, self.copies = self.copies, {}
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as ex:
+            futs = [(rel, ex.submit(self._sync_file, rel, src, rewritten))
+                    for rel, (src, rewritten) in sorted(copies.items())]
+
+            done = 0
+            for rel, fut in futs:
+                what, entry = fut.result()
+                logging.debug('Sync %s: %s', what, rel)
+                self.stats[what] += 1
+                self.entries[rel] = entry
+                done += what != 'unchanged'
+
+        return done
+
+    def outputs(self):
+        # names of the files copied/generated which (still) exist
+        rels = set(self.generated)
+        rels.update(self.entries)
+        return sorted(x for x in rels if _stat(self._dst(x)) is not None)
+
+    def finish(self):
+        # removes the stale files/dirs and writes the manifest out
+        keep = set(self.outputs())
+        # copies renamed/removed after the sync are no longer tracked
+        for rel in list(self.entries):
+            if rel not in keep:
+                del self.entries[rel]
+
+        for root, dnames, fnames in os.walk(self.distpath, topdown=False):
+            drel = self._rel(os.path.relpath(root, self.distpath))
+            for fname in fnames:
+                rel = self._rel(drel, fname)
+                if rel in keep:
+                    continue
+
+                logging.debug('Removing stale file: %s', rel)
+                try:
+                    os.remove(os.path.join(root, fname))
+                except OSError as e:
+                    logging.error('Cannot remove %s: %s', rel, str(e))
+                    continue
+
+                self.stats['removed'] += 1
+
+            if drel and drel not in self.dirs and not os.listdir(root):
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+        with open(self.manifest, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import hashlib
+import json
+import logging
+import os
+import os.path
+
+from .__version__ import __version__
+
+
+# options which do not change the outputs
+NEUTRAL_OPTIONS = ('quiet', 'verbose', 'force', 'jobs', 'no_cache',
+                   'cache_dir', 'watch', 'watch_interval')
+
+
+def record_path(output):
+    # hidden record next to an output file
+    dirname, basename = os.path.split(output)
+    return os.path.join(dirname, '.{}.build.json'.format(basename))
+
+
+def _walk_stats(path, ignore=None):
+    # sorted (path, size, mtime_ns) of the files under path (or of path)
+    if os.path.isfile(path):
+        st = os.stat(path)
+        yield path, st.st_size, st.st_mtime_ns
+        return
+
+    for root, dnames, fnames in os.walk(path):
+        dnames.sort()
+        if ignore is not None:
+            dnames[:] = [x for x in dnames
+                         if not ignore(os.path.join(root, x))]
+
+        for fname in sorted(fnames):
+            fpath = os.path.join(root, fname)
+            if ignore is not None and ignore(fpath):
+                continue
+
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue  # vanished
+
+            yield fpath, st.st_size, st.st_mtime_ns
+
+
+class BuildFingerprint:
+    # Fingerprint of the inputs of a build: version of the tool, options and
+    # path/size/mtime of the input files. Only stat is used, which makes
+    # checking for changes a matter of milliseconds.
+    #
+    # The fingerprint is recorded (json at recpath) after a build together
+    # with the size/mtime of the outputs. A build with the same fingerprint
+    # whose outputs are untouched has nothing to do. ignore(path) -> bool
+    # leaves out files/dirs under the inputs (like the outputs)
+
+    def __init__(self, recpath, ignore=None):
+        self.recpath = recpath
+        self.recorded = []  # outputs of the recorded build (is_current)
+        self._ignore = ignore
+        self._h = hashlib.sha256(__version__.encode('utf-8'))
+        self._recabs = os.path.abspath(recpath)
+
+    def ignore(self, path):
+        if os.path.basename(path) == '__pycache__':
+            return True
+
+        if os.path.abspath(path) == self._recabs:
+            return True
+
+        return self._ignore is not None and self._ignore(path)
+
+    def _update(self, *parts):
+        self._h.update(b'\0'.join(str(x).encode('utf-8') for x in parts))
+        self._h.update(b'\n')
+
+    def add_options(self, args, skip=NEUTRAL_OPTIONS):
+        opts = {k: v for k, v in vars(args).items()
+                if k not in skip and not k.startswith('_')}
+        self._update('options', json.dumps(opts, sort_keys=True, default=str))
+
+    def add_path(self, path):
+        if not os.path.exists(path):
+            self._update('missing', path)
+            return
+
+        for fpath, size, mtime in _walk_stats(path, self.ignore):
+            self._update(fpath, size, mtime)
+
+    def hexdigest(self):
+        return self._h.hexdigest()
+
+    def _output_stats(self, outputs):
+        stats = {}
+        for output in outputs:
+            if not os.path.exists(output):
+                stats[output] = None
+                continue
+
+            for fpath, size, mtime in _walk_stats(output):
+                stats[fpath] = [size, mtime]
+
+        return stats
+
+    def is_current(self):
+        # True if the recorded fingerprint matches and the outputs are as
+        # they were left
+        try:
+            with open(self.recpath, encoding='utf-8') as f:
+                rec = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if rec.get('fingerprint') != self.hexdigest():
+            return False
+
+        self.recorded = rec.get('roots', [])
+        outputs = rec.get('outputs', {})
+        return self._output_stats(self.recorded) == outputs
+
+    def recorded_outputs(self):
+        # paths written by the last recorded build, whatever its fingerprint
+        try:
+            with open(self.recpath, encoding='utf-8') as f:
+                return list(json.load(f).get('roots', []))
+        except (OSError, ValueError, AttributeError, TypeError):
+            return []
+
+    def record(self, outputs):
+        # outputs: paths of the files/directories written by the build
+        rec = {
+            'fingerprint': self.hexdigest(),
+            'roots': sorted(outputs),
+            'outputs': self._output_stats(outputs),
+        }
+        try:
+            with open(self.recpath, 'w', encoding='utf-8') as f:
+                json.dump(rec, f, indent=1, sort_keys=True)
+        except OSError as e:
+            logging.warning('Cannot record build fingerprint %s: %s',
+                            self.recpath, str(e))
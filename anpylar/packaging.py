@@ -7,11 +7,20 @@
 ###############################################################################
 import ast
 import collections
+import concurrent.futures
+import functools
+import hashlib
+import html.parser
 import json
+import logging
+import mmap
 import os
 import os.path
+import operator
 import re
+import struct
 import textwrap
+import threading
 
 
 from .minify import minify_py
@@ -25,6 +34,130 @@ ANPYLAR_JS = 'anpylar.js'
 VFS_JS_EXT = '.vfs.js'
 VFS_JSON_EXT = '.vfs.json'
 AUTO_VFS_JS_EXT = '.auto_vfs.js'
+COLD_JS_EXT = '.cold.js'
+
+# Length of the content hash in the names of generated files
+HASH_LEN = 10
+
+# Module imported by anpylar_js if the page has no python script
+BOOTSTRAP_MODULE = 'app'
+
+
+# Template to pass development options to anpylar_js (placed 1st in bundle)
+Template_Dev_Options = '''
+;(function() {
+    if(window.__ANPYLAR__ === undefined)
+        window.__ANPYLAR__ = {autoload: []}  // ensure global scope
+
+    window.__ANPYLAR__.dev = %s
+})()
+'''.lstrip()
+
+# Templates to time the startup when the dev option "timings" is set
+Template_Dev_Mark = '''
+;window.performance && performance.mark && performance.mark('anpylar:%s');
+'''.lstrip()
+
+Template_Dev_Hash = '''
+;window.__ANPYLAR__.dev.hash = "%s";
+'''.lstrip()
+
+
+# Template for stdlib modules which were not seen in an import trace
+Template_Cold_Stdlib = '''
+;(function() {
+    var $vfs = %s
+
+    function install($B) {
+        for(var k in $vfs)
+            $B.VFS[k] = $vfs[k]
+    }
+
+    if(window.__BRYTHON__ !== undefined && __BRYTHON__.VFS !== undefined)
+        install(__BRYTHON__)
+    else {
+        if(window.__ANPYLAR__ === undefined)
+            window.__ANPYLAR__ = {autoload: []}  // ensure global scope
+
+        window.__ANPYLAR__.autoload.push(install)
+    }
+})()
+'''.lstrip()
+
+
+# Footer of chunks: the modules are added to the finder of the package, which
+# fetches the chunk when one of them is first imported
+Template_Chunk_Footer = '''
+    window.__ANPYLAR__.autoload.push(function($B) {
+        $B.imported['_importlib'].VFSAutoPathFinder(vfspath, $vfs)
+    })
+})()
+'''
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_source(src):
+    # The tree of the same sources is needed several times in a build
+    # (scanning imports, shaking). The trees are only visited. They are
+    # released when the build ends (see release_sources)
+    return ast.parse(src)
+
+
+# (sha1 of sources, package, finder) -> imports. Kept between builds, which
+# only costs the names: the sources are not held
+_imports_memo = collections.OrderedDict()
+_imports_lock = threading.Lock()
+_IMPORTS_MEMO_SIZE = 16384
+
+
+def module_imports(src, package, finder):
+    # Imports (and parent packages) of the module with sources src inside
+    # package, as seen by finder (an ImportFinder class)
+    key = (hashlib.sha1(src.encode('utf-8')).digest(), package, finder)
+    with _imports_lock:
+        imps = _imports_memo.get(key)
+        if imps is not None:
+            _imports_memo.move_to_end(key)
+            return imps
+
+    impfinder = finder()
+    if package is not None:  # else relative imports are skipped
+        impfinder.set_package(package)
+
+    impfinder.visit(parse_source(src))
+    imps = tuple(sorted(impfinder.iter_imports()))
+    with _imports_lock:
+        _imports_memo[key] = imps
+        if len(_imports_memo) > _IMPORTS_MEMO_SIZE:
+            _imports_memo.popitem(last=False)
+
+    return imps
+
+
+def release_sources():
+    # Drops the parsed trees of the sources, which are as large as the
+    # application. Called at the end of a build: long running processes
+    # (serve, daemon, --watch) do not keep them
+    parse_source.cache_clear()
+
+
+def hashed_name(name, ext, content):
+    # name.<hash of content>ext. content can also be a sha256 object
+    if not hasattr(content, 'hexdigest'):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+
+        content = hashlib.sha256(content)
+
+    return '{}.{}{}'.format(name, content.hexdigest()[:HASH_LEN], ext)
+
+
+_re_hashed = re.compile(r'\.[0-9a-f]{%d}(\.\w+)+$' % HASH_LEN)
+
+
+def is_hashed_name(name):
+    # True if name looks like the output of hashed_name
+    return _re_hashed.search(name) is not None
 
 
 # Tempalte for regenerating Brython Lib
@@ -45,6 +178,12 @@ class Bundler:
     PATH_ANPYLAR_AUTO_VFS_JS = os.path.join(datadir, 'anpylar.auto_vfs.js')
     PATH_ANPYLAR_D_AUTO_VFS_JS = os.path.join(datadir, 'anpylar_d.auto_vfs.js')
 
+    # Parts of a split bundle
+    VENDOR = 'vendor'
+    APP = 'app'
+
+    _closures = {}  # (stdlib hash, imports) -> stdlib modules needed
+
     # Keys for the PATHs dictionary
     BR_JS = 'br_js'
     BRSTD_JS = 'brstd_js'
@@ -67,6 +206,11 @@ class Bundler:
         self.minify = not self.br_debug  # do not minify if debugging
         self.auto_anpylar = True
         self.anpylarize = anpylarize
+        self.stdlib_on_demand = False  # stdlib served per module if True
+        self.dev_options = None  # options for dev services in anpylar_js
+        self.cache = None  # BuildCache for paketized files
+        self.executor = None  # to paketize files in parallel
+        self.reuse = None  # path -> Paketizer of a previous build
 
         # hold basic comps of 'anpylar.js'
         self.comps = comps = collections.OrderedDict()
@@ -78,11 +222,27 @@ class Bundler:
                 comps[k] = None
 
         self.pakets = []  # corresponding paket for import analysis
+        self.cold_stdlib = {}  # stdlib modules left out by a split trace
+        self.chunks = collections.OrderedDict()  # name -> content
+        self.stdlib_select = None  # modules to take from a stdlib container
 
     def set_br_debug(self, onoff=True):
         self.br_debug = onoff
         self.minify = not onoff  # do not minify if debugging
 
+    def set_stdlib_on_demand(self, onoff=True):
+        # The stdlib VFS is left out and brython fetches each module from
+        # Lib/libs as it is imported. Browser caching is activated to let
+        # the modules be fetched only once
+        self.stdlib_on_demand = onoff
+
+    def set_dev_options(self, **kwargs):
+        # The options are made available to anpylar_js as __ANPYLAR__.dev
+        if self.dev_options is None:
+            self.dev_options = {}
+
+        self.dev_options.update(kwargs)
+
     def do_anpylar_vfs(self):
         path = self.paths[self.ANPYLAR_VFS_JS]
         if not self.auto_anpylar:
@@ -97,6 +257,7 @@ class Bundler:
             self.add_auto_vfs(path)
 
         # Place anpylar before any other package
+        self.pakets[-1].vendor = True
         self.pkgs.insert(0, self.pkgs.pop())
         self.pakets.insert(0, self.pakets.pop())
         self._added_anpylar_vfs = True
@@ -117,54 +278,141 @@ class Bundler:
     def set_anpylar_js(self, path):
         self.paths[self.ANPYLARJS_JS] = path
 
-    def add_json(self, path):
+    def add_json(self, path, vendor=False):
         vfs = readfile_error(path)
         paket = Paketizer_Json(vfs)
+        paket.vendor = vendor
         self.pakets.append(paket)
-        self.pkgs.append(paket.get_autoload())
+        self.pkgs.append(paket)  # rendered when writing the bundle
 
-    def add_vfs_js(self, path):
+    def add_vfs_js(self, path, vendor=False):
         vfs = readfile_error(path)
         paket = Paketizer_Json(vfs, braces=1)
+        paket.vendor = vendor
         self.pakets.append(paket)
-        self.pkgs.append(paket.get_autoload())
+        self.pkgs.append(paket)  # rendered when writing the bundle
 
-    def add_auto_vfs(self, path):
+    def add_auto_vfs(self, path, vendor=False):
         vfs = readfile_error(path)
         paket = Paketizer_Json(vfs, braces=2)
+        paket.vendor = vendor
         self.pakets.append(paket)
         # self.pkgs.append(paket.get_autoload())
         self.pkgs.append(vfs)  # already in proper format
 
-    def add_pkg_dir(self, path, **kwargs):
+    def add_pkg_dir(self, path, vendor=False, **kwargs):
+        kwargs.setdefault('cache', self.cache)
+        kwargs.setdefault('executor', self.executor)
+        key = os.path.abspath(path)
+        if self.reuse is not None:  # only the changed files are processed
+            kwargs.setdefault('previous', self.reuse.get(key))
+
         paket = Paketizer(path, minify=self.minify, **kwargs)
-        self.pkgs.append(paket.get_autoload())
+        paket.vendor = vendor
+        if self.reuse is not None:
+            self.reuse[key] = paket
 
-    def prepare_bundle(self):
-        if self.anpylarize:
-            self.do_anpylar_vfs()
+        # like the other pakets: its imports decide which stdlib modules
+        # the optimized bundle keeps (else modules only the application
+        # imports are dropped) and the entries of pakets and pkgs match
+        self.pakets.append(paket)
+        # rendered when the bundle is generated. With an executor this lets
+        # the files of all packages be processed concurrently
+        self.pkgs.append(paket)
+
+    def set_cache(self, cache):
+        self.cache = cache
 
+    def set_executor(self, executor):
+        self.executor = executor
+
+    def set_reuse(self, pakets):
+        # pakets: dict path -> Paketizer kept between builds (--watch). The
+        # directories added are paketized from the ones of the last build
+        self.reuse = pakets
+
+    def close(self):
+        # Pending paketizing work is finished before shutting down. The
+        # build is over: the parsed sources are released
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        release_sources()
+
+    def _comp_paths(self):
         for name, path in self.paths.items():
             if not path:
                 continue
             elif name == self.ANPYLAR_VFS_JS:
                 continue  # skip in case it's added (it's in packages)
+            elif name == self.BRSTD_JS and self.stdlib_on_demand:
+                continue  # modules will be fetched by brython one by one
+
+            yield name, path
+
+    def _load_comp(self, name, path):
+        if name == self.BRSTD_JS and StdlibContainer.is_container(path):
+            self.comps[name] = comp = StdlibContainer(path)
+            return comp
+
+        self.comps[name] = comp = readfile_error(path)
+
+        if name == self.ANPYLARJS_JS:
+            bpattern = r'brython\(.*\)'
+            if self.stdlib_on_demand:
+                bopts = "{{debug: {:d}, cache: 'browser'}}"
+                bopts = bopts.format(self.br_debug)
+            else:
+                bopts = '1' * self.br_debug
 
-            self.comps[name] = comp = readfile_error(path)
+            brepl = 'brython({})'.format(bopts)
+            self.comps[name] = comp = re.sub(bpattern, brepl, comp, count=1)
 
-            if name == self.ANPYLARJS_JS:
-                bpattern = r'brython\(.*\)'
-                brepl = 'brython({})'.format('1' * self.br_debug)
-                self.comps[name] = re.sub(bpattern, brepl, comp, count=1)
+        return comp
+
+    def prepare_bundle(self):
+        if self.anpylarize:
+            self.do_anpylar_vfs()
+
+        for name, path in self._comp_paths():
+            self._load_comp(name, path)
 
         self.prepared = True
 
-    def write_bundle(self, path, prepare=True, skip_packages=False):
-        if prepare and not self.prepared:
-            self.prepare_bundle()
+    def _part(self, name, idx=0):
+        # vendor: brython, stdlib, anpylar and vendor packages. app: the rest
+        if name == self.PACKAGES:
+            return self.VENDOR if self.pakets[idx].vendor else self.APP
+
+        return self.APP if name == self.ANPYLARJS_JS else self.VENDOR
+
+    def iter_bundle(self, prepare=True, skip_packages=False, part=None):
+        # Generates the bundle as a sequence of fragments. If the bundle has
+        # not been prepared, the components are read from disk as they are
+        # reached, to let the first ones go out before the rest is loaded.
+        # With part (VENDOR/APP) only that part of the bundle is generated.
+        # The vendor part has to be loaded before the app part. Both
+        # concatenated are the bundle (without dev options)
+        lazy = prepare and not self.prepared
+        if lazy and self.anpylarize:
+            self.do_anpylar_vfs()
+
+        paths = dict(self._comp_paths()) if lazy else {}
+
+        dev = self.dev_options if part is None else None  # only unsplit
+        timings = dev is not None and 'timings' in dev
+        if dev is not None:
+            yield Template_Dev_Options % json.dumps(dev)
+
+        if timings:
+            bhash = hashlib.sha1()  # identifies the bundle in the timings
+            yield Template_Dev_Mark % 'start'
 
-        out = []
         for k, val in self.comps.items():
+            if k in paths:
+                val = self._load_comp(k, paths[k])
+
             if k == self.PACKAGES and skip_packages:
                 # packages are only used for optimizing stdlib, skip them
                 if not self._added_anpylar_vfs:
@@ -172,9 +420,75 @@ class Bundler:
 
                 val = val[0]  # anpylar is 1st, save it (no regular pkg)
 
-            out += val if isinstance(val, (list,)) else [val]
+            elif val is None:
+                continue  # component not loaded (stdlib on demand)
+
+            items = val if isinstance(val, (list,)) else [val]
+            # vendor pakets go first, for the whole bundle to be the vendor
+            # part followed by the app part
+            parts = [self._part(k, i) for i in range(len(items))]
+            items = [x for p, x in sorted(zip(parts, items),
+                                          key=lambda y: y[0] != self.VENDOR)
+                     if part is None or p == part]
+
+            for item in items:
+                for fragment in self._iter_item(k, item):
+                    yield fragment
+                    if timings:
+                        bhash.update(fragment.encode('utf-8'))
+
+                yield '\n'
+
+            if timings:
+                yield Template_Dev_Mark % k
+
+        if timings:
+            yield Template_Dev_Hash % bhash.hexdigest()[:16]
+
+        if lazy:
+            self.prepared = True
+
+    def _iter_item(self, name, item):
+        # Fragments of a component. Pakets are encoded entry by entry, for
+        # the memory footprint not to depend on the size of the bundle
+        if isinstance(item, StdlibContainer):
+            yield from item.iter_js(self.stdlib_select)
+        elif isinstance(item, Paketizer):
+            if name == self.BRSTD_JS:  # optimized: only json was replaced
+                yield item.prefix
+                yield from item.iter_raw()
+            else:
+                yield from item.iter_autoload()
+        else:
+            yield item
+
+    def write_bundle(self, path, prepare=True, skip_packages=False,
+                     part=None):
+        out = self.iter_bundle(prepare=prepare, skip_packages=skip_packages,
+                               part=part)
+        makefile_error(path, out, itercontent=True, end='')
+
+    def write_hashed_bundle(self, dirpath, part, prepare=True):
+        # Writes a part of the bundle to dirpath as part.<hash>.js, with the
+        # hash calculated while writing. Returns the name of the file
+        h = hashlib.sha256()
+
+        def hashing(fragments):
+            for fragment in fragments:
+                h.update(fragment.encode('utf-8'))
+                yield fragment
+
+        tmppath = os.path.join(dirpath, '.{}.js.tmp'.format(part))
+        out = self.iter_bundle(prepare=prepare, part=part)
+        makefile_error(tmppath, hashing(out), itercontent=True, end='')
 
-        makefile_error(path, out, itercontent=True)
+        name = hashed_name(part, '.js', h)
+        try:
+            os.replace(tmppath, os.path.join(dirpath, name))
+        except OSError as e:
+            print_error(e)
+
+        return name
 
     def get_imports(self, tolist=True):
         pkgbases = [paket.base for paket in self.pakets]
@@ -188,56 +502,547 @@ class Bundler:
 
         return imps
 
-    def optimize_stdlib(self):
+    def optimize_stdlib(self, trace=None, split=False):
+        # trace: set of module names seen imported by the browser (see
+        # read_traces). Without split, only the traced stdlib modules are
+        # kept. With split, the modules found by the import analysis which
+        # were not traced are left for get_cold_stdlib
         if not self.prepared:
             self.prepare_bundle()
 
+        if self.stdlib_on_demand:
+            return  # no stdlib in the bundle, nothing to optimize
+
         pkg = self.comps[self.BRSTD_JS]
-        paket = Paketizer_Json(pkg)
-        stdlib = paket.modules
+        if isinstance(pkg, StdlibContainer):
+            # modules are sliced out of the container when writing
+            stdlib = pkg
+            graph_kwargs = dict(chash=pkg.source_hash,
+                                modules=lambda: pkg.modules)
+        else:
+            paket = Paketizer_Json(pkg)
+            chash = StdlibGraph.content_hash(pkg)
+            stdlib = StdlibGraph.modules(pkg, chash)  # decoded once
+            graph_kwargs = dict(chash=chash, modules=stdlib)
 
-        imps = self.get_imports()
         stdlib_entries = set()
-        for imp in imps:
-            self.find_stdlib_imports(stdlib, imp, stdlib_entries)
+        if trace is None or split:
+            graph = StdlibGraph.get(cache=self.cache, **graph_kwargs)
+            imps = frozenset(self.get_imports())
+            # unchanged imports (rebuilding in the same process) have the
+            # same closure
+            ckey = (graph.chash, imps)
+            closure = self._closures.get(ckey, None)
+            if closure is None:
+                for imp in imps:
+                    self.find_stdlib_imports(graph, imp, stdlib_entries)
+
+                if len(self._closures) > 64:
+                    self._closures.clear()
+
+                self._closures[ckey] = frozenset(stdlib_entries)
+            else:
+                stdlib_entries.update(closure)
+
+        cold = set()
+        if trace is not None:
+            hot = {x for x in trace if x in stdlib}
+            if split:
+                cold = stdlib_entries - hot
+
+            stdlib_entries = hot
+
+        self.cold_stdlib = {k: stdlib[k] for k in sorted(cold)}
+
+        if isinstance(pkg, StdlibContainer):
+            self.stdlib_select = [x for x in pkg.names if x in stdlib_entries]
+            return
 
         # With the given imports ... re-generate stdlib
         stdlib = {k: v for k, v in stdlib.items() if k in stdlib_entries}
         paket.modules = stdlib
 
-        # replace only json content
-        self.comps[self.BRSTD_JS] = pkg[:pkg.find('{')] + paket.get_raw()
+        # replace only json content (done when writing the bundle)
+        self.comps[self.BRSTD_JS] = paket
+
+    def get_cold_stdlib(self):
+        # Script which adds the cold stdlib modules to the VFS of brython,
+        # either immediately or, if loaded earlier, upon anpylar's autoload
+        return Template_Cold_Stdlib % json.dumps(self.cold_stdlib)
+
+    def write_cold_stdlib(self, path):
+        makefile_error(path, self.get_cold_stdlib())
+
+    @staticmethod
+    def read_traces(paths):
+        # Union of the modules recorded in trace files by serve
+        trace = set()
+        for path in paths:
+            content = readfile_error(path)
+            try:
+                trace.update(json.loads(content)['modules'])
+            except (ValueError, KeyError, TypeError) as e:
+                print_error('Invalid trace file {}: {}'.format(path, e))
+
+        return trace
+
+    def find_stdlib_imports(self, graph, name, storage_set):
+        graph.closure([name], storage_set)
+
+    def _app_pakets(self):
+        # (index, paket) of the packages, leaving anpylar out
+        skip = 1 if self._added_anpylar_vfs else 0
+        return list(enumerate(self.pakets))[skip:]
+
+    def shake_packages(self, roots=(BOOTSTRAP_MODULE,)):
+        # Removes the modules of the packages which cannot be reached from the
+        # roots following the imports (relative ones resolved). Components in
+        # Module.components/routes are classes and therefore imported by the
+        # module. Returns a list of (name, size) of the pruned entries
+        pakets = self._app_pakets()
+        reached = reachable_modules([x[1] for x in pakets], roots)
+
+        pruned = []
+        for i, paket in pakets:
+            modules = paket.modules
+            keep = collections.OrderedDict()
+            for name, entry in modules.items():
+                mod = entry_module(modules, name)
+                if mod is None or mod in reached:
+                    keep[name] = entry
+                else:
+                    pruned.append((name, len(entry[1].encode('utf-8'))))
+
+            if len(keep) != len(modules):
+                paket.modules = keep
+                self.pkgs[i] = paket  # auto_vfs were kept as text
+
+        # drop the packages left empty (not imported at all)
+        for i, paket in reversed(pakets):
+            if not paket.modules:
+                del self.pakets[i]
+                del self.pkgs[i]
+
+        return pruned
+
+    def split_chunks(self, roots=(BOOTSTRAP_MODULE,), prefixes=None):
+        # Moves the package modules not imported at once when importing roots
+        # (imports in functions are deferred) to chunks, loaded by anpylar_js
+        # when first imported. The modules of a chunk share the 1st prefix
+        # they start with or, without prefixes, the 1st subpackage/module of
+        # the package. The chunks are left in self.chunks and a list of
+        # (chunkname, number of entries) is returned
+        pakets = self._app_pakets()
+        eager = reachable_modules([x[1] for x in pakets], roots,
+                                  finder=EagerImportFinder)
+
+        if prefixes is not None:  # longest first to find the closest
+            prefixes = sorted(prefixes, key=len, reverse=True)
+
+        report = []
+        for i, paket in pakets:
+            modules = paket.modules
+            groups = collections.OrderedDict()
+            for name, entry in modules.items():
+                mod = entry_module(modules, name)
+                if mod is None or mod in eager:
+                    continue
+
+                if prefixes is None:
+                    group = '.'.join(mod.split('.')[:2])
+                else:
+                    group = next((x for x in prefixes
+                                  if mod == x or mod.startswith(x + '.')),
+                                 None)
+                    if group is None:
+                        continue  # not to be split
+
+                groups.setdefault(group, collections.OrderedDict())
+                groups[group][name] = entry
+
+            if not groups:
+                continue
+
+            vfspath = getattr(paket, 'vfspath', None) or paket.base + '.vfs.js'
+            modules = collections.OrderedDict(modules)
+            for group, vfs in groups.items():
+                content = Paketizer.gen_autoload(
+                    vfs, vfspath, footer=Template_Chunk_Footer)
+                chunkname = hashed_name(group, AUTO_VFS_JS_EXT, content)
+                self.chunks[chunkname] = content
+                report.append((chunkname, len(vfs)))
+                for name, entry in vfs.items():
+                    if entry[0] == '.py':
+                        modules[name] = chunkname  # fetched on import
+                    else:
+                        del modules[name]  # the module is imported first
+
+            paket.modules = modules
+            self.pkgs[i] = paket  # auto_vfs were kept as text
+
+        return report
+
+    def write_chunks(self, dirpath):
+        for name, content in self.chunks.items():
+            makefile_error(os.path.join(dirpath, name), content)
+
+    def shake_anpylar(self):
+        # Removes the anpylar modules the application cannot reach. The
+        # package imports all its modules, hence its __init__ is rewritten to
+        # keep only the imports providing names used by the application (and
+        # modules with side effects). Returns a list of (name, size) of the
+        # pruned modules
+        if not self.prepared:
+            self.prepare_bundle()
+
+        if not self._added_anpylar_vfs:
+            return []
+
+        paket = self.pakets[0]
+        usage = PackageUsageFinder(paket.base)
+        for i, apaket in self._app_pakets():
+            for name, entry in apaket.modules.items():
+                if entry[0] == '.py':
+                    usage.visit(parse_source(entry[1]))
+
+        if usage.everything:
+            return []  # all names are potentially used
+
+        modules = paket.modules
+        init = PackageInit(modules, paket.base)
+        pinit = modules[paket.base]
+
+        # names needed by the app: first pass to find what is reached, 2nd
+        # pass to put back the names of the modules loaded anyway
+        initmods = init.providers(usage.names)
+        tmpmodules = dict(modules)
+        tmpmodules[paket.base] = pinit[:1] + [init.source(initmods)]
+        tmpmodules[paket.base] += pinit[2:]
+        roots = [paket.base] + sorted(usage.modules)
+        reached = reachable_modules([tmpmodules], roots)
+
+        keep = collections.OrderedDict()
+        pruned = []
+        for name, entry in modules.items():
+            if name == paket.base:
+                keep[name] = entry[:1] + [init.source(reached)] + entry[2:]
+            elif name in reached or entry[0] != '.py':
+                keep[name] = entry
+            else:
+                pruned.append((name, len(entry[1].encode('utf-8'))))
+
+        if pruned:
+            paket.modules = keep
+            self.pkgs[0] = paket  # kept as text until now
 
-    def find_stdlib_imports(self, bstdlib, name, storage_set):
+        return pruned
+
+######################################################################
+# StdlibIndex
+######################################################################
+class StdlibIndex:
+    # Maps the urls brython uses to fetch stdlib modules when no VFS is in
+    # place (Lib/xx/yy.py, Lib/xx/__init__.py, libs/zz.js) to the encoded
+    # sources contained in a brython_stdlib.js file
+    LIB = 'Lib'
+    LIBS = 'libs'
+
+    def __init__(self, path=None):
+        self.path = path or Bundler.PATHS[Bundler.BRSTD_JS]
+        self.mtime = os.path.getmtime(self.path)
+
+        self.urls = urls = {}
+        if StdlibContainer.is_container(self.path):
+            container = StdlibContainer(self.path)
+            modules = container.modules
+            container.close()
+        else:
+            modules = Paketizer_Json(readfile_error(self.path)).modules
+
+        for name, entry in modules.items():
+            ext, src = entry[0:2]
+            mpath = name.replace('.', '/')
+            if ext == '.py':
+                if len(entry) > 2:  # package marker
+                    mpath += '/__init__'
+
+                url = '/'.join((self.LIB, mpath + ext))
+            else:
+                url = '/'.join((self.LIBS, mpath + ext))
+
+            urls[url] = src.encode('utf-8')
+
+    def find(self, path):
+        # brython_path is where anpylar.js was loaded from, which needs not
+        # be the root. Look for the stdlib dirs along the path
+        parts = path.split('/')
+        for i, part in enumerate(parts):
+            if part in (self.LIB, self.LIBS):
+                return self.urls.get('/'.join(parts[i:]), None)
+
+        return None
+
+
+######################################################################
+# StdlibGraph
+######################################################################
+class StdlibGraph:
+    # Import graph of a brython stdlib: module name -> stdlib modules it
+    # imports. It is computed once for a given content and found later in
+    # memory, in the index shipped for the packaged stdlib or in the cache.
+    # Regenerate the shipped index with write if brython_stdlib.js changes
+    PATH_SHIPPED = os.path.join(Bundler.datadir, 'brython_stdlib.graph.json')
+
+    _memo = {}  # content hash -> graph
+    _modules = {}  # content hash -> decoded modules (shared, not changed)
+
+    def __init__(self, graph, chash=None):
+        self.graph = graph
+        self.chash = chash
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get(cls, content=None, modules=None, cache=None, chash=None):
+        # modules can be a callable to delay decoding until really needed
+        if chash is None:
+            chash = cls.content_hash(content)
+
+        graph = cls._memo.get(chash, None)
+
+        if graph is None:
+            graph = cls.load(cls.PATH_SHIPPED, chash)
+
+        ckey = None
+        if graph is None and cache is not None:
+            ckey = cache.key('stdlib-graph', chash)
+            graph = cache.get(ckey)
+
+        if graph is None:
+            if modules is None:
+                modules = Paketizer_Json(content).modules
+            elif callable(modules):
+                modules = modules()
+
+            graph = cls.build(modules)
+            if ckey is not None:
+                cache.put(ckey, graph)
+
+        cls._memo[chash] = graph
+        return cls(graph, chash)
+
+    @classmethod
+    def modules(cls, content, chash=None):
+        # The decoded modules of a brython_stdlib.js. Decoding is the bulk
+        # of optimizing the stdlib and is done once per content, also for
+        # the builds forked by the daemon, which decodes it when warming
+        if chash is None:
+            chash = cls.content_hash(content)
+
+        modules = cls._modules.get(chash, None)
+        if modules is None:
+            modules = Paketizer_Json(content).modules
+            if len(cls._modules) >= 2:  # a stdlib or two per process
+                cls._modules.clear()
+
+            cls._modules[chash] = modules
+
+        return modules
+
+    @staticmethod
+    def load(path, chash):
         try:
-            entry = bstdlib[name]
-        except KeyError:
-            return
+            with open(path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if index.get('hash') != chash:
+            return None  # not for this content
+
+        return index['graph']
+
+    @classmethod
+    def write(cls, path, content):
+        index = {
+            'hash': cls.content_hash(content),
+            'graph': cls.build(Paketizer_Json(content).modules),
+        }
+        makefile_error(path, json.dumps(index, sort_keys=True))
 
-        storage_set.add(name)  # present in stdlib, add it
+    @staticmethod
+    def build(modules):
+        graph = {}
+        for name, entry in modules.items():
+            ext, src = entry[0:2]
+            if ext != '.py':
+                graph[name] = []  # cannot parse, end of chain
+                continue
 
-        ext, src = entry[0:2]
-        if ext != '.py':
-            return  # cannot parse, end of chain
+            is_package = len(entry) > 2
 
-        is_package = len(entry) > 2
+            fname = name.replace('.', os.sep)
+            if is_package:
+                fname += os.sep + '__init__'
+            fname += ext
 
-        fname = name.replace('.', os.sep)
-        if is_package:
-            fname += os.sep + '__init__'
-        fname += ext
+            pkgsplit = name.split('.')
+            pkg = name if len(pkgsplit) == 1 else '.'.join(pkgsplit[:-1])
+            impfinder = ImportFinder()
+            impfinder.set_package(pkg)
 
-        pkgsplit = name.split('.')
-        pkg = name if len(pkgsplit) == 1 else '.'.join(pkgsplit[:-1])
-        impfinder = ImportFinder()
-        impfinder.set_package(pkg)
+            try:
+                tree = ast.parse(src, filename=fname)
+            except SyntaxError as e:
+                logging.warning('stdlib module %s cannot be parsed: %s',
+                                name, str(e))
+                graph[name] = []
+                continue
 
-        tree = ast.parse(src, filename=fname)
-        impfinder.visit(tree)
+            impfinder.visit(tree)
+            graph[name] = sorted(x for x in impfinder.iter_imports()
+                                 if x in modules and x != name)
+
+        return graph
+
+    def closure(self, names, storage_set=None):
+        seen = set() if storage_set is None else storage_set
+        pending = [x for x in names if x in self.graph]
+        while pending:
+            name = pending.pop()
+            if name not in seen:
+                seen.add(name)
+                pending.extend(self.graph[name])
+
+        return seen
+
+
+######################################################################
+# StdlibContainer
+######################################################################
+class StdlibContainer:
+    # Binary container for a brython stdlib, read through mmap. Layout
+    # (little endian):
+    #
+    #   magic (8 bytes)
+    #   count (u32), prefix, suffix and source hash lengths (u32)
+    #   prefix: text preceding the json object in brython_stdlib.js
+    #   suffix: text following the json object in brython_stdlib.js
+    #   source hash: StdlibGraph.content_hash of the brython_stdlib.js
+    #   table: count x (name length (u16), name, offset (u64), length (u32))
+    #   payloads: json encoded entry of each module
+    #
+    # Offsets are relative to the start of the payloads. Entries are json
+    # and can be written out to a bundle without being decoded
+
+    MAGIC = b'APLSTD\x00\x01'
+    HEADER = struct.Struct('<IIII')
+    ENTRY = struct.Struct('<QI')
+    NAMELEN = struct.Struct('<H')
+
+    def __init__(self, path):
+        self.path = path
+        self._file = f = open(path, 'rb')
+        self._mm = mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mm[:len(self.MAGIC)] != self.MAGIC:
+            self.close()
+            raise ValueError('Not a stdlib container: {}'.format(path))
+
+        pos = len(self.MAGIC)
+        count, plen, slen, hlen = self.HEADER.unpack_from(mm, pos)
+        pos += self.HEADER.size
+        self.prefix = mm[pos:pos + plen].decode('utf-8')
+        pos += plen
+        self.suffix = mm[pos:pos + slen].decode('utf-8')
+        pos += slen
+        self.source_hash = mm[pos:pos + hlen].decode('ascii')
+        pos += hlen
+
+        self.names = names = []
+        self._table = table = {}
+        for i in range(count):
+            nlen, = self.NAMELEN.unpack_from(mm, pos)
+            pos += self.NAMELEN.size
+            name = mm[pos:pos + nlen].decode('utf-8')
+            pos += nlen
+            table[name] = self.ENTRY.unpack_from(mm, pos)
+            pos += self.ENTRY.size
+            names.append(name)
+
+        self._base = pos  # payloads start
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    @classmethod
+    def is_container(cls, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(cls.MAGIC)) == cls.MAGIC
+        except OSError:
+            return False
+
+    def __contains__(self, name):
+        return name in self._table
+
+    def get_json(self, name):
+        offset, length = self._table[name]
+        start = self._base + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def __getitem__(self, name):
+        return json.loads(self.get_json(name))
+
+    @property
+    def modules(self):
+        return {name: self[name] for name in self.names}
+
+    def iter_js(self, names=None):
+        # The brython_stdlib.js content for the given names (default: all).
+        # A selection is written as a re-generated stdlib would be
+        yield self.prefix
+        yield '{'
+        sep = ''
+        for name in self.names if names is None else names:
+            yield '{}{}: {}'.format(sep, json.dumps(name), self.get_json(name))
+            sep = ', '
+
+        yield '}'
+        if names is None:
+            yield self.suffix
+
+    @classmethod
+    def convert(cls, content, path):
+        # content: text of a brython_stdlib.js
+        prefix = content[:content.find('{')].encode('utf-8')
+        suffix = content[content.rfind('}') + 1:].encode('utf-8')
+        shash = StdlibGraph.content_hash(content).encode('ascii')
+        modules = Paketizer_Json(content).modules
+
+        table = []
+        payloads = []
+        offset = 0
+        for name, entry in modules.items():
+            payload = json.dumps(entry).encode('utf-8')
+            bname = name.encode('utf-8')
+            table.append(cls.NAMELEN.pack(len(bname)) + bname +
+                         cls.ENTRY.pack(offset, len(payload)))
+            payloads.append(payload)
+            offset += len(payload)
+
+        out = [cls.MAGIC,
+               cls.HEADER.pack(len(modules), len(prefix), len(suffix),
+                               len(shash)),
+               prefix, suffix, shash] + table + payloads
+
+        makefile_error(path, out, itercontent=True, end=None, mode='wb',
+                       newline=None)
+        return len(modules)
 
-        for imp in impfinder.iter_imports():
-            if imp not in storage_set:  # avoid inf recursio by not re-visiting
-                self.find_stdlib_imports(bstdlib, imp, storage_set)
 
 ######################################################################
 # Paketizter
@@ -260,10 +1065,165 @@ Template_Wrapper_Footer = '''
 '''
 
 
+def json_entry(k, v, indent=None, nl=''):
+    # The encoded "k: v" of a vfs entry
+    val = json.dumps(v, indent=indent)
+    if indent is not None:
+        val = val.replace('\n', nl)  # json strings have no line breaks
+
+    return '{}: {}'.format(json.dumps(k), val)
+
+
+def entry_hash(v):
+    # sha256 of the content of a vfs entry (extension, sources, marker)
+    h = hashlib.sha256()
+    for x in v if isinstance(v, (list, tuple)) else [v]:
+        h.update(str(x).encode('utf-8', 'surrogatepass'))
+        h.update(b'\0')
+
+    return h.digest()
+
+
+class JsonFragments:
+    # The encoded entries of a vfs, kept by the paket owning it under the
+    # hash of the entry content. A vfs written again (another output, a
+    # part of the bundle) encodes only the entries which changed. The
+    # fragment of an entry is replaced when its content changes and dropped
+    # when the entry is gone (after a complete pass of iter_json)
+
+    def __init__(self):
+        self._frags = {}  # (k, indent, nl) -> (hash, fragment)
+
+    def get(self, k, v, indent, nl):
+        key, h = (k, indent, nl), entry_hash(v)
+        frag = self._frags.get(key)
+        if frag is None or frag[0] != h:
+            frag = self._frags[key] = (h, json_entry(k, v, indent, nl))
+
+        return frag[1]
+
+    def retain(self, names):
+        # drops the fragments of entries not in names
+        self._frags = {key: x for key, x in self._frags.items()
+                       if key[0] in names}
+
+    def __len__(self):
+        return len(self._frags)
+
+
+def iter_json(vfs, indent=None, prefix='', fragments=None):
+    # Encodes vfs (a dict) entry by entry. The fragments add up to the output
+    # of json.dumps(vfs, indent=indent), with prefix after each line break.
+    # fragments: JsonFragments of the owner of vfs, if any
+    if not vfs:
+        yield '{}'
+        return
+
+    if indent is None:
+        nl, itemsep = '', ', '
+    else:
+        nl = '\n' + prefix + (' ' * indent if isinstance(indent, int)
+                              else indent)
+        itemsep = ','
+
+    yield '{'
+    sep = nl
+    for k, v in vfs.items():
+        yield sep
+        if fragments is None:
+            yield json_entry(k, v, indent, nl)
+        else:
+            yield fragments.get(k, v, indent, nl)
+
+        sep = itemsep + nl
+
+    if fragments is not None:
+        fragments.retain(vfs)
+
+    if indent is not None:
+        yield '\n' + prefix
+
+    yield '}'
+
+
+def process_py(content, minify=True, skipcomments=True, cache=None):
+    # Returns the (minified if requested) content and, if a cache is in use,
+    # the absolute imports found in it (else None). The result is stored in
+    # the cache under the hash of content and options
+    if cache is None:
+        if minify:
+            content = minify_py(content, skipcomments=skipcomments)
+
+        return content, None
+
+    key = cache.key(content, minify, skipcomments)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry['content'], entry['imports']
+
+    if minify:
+        content = minify_py(content, skipcomments=skipcomments)
+
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        imports = None  # let the scan report it if ever done
+    else:
+        impfinder = ImportFinder()
+        impfinder.visit(tree)
+        imports = sorted(impfinder.iter_imports())
+
+    cache.put(key, {'content': content, 'imports': imports})
+    return content, imports
+
+
+def paketize_py(fpath, minify=True, skipcomments=True, cache=None):
+    # Work unit for a process pool: read + process_py
+    content = readfile_error(fpath)
+    return process_py(content, minify=minify, skipcomments=skipcomments,
+                      cache=cache)
+
+
+def file_stat(fpath):
+    # (size, mtime) telling if a file changed, None if it cannot be stat'ed
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return None
+
+    return st.st_size, st.st_mtime_ns
+
+
+def make_executor(jobs=1):
+    # jobs: 1 -> no executor (in process), 0 -> as many as cpus
+    if jobs == 1:
+        return None
+
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs or None)
+
+
 class Paketizer:
+    vendor = False  # part of the vendor bundle when the bundle is split
+
     def __init__(self, d, extensions=['.py'], minify=True, skipcomments=True,
-                 parser=None, usename=None, asset_prefix=''):
+                 parser=None, usename=None, asset_prefix='', cache=None,
+                 executor=None, previous=None):
+        # With an executor, the python files are submitted to it and the
+        # results collected when modules/imports are first needed.
+        # previous: Paketizer of the same directory from an earlier build.
+        # Its entries are taken for the files with the same size/mtime,
+        # only the others are read and processed again
         self.modules = modules = {}  # keep track of the loaded modules
+        self._imports = imports = {}  # absolute imports if known (cache)
+        self._files = {}  # modname -> (fpath, stat, entry, imports) as read
+        self._pyopts = (minify, skipcomments)
+
+        if previous is not None and previous._pyopts == self._pyopts:
+            self.fragments = previous.fragments
+            prevfiles = previous._files
+        else:
+            self.fragments = JsonFragments()  # encoded modules
+            prevfiles = {}
 
         # The root package name is the last directory in the path provided
         if usename:
@@ -271,6 +1231,7 @@ class Paketizer:
         else:
             self.base = base = os.path.basename(d.rstrip(os.sep))
 
+        entries = []
         for root, dnames, fnames in os.walk(d):
             # must have __init__
             drel = os.path.relpath(root, d)
@@ -310,70 +1271,177 @@ class Paketizer:
 
                 # Reunite the path and normalize it for sanity
                 fpath = os.path.join(root, fname)
-                # read and add to modules
-                content = readfile_error(fpath, parser=parser)
+                skey = os.path.relpath(fpath, d).split(os.sep)
+                entries.append((skey, modname, fpath, ext, modext))
+
+        # the walk order depends on the filesystem, make the output stable
+        entries.sort(key=operator.itemgetter(0))
+
+        pykwargs = dict(minify=minify, skipcomments=skipcomments, cache=cache)
+        for _, modname, fpath, ext, modext in entries:
+            fstat = file_stat(fpath)  # before reading: a later change shows
+            prev = prevfiles.get(modname)
+            if prev is not None and prev[:2] == (fpath, fstat):
+                self._files[modname] = prev  # unchanged
+                modules[modname] = list(prev[2])
+                if prev[3] is not None:
+                    imports[modname] = prev[3]
+
+                continue
+
+            if ext == '.py' and executor is not None:
+                fut = executor.submit(paketize_py, fpath, **pykwargs)
+                self._pending.append((modname, fpath, fstat, ext, modext,
+                                      fut))
+                modules[modname] = None  # keep the place in the ordering
+                continue
+
+            # read and add to modules
+            content = readfile_error(fpath, parser=parser)
+
+            imps = None
+            if ext == '.py':
+                content, imps = process_py(content, **pykwargs)
+                if imps is not None:
+                    imports[modname] = imps
+
+            modules[modname] = entry = [ext, content] + modext
+            self._files[modname] = (fpath, fstat, tuple(entry), imps)
+
+    def collect(self):
+        pending, self._pending = self._pending, []
+        for modname, fpath, fstat, ext, modext, fut in pending:
+            content, imps = fut.result()
+            if imps is not None:
+                self._imports[modname] = imps
+
+            self._modules[modname] = entry = [ext, content] + modext
+            self._files[modname] = (fpath, fstat, tuple(entry), imps)
+
+    @property
+    def modules(self):
+        if self._pending:
+            self.collect()
+
+        return self._modules
+
+    @modules.setter
+    def modules(self, modules):
+        self._modules = modules
+        self._pending = []
+
+    @property
+    def imports(self):
+        if self._pending:
+            self.collect()
+
+        return self._imports
 
-                if minify and ext == '.py':
-                    content = minify_py(content, skipcomments=skipcomments)
+    @imports.setter
+    def imports(self, imports):
+        self._imports = imports
 
-                modules[modname] = [ext, content] + modext
+    # The iter_xxx methods generate the output in fragments, to be written
+    # out without holding it in memory. gen_xxx/get_xxx join them
 
     @staticmethod
-    def gen_autoload(vfs, vfspath, indent=None, is_json=False):
+    def iter_autoload_vfs(vfs, vfspath, indent=None, is_json=False,
+                          footer=Template_Wrapper_Footer, fragments=None):
         prefix = '    '
 
-        vfs_json = json.dumps(vfs, indent=indent) if not is_json else vfs
-        vfs_js = 'var ' + ' = '.join(('$vfs', vfs_json))
-        return ''.join((
-            Template_Wrapper_Header,
-            '{}var vfspath = "{}"\n'.format(prefix, vfspath),
-            textwrap.indent(vfs_js, prefix=prefix),
-            '\n',
-            Template_Wrapper_Footer,
-            ))
+        yield Template_Wrapper_Header
+        yield '{}var vfspath = "{}"\n'.format(prefix, vfspath)
+        yield prefix + 'var $vfs = '
+        if is_json:
+            yield vfs.replace('\n', '\n' + prefix)  # indent the lines
+        else:
+            yield from iter_json(vfs, indent=indent, prefix=prefix,
+                                 fragments=fragments)
 
-    def write_autoload(self, path, **kwargs):
-        makefile_error(path, self.get_autoload(**kwargs))
+        yield '\n'
+        yield footer
 
-    def get_autoload(self, vfspath=None, indent=None):
+    @classmethod
+    def gen_autoload(cls, vfs, vfspath, indent=None, is_json=False,
+                     footer=Template_Wrapper_Footer):
+        return ''.join(cls.iter_autoload_vfs(vfs, vfspath, indent=indent,
+                                             is_json=is_json, footer=footer))
+
+    def iter_autoload(self, vfspath=None, indent=None):
         if vfspath is None:
             vfspath = self.base + '.vfs.js'
-        return self.gen_autoload(self.modules, vfspath, indent=indent)
+        return self.iter_autoload_vfs(self.modules, vfspath, indent=indent,
+                                      fragments=self.fragments)
+
+    def write_autoload(self, path, parser=None, **kwargs):
+        makefile_error(path, self.iter_autoload(**kwargs), parser=parser,
+                       itercontent=True, end='')
+
+    def get_autoload(self, vfspath=None, indent=None):
+        return ''.join(self.iter_autoload(vfspath=vfspath, indent=indent))
 
     @staticmethod
-    def gen_variable(vfs, vfsname, indent=None, is_json=False):
-        vfs_json = json.dumps(vfs, indent=indent) if not is_json else vfs
-        return 'var ' + ' = '.join((vfsname, vfs_json))
+    def iter_variable_vfs(vfs, vfsname, indent=None, is_json=False,
+                          fragments=None):
+        yield 'var {} = '.format(vfsname)
+        if is_json:
+            yield vfs
+        else:
+            yield from iter_json(vfs, indent=indent, fragments=fragments)
+
+    @classmethod
+    def gen_variable(cls, vfs, vfsname, indent=None, is_json=False):
+        return ''.join(cls.iter_variable_vfs(vfs, vfsname, indent=indent,
+                                             is_json=is_json))
+
+    def iter_variable(self, vfsname, indent=None):
+        return self.iter_variable_vfs(self.modules, vfsname, indent=indent,
+                                      fragments=self.fragments)
 
-    def write_vfs_js(self, path, vfsname='$vfs', **kwargs):
-        makefile_error(path, self.get_variable(vfsname=vfsname, **kwargs))
+    def write_vfs_js(self, path, vfsname='$vfs', parser=None, **kwargs):
+        makefile_error(path, self.iter_variable(vfsname=vfsname, **kwargs),
+                       parser=parser, itercontent=True, end='')
 
     def get_variable(self, vfsname, indent=None):
-        return self.gen_variable(self.modules, vfsname, indent=indent)
+        return ''.join(self.iter_variable(vfsname, indent=indent))
 
     @staticmethod
     def gen_raw(vfs, indent=None, is_json=False):
-        return json.dumps(vfs, indent=indent) if not is_json else vfs
+        return ''.join(iter_json(vfs, indent=indent)) if not is_json else vfs
+
+    def iter_raw(self, indent=None):
+        return iter_json(self.modules, indent=indent,
+                         fragments=self.fragments)
+
+    def write_raw(self, path, parser=None, **kwargs):
+        makefile_error(path, self.iter_raw(**kwargs), parser=parser,
+                       itercontent=True, end='')
 
     def get_raw(self, indent=None):
-        return self.gen_raw(self.modules, indent=indent)
+        return ''.join(self.iter_raw(indent=indent))
 
     @staticmethod
-    def scan_imports_vfs(vfs, relative=False, ignores=[]):
+    def scan_imports_vfs(vfs, relative=False, ignores=[], known={}):
+        # known: modname -> absolute imports, which saves parsing the module
+        # if relative imports are not sought
         impfinder = ImportFinder()
+        imps = set()  # set for quicker processing
         for modname, modentry in vfs.items():
             ext, src = modentry[0:2]  # ignore potential "is_package" market
             if ext != '.py':
                 continue
 
-            tree = ast.parse(src)
-            if relative:
-                impfinder.set_package(modname)
+            if not relative and modname in known:
+                for imp in known[modname]:
+                    impfinder.add_import(imp.split('.'))
 
-            impfinder.visit(tree)
+                continue
+
+            package = modname if relative else None
+            imps.update(module_imports(src, package, ImportFinder))
 
+        imps.update(impfinder.get_set_imports())
         # filter own imports
-        imps = impfinder.get_set_imports()  # get set for quicker processing
         for ignore in ignores:
             imps = {x for x in imps if not x.startswith(ignore)}
 
@@ -383,17 +1451,389 @@ class Paketizer:
         newignores = ignores + [self.base] * ignoreself
 
         return self.scan_imports_vfs(self.modules, relative=relative,
-                                     ignores=newignores)
+                                     ignores=newignores,
+                                     known=self.imports)
 
 
 class Paketizer_Json(Paketizer):
+    # The json content is only decoded when the modules are needed (import
+    # scanning, optimization). Until then the raw json is written out as it
+    # is. With braces == 1 (vfs.js, vfs.json) the json is expected to end
+    # with the last closing brace of the content
+
+    # keys of the vfs. The entries are lists (no nested objects) and a key
+    # follows either the opening brace or the end of the previous list. The
+    # json string patterns cannot match inside a string, where " is escaped
+    _re_key_str = r'\s*("[^"\\]*(?:\\.[^"\\]*)*")\s*:'
+    _re_key_1st = re.compile(r'\{' + _re_key_str)
+    _re_keys = re.compile(r'\]\s*,' + _re_key_str)
+
     def __init__(self, content, braces=1):
         idx = -1
         for i in range(braces):
             idx = content.find('{', idx + 1)
 
-        self.modules, _ = json.JSONDecoder().raw_decode(content[idx:])
-        self.base = sorted(self.modules.keys())[0]
+        self.prefix = content[:idx]  # text before the json content
+        self.content = content
+        self._idx = idx
+        self._modules = None
+        self._pending = []
+        self._base = None
+        self.imports = {}
+        self.fragments = JsonFragments()  # encoded modules
+
+        self.raw = None  # json content as it is, if it can be delimited
+        self.vfspath = None  # from an auto_vfs, to render it the same way
+        if braces == 1:
+            self.raw = content[idx:content.rfind('}') + 1]
+        else:
+            m = re.search(r'var vfspath = "([^"]*)"', self.prefix)
+            if m:
+                self.vfspath = m.group(1)
+
+    @property
+    def modules(self):
+        if self._modules is None:
+            decoder = json.JSONDecoder()
+            self._modules, _ = decoder.raw_decode(self.content, self._idx)
+
+        return self._modules
+
+    @modules.setter
+    def modules(self, modules):
+        self.base  # calculate it with the original modules
+        self._modules = modules
+        self.raw = None  # content no longer matches the modules
+
+    @property
+    def base(self):
+        if self._base is None:
+            if self._modules is not None:
+                keys = self._modules.keys()
+            else:  # avoid decoding everything for the names
+                m = self._re_key_1st.match(self.content, self._idx)
+                rkeys = [m.group(1)] if m else []
+                rkeys += self._re_keys.findall(self.content, self._idx)
+                keys = [json.loads(x) for x in rkeys]
+
+            self._base = sorted(keys)[0]
+
+        return self._base
+
+    def iter_autoload(self, vfspath=None, indent=None):
+        if vfspath is None:
+            vfspath = self.vfspath
+
+        if self.raw is None or indent is not None:
+            return super().iter_autoload(vfspath=vfspath, indent=indent)
+
+        if vfspath is None:
+            vfspath = self.base + '.vfs.js'
+        return self.iter_autoload_vfs(self.raw, vfspath, is_json=True)
+
+    def iter_variable(self, vfsname, indent=None):
+        if self.raw is None or indent is not None:
+            return super().iter_variable(vfsname, indent=indent)
+
+        return self.iter_variable_vfs(self.raw, vfsname, is_json=True)
+
+    def iter_raw(self, indent=None):
+        if self.raw is None or indent is not None:
+            return super().iter_raw(indent=indent)
+
+        return iter([self.raw])
+
+
+def entry_module(modules, name):
+    # Module of a vfs entry. Assets (a/b.html) belong to the module named like
+    # them (a.b) if there is one (else None)
+    if '/' not in name:
+        return name
+
+    mod = os.path.splitext(name)[0].replace('/', '.')
+    return mod if mod in modules else None
+
+
+def reachable_modules(pakets, roots, finder=None):
+    # Names of the modules of the pakets (or vfs dicts) reached by importing
+    # roots. finder is the ImportFinder (subclass) used to find the imports
+    finder = finder or ImportFinder
+    modules = {}
+    for paket in pakets:
+        vfs = paket if isinstance(paket, dict) else paket.modules
+        for name, entry in vfs.items():
+            if '/' not in name:
+                modules[name] = entry
+
+    reached = set()
+    todo = list(roots)
+    while todo:
+        name = todo.pop()
+        if name in reached or name not in modules:
+            continue  # done, from the stdlib, anpylar or a class/function
+
+        reached.add(name)
+        entry = modules[name]
+        if entry[0] != '.py':
+            continue  # javascript module, no imports to follow
+
+        if len(entry) > 2:  # package marker, relative imports start here
+            package = name
+        else:
+            package = name.rpartition('.')[0]
+
+        # includes parent packages
+        todo.extend(module_imports(entry[1], package, finder))
+
+    return reached
+
+
+def has_side_effects(src):
+    # True if module level code does more than importing and defining names
+    for node in parse_source(src).body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef,
+                             ast.ClassDef)):
+            continue
+
+        if isinstance(node, ast.Assign):
+            if all(isinstance(x, ast.Name) for x in node.targets):
+                continue
+        elif isinstance(node, ast.Expr):
+            value = node.value
+            if isinstance(value, ast.Constant) and isinstance(value.value,
+                                                              str):
+                continue  # docstring
+
+        return True
+
+    return False
+
+
+def public_names(modules, name):
+    # Names a "from name import *" would import from module name
+    tree = parse_source(modules[name][1])
+    names = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if not isinstance(target, ast.Name):
+                    continue
+
+                if target.id == '__all__':
+                    try:
+                        return set(ast.literal_eval(node.value))
+                    except ValueError:
+                        pass  # not literal, go with the names
+
+                names.add(target.id)
+
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add(alias.asname or alias.name)
+                elif node.level == 1 and node.module:
+                    pkg = name if len(modules[name]) > 2 else \
+                        name.rpartition('.')[0]
+
+                    modname = '.'.join((pkg, node.module))
+                    if modname in modules:
+                        names |= public_names(modules, modname)
+
+    return {x for x in names if not x.startswith('_')}
+
+
+class PackageInit:
+    # Relates the names defined by the __init__ of a package to the relative
+    # imports providing them and regenerates it for a selection of modules
+    def __init__(self, modules, package):
+        self.package = package
+        src = modules[package][1]
+        self.lines = lines = src.splitlines(True)
+
+        tree = parse_source(src)
+        self.names = names = {}  # name -> module providing it
+        self.stmts = stmts = []  # (source, modules) of each statement
+        self.side_effects = set()  # modules which have to be kept
+
+        body = tree.body
+        ends = [x.lineno - 1 for x in body[1:]] + [len(lines)]
+        for node, end in zip(body, ends):
+            stmt = ''.join(lines[node.lineno - 1:end])
+            mods = set()
+            if isinstance(node, ast.ImportFrom) and node.level == 1:
+                for alias in node.names:
+                    if node.module is None:  # from . import xx
+                        modname = '.'.join((package, alias.name))
+                        anames = [alias.asname or alias.name]
+                    else:
+                        modname = '.'.join((package, node.module))
+                        if alias.name == '*':
+                            anames = public_names(modules, modname)
+                        else:
+                            anames = [alias.asname or alias.name]
+
+                    if modname not in modules:
+                        continue  # name imported from a module, not in vfs
+
+                    mods.add(modname)
+                    for aname in anames:
+                        names[aname] = modname
+
+                    if has_side_effects(modules[modname][1]):
+                        self.side_effects.add(modname)
+
+            stmts.append((stmt, mods))
+
+        self.header = ''.join(lines[:body[0].lineno - 1]) if body else src
+
+    def providers(self, names):
+        # modules needed to provide names (including those with side effects)
+        mods = set(self.side_effects)
+        mods.update(self.names[x] for x in names if x in self.names)
+        return mods
+
+    def source(self, modules):
+        # source with only the imports of modules (other code is kept)
+        out = [self.header]
+        out += [stmt for stmt, mods in self.stmts if mods <= set(modules)]
+        return ''.join(out)
+
+
+class PackageUsageFinder(ast.NodeVisitor):
+    # Gathers which names of a package the visited modules use and which
+    # submodules they import directly. If all names could be in use (star
+    # import, the package used as an object) everything is set to True
+    def __init__(self, package):
+        self.package = package
+        self.names = set()
+        self.modules = set()
+        self.everything = False
+        self._aliases = set()  # names bound to the package
+
+    def visit_Module(self, node):
+        self._aliases = set()  # new module, new names
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        pkg = self.package
+        for alias in node.names:
+            if alias.name == pkg:
+                self._aliases.add(alias.asname or pkg)
+            elif alias.name.startswith(pkg + '.'):
+                self.modules.add(alias.name)
+                if not alias.asname:  # import pkg.xx binds pkg
+                    self._aliases.add(pkg)
+
+    def visit_ImportFrom(self, node):
+        pkg = self.package
+        if node.level or not node.module:
+            return  # relative, not the package
+
+        if node.module == pkg:
+            for alias in node.names:
+                if alias.name == '*':
+                    self.everything = True
+                else:
+                    self.names.add(alias.name)
+
+        elif node.module.startswith(pkg + '.'):
+            self.modules.add(node.module)
+            for alias in node.names:  # name could be a module
+                self.modules.add('.'.join((node.module, alias.name)))
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id in self._aliases:
+            self.names.add(node.attr)  # pkg.xxx
+        else:
+            self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in self._aliases:
+            self.everything = True  # the package is used as an object
+
+
+class PythonScriptFinder(html.parser.HTMLParser):
+    # Collects the python scripts of a html page: the content of the inline
+    # ones and the src of the others
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scripts = []
+        self.srcs = []
+        self._inscript = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'script':
+            attrs = dict(attrs)
+            stype = attrs.get('type', '')
+            self._inscript = stype in ('text/python', 'text/python3')
+            if self._inscript:
+                if attrs.get('src'):
+                    self.srcs.append(attrs['src'])
+                    self._inscript = False  # the content is not run
+                else:
+                    self.scripts.append('')
+
+    def handle_endtag(self, tag):
+        if tag == 'script':
+            self._inscript = False
+
+    def handle_data(self, data):
+        if self._inscript:
+            self.scripts[-1] += data
+
+
+def _script_path(basedir, src):
+    # Path in basedir of the script at (relative) url src or None
+    if basedir is None or re.match(r'[a-zA-Z][a-zA-Z0-9+.-]*:|//', src):
+        return None  # not resolvable or somewhere else
+
+    src = re.split(r'[?#]', src, 1)[0].lstrip('/')
+    path = os.path.join(basedir, *src.split('/'))
+    return path if os.path.isfile(path) else None
+
+
+def bootstrap_imports(content, basedir=None):
+    # Modules imported to start the application from the page in content.
+    # Without python scripts, anpylar_js imports BOOTSTRAP_MODULE. The
+    # scripts with src are read from basedir (the dir of the page). If one
+    # cannot be read, None is returned: the imports cannot be known.
+    # ValueError is raised if a script is not valid python
+    finder = PythonScriptFinder()
+    finder.feed(content)
+    finder.close()
+    if not finder.scripts and not finder.srcs:
+        return [BOOTSTRAP_MODULE]
+
+    scripts = [(None, x) for x in finder.scripts]
+    for src in finder.srcs:
+        path = _script_path(basedir, src)
+        if path is None:
+            logging.warning('Python script %s cannot be read', src)
+            return None
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                scripts.append((src, f.read()))
+        except (OSError, ValueError) as e:
+            logging.warning('Python script %s cannot be read: %s', src, e)
+            return None
+
+    impfinder = ImportFinder()
+    for src, script in scripts:
+        try:
+            tree = ast.parse(textwrap.dedent(script))
+        except SyntaxError as e:
+            raise ValueError('python script {}line {}: {}'.format(
+                src + ' ' if src else '', e.lineno, e.msg))
+
+        impfinder.visit(tree)
+
+    return sorted(impfinder.iter_imports())
 
 
 ######################################################################
@@ -453,3 +1893,11 @@ class ImportFinder(ast.NodeVisitor):
 
     def iter_imports(self):
         return iter(self._imps)
+
+
+class EagerImportFinder(ImportFinder):
+    # Imports run when the module is imported: those in functions are not
+    def visit_FunctionDef(self, node):
+        pass
+
+    visit_AsyncFunctionDef = visit_Lambda = visit_FunctionDef
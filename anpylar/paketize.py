@@ -10,16 +10,28 @@ import logging
 import os.path
 import sys
 
+from .cache import BuildCache
 from .logconfig import logconfig
-from .packaging import Paketizer, VFS_JSON_EXT, VFS_JS_EXT, AUTO_VFS_JS_EXT
-from .utils import makefile_error
+from .packaging import Paketizer, make_executor
+from .packaging import VFS_JSON_EXT, VFS_JS_EXT, AUTO_VFS_JS_EXT
+from .result import BuildResult
+from .utils import jobs_error
 
 
 def run(pargs=None, name=None):
     args, parser = parse_args(pargs=pargs, name=name)
 
     logconfig(args.quiet, args.verbose)  # configure logging
+    build(args, parser)
 
+
+def build(args, parser, cache=None, result=None):
+    # Returns a BuildResult (the one given, if any)
+    if result is None:
+        result = BuildResult('paketize')
+
+    jobs_error(args.jobs, parser)
+    result.phase('paketize')
     dnorm = os.path.normpath(args.dir)
     if not os.path.isdir(dnorm):
         logging.error('%s is not a valid directory', dnorm)
@@ -28,18 +40,37 @@ def run(pargs=None, name=None):
     extensions = [x.strip().lower() for x in args.extensions.split(',')]
 
     if args.add_extension:
-        for ext in args.add_extensions:
+        for ext in args.add_extension:
             extensions.append(ext.strip().lower())
 
     logging.debug('Paketizing extensions %s', str(extensions))
 
+    if args.no_cache:
+        cache = None
+    elif cache is None:
+        cache = BuildCache(args.cache_dir or None)
+
+    if cache is not None:
+        logging.debug('Using cache at: %s', cache.path)
+
+    executor = make_executor(args.jobs)
+
     logging.info('Paketizing %s', dnorm)
-    paket = Paketizer(dnorm, extensions=extensions,
-                      minify=not args.no_minify,
-                      skipcomments=not args.no_headers,
-                      parser=parser,
-                      usename=args.pkg_name,
-                      asset_prefix=args.asset_prefix)
+    try:
+        paket = Paketizer(dnorm, extensions=extensions,
+                          minify=not args.no_minify,
+                          skipcomments=not args.no_headers,
+                          parser=parser,
+                          usename=args.pkg_name,
+                          asset_prefix=args.asset_prefix,
+                          cache=cache,
+                          executor=executor)
+
+        if executor is not None:
+            paket.collect()  # results in place before shutting down
+    finally:
+        if executor is not None:  # no worker processes left behind
+            executor.shutdown()
 
     logging.debug('Paket processed')
 
@@ -58,15 +89,15 @@ def run(pargs=None, name=None):
 
         logging.debug('No Outfile, calculated name %s', fout)
 
+    result.phase('write')
     if args.json_raw:
         logging.debug('Writing paket in raw JSON output')
-        content = paket.get_raw(indent=args.indent)
-        makefile_error(fout, content, parser=parser)
+        paket.write_raw(fout, indent=args.indent, parser=parser)
     elif args.vfs_js:
         logging.debug('Writing paket in vfs.js format with var_name: %s',
                       args.var_name)
-        content = paket.get_variable(args.var_name, indent=args.indent)
-        makefile_error(fout, content, parser=parser)
+        paket.write_vfs_js(fout, args.var_name, indent=args.indent,
+                           parser=parser)
     else:  # auto-vfs option (default)
         logging.debug('Writing paket in auto_vfs.js format')
         vfspath = args.vfspath or os.path.basename(fout)
@@ -77,11 +108,13 @@ def run(pargs=None, name=None):
 
             vfspath = vfspath + VFS_JS_EXT
 
-        content = paket.get_autoload(vfspath, indent=args.indent)
-        makefile_error(fout, content, parser=parser)
+        paket.write_autoload(fout, vfspath=vfspath, indent=args.indent,
+                             parser=parser)
 
     logging.info('Wrote paket to %s', fout)
+    result.finish([fout] if fout != '-' else [])
     logging.info('Done')
+    return result
 
 
 def parse_args(pargs=None, name=None):
@@ -152,6 +185,20 @@ def parse_args(pargs=None, name=None):
                         help=('do not remove first 2 lines of comments in'
                               'python files'))
 
+    pgroup = parser.add_argument_group(title='Parallel processing')
+    pgroup.add_argument('--jobs', '-j', action='store', default=1, type=int,
+                        help=('Number of processes for paketizing files. '
+                              '0 uses as many as cpus are available'))
+
+    pgroup = parser.add_argument_group(title='Cache options')
+    pgroup.add_argument('--no-cache', action='store_true',
+                        help=('Do not use the cache of minified files and '
+                              'scanned imports'))
+
+    pgroup.add_argument('--cache-dir', action='store', default='',
+                        help=('Directory for the cache. Default: '
+                              '$XDG_CACHE_HOME/anpylar or ~/.cache/anpylar'))
+
     pgroup = parser.add_mutually_exclusive_group()
     pgroup.add_argument('--quiet', '-q', action='store_true',
                         help='Remove output (errors will be reported)')
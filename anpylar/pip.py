@@ -16,6 +16,7 @@ import sys
 import tempfile
 
 from .logconfig import logconfig
+from .result import BuildResult
 from .utils import makefile_error, readfile_error
 
 
@@ -23,7 +24,15 @@ def run(pargs=None, name=None):
     args, parser = parse_args(pargs=pargs, name=name)
 
     logconfig(args.quiet, args.verbose)  # configure logging
+    build(args, parser)
 
+
+def build(args, parser, result=None):
+    # Returns a BuildResult (the one given, if any)
+    if result is None:
+        result = BuildResult('pip')
+
+    result.phase('prepare')
     target = os.path.normpath(args.target)
     logging.info('Target for pip installation is: %s', target)
 
@@ -83,6 +92,7 @@ def run(pargs=None, name=None):
         pip_cmd += args.packages  # packages to install
 
         logging.debug('pip command to execute: %s', str(pip_cmd))
+        result.phase('install')
         try:
             subprocess.check_call(pip_cmd)
         except subprocess.CalledProcessError as e:
@@ -149,6 +159,7 @@ def run(pargs=None, name=None):
                 logging.error(errmsg, dst, str(e))
                 sys.exit(1)
 
+        result.phase('move')
         logging.info('Moving pip packages to final destination')
         # dst is in place, go for installation
         for dname in dnames_pkgs:
@@ -181,10 +192,14 @@ def run(pargs=None, name=None):
                 logging.error(errmsg, dpath, dstpath, str(e))
                 sys.exit(1)
 
+    outputs = [os.path.join(dst, x) for x in dnames_pkgs]
     if args.no_package_json:
         logging.info('Requested no update of package.json. Exiting')
+        result.finish(outputs)
         sys.exit(0)
 
+    result.phase('package.json')
+
     # let's assume is a dict (it should be)
     logging.debug('Getting packages entry')
     json_pkgs = pjson.get('packages', [])
@@ -223,6 +238,8 @@ def run(pargs=None, name=None):
     # Update the file with the new json
     pjsontxt = json.dumps(pjson, indent=4)
     makefile_error(pjsonpath, pjsontxt, parser=parser)
+    result.finish(outputs + [pjsonpath])
+    return result
 
 
 def parse_args(pargs=None, name=None):
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import collections
+import os
+import os.path
+import time
+
+
+class BuildResult:
+    # What a build did. Filled in by the build functions of the commands:
+    #
+    #   - outputs: paths of the files/directories written
+    #   - sizes: path -> size of every file in the outputs
+    #   - timings: phase -> seconds, in the order the phases ran
+    #   - skipped: True if nothing was done because the inputs and the
+    #     outputs were unchanged (the outputs are those of the last build)
+
+    def __init__(self, command):
+        self.command = command
+        self.outputs = []
+        self.sizes = collections.OrderedDict()
+        self.timings = collections.OrderedDict()
+        self.skipped = False
+        self._phase = None
+        self._start = None
+
+    def __repr__(self):
+        return '<BuildResult {} outputs={} size={} time={:.3f}s{}>'.format(
+            self.command, len(self.outputs), self.size, self.time,
+            ' skipped' if self.skipped else '')
+
+    def phase(self, name):
+        # ends the running phase (if any) and starts timing name (if any)
+        now = time.perf_counter()
+        if self._phase is not None:
+            elapsed = now - self._start
+            self.timings[self._phase] = self.timings.get(self._phase, 0.0)
+            self.timings[self._phase] += elapsed
+
+        self._phase, self._start = name, now
+
+    def finish(self, outputs, skipped=False):
+        self.phase(None)
+        self.skipped = skipped
+        self.outputs = list(outputs)
+        for output in self.outputs:
+            if os.path.isfile(output):
+                self.sizes[output] = os.path.getsize(output)
+                continue
+
+            for root, dnames, fnames in os.walk(output):
+                dnames.sort()
+                for fname in sorted(fnames):
+                    fpath = os.path.join(root, fname)
+                    try:
+                        self.sizes[fpath] = os.path.getsize(fpath)
+                    except OSError:
+                        pass  # vanished
+
+    @property
+    def size(self):
+        return sum(self.sizes.values())
+
+    @property
+    def time(self):
+        return sum(self.timings.values())
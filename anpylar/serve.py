@@ -6,11 +6,12 @@
 # can be found in the LICENSE file at http://anpylar.com/mit-license
 ###############################################################################
 import argparse
+import collections
 import datetime
 import email.utils
 from http import HTTPStatus
 from http.server import SimpleHTTPRequestHandler, HTTPServer
-import io
+import itertools
 import json
 import logging
 import mimetypes
@@ -18,16 +19,32 @@ import operator
 import os
 import os.path
 import posixpath
+import queue
+import socket
 import socketserver
+import statistics
+import struct
 import sys
+import tarfile
+import threading
 import time
 from urllib.parse import urlencode, urlparse, parse_qs
 import webbrowser
+import zipfile
 
+from .archive import ArchiveReader, is_archive
 from .logconfig import logconfig
 
-from .packaging import Bundler
+from .packaging import Bundler, StdlibIndex, is_hashed_name
 from .utils import readfile_error, win_wait_for_parent
+from .watcher import FileWatcher
+
+
+# Prefix for the urls of the development services
+_DEV_URL = '/__anpylar__/'
+_DEV_EVENTS = _DEV_URL + 'events'
+_DEV_TIMINGS = _DEV_URL + 'timings'
+_DEV_IMPORTS = _DEV_URL + 'imports'
 
 
 Template_Auto_Index = '''
@@ -66,6 +83,116 @@ def loadmodule(modpath, modname=''):
     return (mod, None)
 
 
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True  # long-lived event streams must not block exit
+
+
+class EventChannel:
+    # Distributes the notifications to the connected event streams, each of
+    # which has a queue and waits on it
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = []
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self._lock:
+            self._queues.append(q)
+
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._queues.remove(q)
+
+    def publish(self, event, data):
+        msg = 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
+        with self._lock:
+            for q in self._queues:
+                q.put(msg)
+
+
+class StartupTimings:
+    # Aggregates the startup timings (in ms) reported by browsers, keeping
+    # them apart for each bundle hash
+    METRICS = ('parse', 'vfs', 'bootstrap')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = collections.OrderedDict()
+
+    def add(self, sample):
+        bhash = str(sample.get('hash'))
+        with self._lock:
+            samples = self._samples.get(bhash)
+            if samples is None:
+                samples = {m: [] for m in self.METRICS}
+                self._samples[bhash] = samples
+
+            for m in self.METRICS:
+                val = sample.get(m)
+                if isinstance(val, (int, float)):
+                    samples[m].append(float(val))
+
+        return bhash
+
+    @staticmethod
+    def _stats(vals):
+        vals = sorted(vals)
+        n = len(vals)
+        if not n:
+            return {'n': 0, 'median': None, 'p95': None}
+
+        p95 = vals[max(0, -(-95 * n // 100) - 1)]  # nearest rank
+        return {'n': n, 'median': statistics.median(vals), 'p95': p95}
+
+    def summary(self, bhash=None):
+        with self._lock:
+            hashes = [bhash] if bhash is not None else list(self._samples)
+            return collections.OrderedDict(
+                (h, {m: self._stats(v) for m, v in self._samples[h].items()})
+                for h in hashes if h in self._samples
+            )
+
+    def format(self, bhash):
+        summ = self.summary(bhash)[bhash]
+        out = []
+        for m in self.METRICS:
+            st = summ[m]
+            if st['n']:
+                out.append('{} median {:.1f} ms / p95 {:.1f} ms'.format(
+                    m, st['median'], st['p95']))
+
+        n = max(x['n'] for x in summ.values())
+        return 'bundle {} ({} samples): {}'.format(bhash, n, ' | '.join(out))
+
+
+class ImportTrace:
+    # Records the modules the browser reports as imported and keeps them in
+    # a trace file for webpack/bundle. An existing trace is extended
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.modules = set()
+        if os.path.isfile(path):
+            self.modules.update(Bundler.read_traces([path]))
+
+    def add(self, modules):
+        with self._lock:
+            newmods = set(modules) - self.modules
+            if newmods:
+                self.modules.update(newmods)
+                content = json.dumps({'modules': sorted(self.modules)},
+                                     indent=4)
+                tmppath = self.path + '.tmp'
+                with open(tmppath, 'w', encoding='utf-8') as f:
+                    f.write(content)
+
+                os.replace(tmppath, self.path)
+
+        return newmods
+
+
 class RequestHandler(SimpleHTTPRequestHandler):
     # protocol_version = 'HTTP/1.0'
 
@@ -95,6 +222,17 @@ class RequestHandler(SimpleHTTPRequestHandler):
         self._write('</body></html>')
         return None
 
+    def _badrequest(self, reason):
+        # The body may not have been read: the connection is not reused
+        logging.debug('returning 400: %s', reason)
+        self.close_connection = True
+        self.send_response(HTTPStatus.BAD_REQUEST)
+        self.send_header('Content-type', 'text/plain; charset=utf-8')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self._write(reason)
+        return None
+
     def _fullsendfile(self, fname):
         logging.debug('Sending file: %s', fname)
         with open(fname, 'rb') as f:  # bytes needed for wfile.write
@@ -109,7 +247,7 @@ class RequestHandler(SimpleHTTPRequestHandler):
         self._write(fcontent, convert=False)  # read as bytes already
 
     def _endfile(self, f):
-        if f is not None:
+        if hasattr(f, 'close'):
             f.close()
 
     def _sendfile(self, f):
@@ -118,16 +256,86 @@ class RequestHandler(SimpleHTTPRequestHandler):
             try:
                 if hasattr(f, 'read'):
                     fcontent = f.read()
+                elif hasattr(f, '__next__'):
+                    for chunk in f:  # generator of already encoded chunks
+                        self._write(chunk, convert=False)
+
+                    return
                 else:
                     fcontent = f
-            except:
-                pass
-            else:
+
                 self._write(fcontent, convert=False)  # read as bytes already
+            except ConnectionError:
+                logging.debug('Client closed the connection: %s', self.path)
+                self.close_connection = True
+            except Exception:
+                # the headers are out (a bundle may be half sent): the client
+                # must not take what it got for the whole content
+                logging.exception('Failed sending: %s', self.path)
+                self._abort()
             finally:
                 if hasattr(f, 'close'):
                     f.close()
 
+    def _abort(self):
+        # Resets the connection, instead of the orderly shutdown done by the
+        # server, which would let an unchunked response look complete
+        self.close_connection = True
+        try:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                       struct.pack('ii', 1, 0))
+        except OSError:
+            pass  # already gone
+
+        self.connection.close()  # done when the handler closes its files
+
+    def _sendchunked(self, fragments, ctype, encoding='utf-8'):
+        logging.debug('sending content (in chunks)')
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            # the class default is HTTP/1.0, which knows nothing about chunks
+            self.protocol_version = 'HTTP/1.1'
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', ctype)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+
+        self.send_header('Connection', 'close')  # no length, close delimits
+        self.end_headers()
+        return self._iterchunks(fragments, encoding, chunked)
+
+    CHUNK_SIZE = 64 * 1024  # fragments are gathered up to this size
+
+    def _iterchunks(self, fragments, encoding, chunked):
+        size = 0
+        buf, buflen = [], 0
+        for fragment in itertools.chain(fragments, [None]):
+            if fragment is not None:
+                bfragment = fragment.encode(encoding)
+                buf.append(bfragment)
+                buflen += len(bfragment)
+                if buflen < self.CHUNK_SIZE:
+                    continue
+
+            if not buflen:
+                continue  # an empty chunk would signal the end
+
+            bchunk = b''.join(buf)
+            buf, buflen = [], 0
+            size += len(bchunk)
+            if chunked:
+                yield '{:X}\r\n'.format(len(bchunk)).encode('ascii')
+                yield bchunk
+                yield b'\r\n'
+            else:
+                yield bchunk
+
+        if chunked:
+            yield b'0\r\n\r\n'
+
+        logging.debug('sent content of size: %d', size)
+
     def _sendcontent(self, content, ctype, encoding='utf-8'):
         bcontent = content.encode(encoding)
         logging.debug('sending content (in bytes)')
@@ -137,6 +345,135 @@ class RequestHandler(SimpleHTTPRequestHandler):
         self.end_headers()
         return bcontent
 
+    def _sendstdlib(self, content, path):
+        stdlib = self._stdlib_index()
+        IF_MOD = 'If-Modified-Since'
+        if IF_MOD in self.headers:
+            try:
+                ims = email.utils.parsedate_to_datetime(self.headers[IF_MOD])
+            except (TypeError, IndexError, OverflowError, ValueError):
+                pass  # ignore ill-formed values
+            else:
+                if ims.timestamp() >= int(stdlib.mtime):
+                    self.send_response(HTTPStatus.NOT_MODIFIED)
+                    self.end_headers()
+                    return None
+
+        ctype, _ = mimetypes.guess_type(path)
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', ctype or 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Last-Modified', self.date_time_string(stdlib.mtime))
+        self.send_header('Cache-Control', 'max-age=3600')
+        self.end_headers()
+        return content
+
+    def _sendmember(self, member):
+        # A member of the served archive. Precompressed variants (.br/.gz
+        # members) and deflated zip members are sent as they are stored if
+        # the client accepts the encoding
+        archive = self.cliargs._archive
+        IF_MOD = 'If-Modified-Since'
+        if IF_MOD in self.headers:
+            try:
+                ims = email.utils.parsedate_to_datetime(self.headers[IF_MOD])
+            except (TypeError, IndexError, OverflowError, ValueError):
+                pass  # ignore ill-formed values
+            else:
+                if ims.timestamp() >= int(archive.mtime):
+                    self.send_response(HTTPStatus.NOT_MODIFIED)
+                    self.end_headers()
+                    return None
+
+        accepted = self.headers.get('Accept-Encoding', '')
+        accepted = set(x.split(';')[0].strip() for x in accepted.split(','))
+
+        encoding, content = None, None
+        for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+            variant = archive.get(member.name + ext)
+            if enc in accepted and variant is not None:
+                logging.debug('Sending %s variant of %s', enc, member.name)
+                encoding, content = enc, [archive.read(variant)]
+                break
+        else:
+            if 'gzip' in accepted:
+                content = archive.gzipped(member)
+                encoding = 'gzip' if content is not None else None
+
+            if content is None:
+                content = [archive.read(member)]
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', self.guess_type(member.name))
+        self.send_header('Content-Length', str(sum(len(x) for x in content)))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Last-Modified', self.date_time_string(archive.mtime))
+        if is_hashed_name(posixpath.basename(member.name)):
+            self.send_header('Cache-Control',
+                             'public, max-age=31536000, immutable')
+
+        self.end_headers()
+        return iter(content)
+
+    def _checkmember(self, rootpath, query):
+        # like the checks for files in the application directory
+        archive = self.cliargs._archive
+        relpath = rootpath[1:]
+        if rootpath == '/':
+            member = archive.get(self.cliargs.index)
+            if member is None:
+                return self._notfound()
+
+            return self._sendmember(member)
+
+        member = archive.get(relpath)
+        if member is None:
+            return self._missing(posixpath.basename(relpath), query)
+
+        if posixpath.basename(relpath) == self.cliargs.index:
+            logging.debug('Index file, redirecting')
+            return self._redir(posixpath.dirname(rootpath), query)
+
+        return self._sendmember(member)
+
+    def _stdlib_index(self):
+        cliargs = self.cliargs
+        with cliargs._stdlib_lock:  # built once, by the 1st request
+            if cliargs._stdlib_index is None:
+                logging.info('Indexing stdlib for on demand serving')
+                cliargs._stdlib_index = StdlibIndex(cliargs.dev_stdlib)
+
+        return cliargs._stdlib_index
+
+    def _sendevents(self):
+        channel = self.cliargs._events
+        logging.debug('Opening event stream')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        q = channel.subscribe()
+        try:
+            self._write('retry: 2000\n\n')  # reconnect quickly on restarts
+            while True:
+                try:
+                    msg = q.get(timeout=15.0)
+                except queue.Empty:
+                    msg = ': keep-alive\n\n'  # comment, ignored by client
+
+                self._write(msg)
+                self.wfile.flush()
+        except (ConnectionError, OSError):
+            logging.debug('Event stream closed by client')
+        finally:
+            channel.unsubscribe(q)
+
+        return None
+
     def _checkfile(self, path):
         logging.debug('entering checkfile')
         try:
@@ -184,6 +521,11 @@ class RequestHandler(SimpleHTTPRequestHandler):
             self.send_header('Content-Length', str(fs[6]))
             self.send_header('Last-Modified',
                              self.date_time_string(fs.st_mtime))
+            if is_hashed_name(os.path.basename(path)):
+                # name changes with the content: can be cached forever
+                self.send_header('Cache-Control',
+                                 'public, max-age=31536000, immutable')
+
             self.end_headers()
             return f
         except Exception as e:
@@ -221,34 +563,53 @@ class RequestHandler(SimpleHTTPRequestHandler):
         targetname = posixpath.basename(target)
         logging.debug('target: %s', target)
 
+        if cliargs.dev and rootpath.startswith(_DEV_URL):
+            logging.debug('development service sought: %s', rootpath)
+            if rootpath == _DEV_EVENTS and cliargs._events is not None:
+                if self.command == 'GET':
+                    return self._sendevents()
+
+            elif rootpath == _DEV_TIMINGS and cliargs.dev_timings:
+                content = json.dumps(cliargs._timings.summary())
+                return self._sendcontent(content, 'application/json')
+
+            return self._notfound()
+
         if cliargs.api_url:
             logging.debug('checking api_url: %s', cliargs.api_url)
             if rootpath.startswith(cliargs.api_url):
                 logging.debug('api url matched for get. Returning data')
 
-                if query:
-                    logging.debug('api: get with query: %s', query)
-                    qd = parse_qs(query)
-                    res = list(cliargs.api_idata.values())
-                    for k, vs in qd.items():  # ret is key / list of values
-                        igetter = operator.itemgetter(k)
-                        for v in vs:
-                            res = [x for x in res if v in igetter(x)]
-
-                    content = json.dumps(res)
-
-                elif len(rp) > len(cliargs.api_url):  # api_url is normalized
-                    # return the id (only thing left in url)
-                    epath = posixpath.basename(rootpath)
-                    logging.debug('api: get with extra path: %s', epath)
-                    key = int(epath)
-                    content = json.dumps(cliargs.api_idata.get(int(key), {}))
-                else:
-                    logging.debug('api: get ... mean an lean')
-                    content = json.dumps(list(cliargs.api_idata.values()))
+                with cliargs._api_lock:  # requests run in threads
+                    if query:
+                        logging.debug('api: get with query: %s', query)
+                        qd = parse_qs(query)
+                        res = list(cliargs.api_idata.values())
+                        # ret is key / list of values
+                        for k, vs in qd.items():
+                            igetter = operator.itemgetter(k)
+                            for v in vs:
+                                res = [x for x in res if v in igetter(x)]
+
+                        content = json.dumps(res)
+
+                    # api_url is normalized
+                    elif len(rp) > len(cliargs.api_url):
+                        # return the id (only thing left in url)
+                        epath = posixpath.basename(rootpath)
+                        logging.debug('api: get with extra path: %s', epath)
+                        key = int(epath)
+                        content = json.dumps(cliargs.api_idata.get(key, {}))
+                    else:
+                        logging.debug('api: get ... mean an lean')
+                        res = list(cliargs.api_idata.values())
+                        content = json.dumps(res)
 
                 return self._sendcontent(content, 'application/json')
 
+        if cliargs._archive is not None:
+            return self._checkmember(rootpath, query)
+
         is_anpylar = targetname == 'anpylar.js'
 
         if cliargs.auto_serve:
@@ -283,14 +644,23 @@ class RequestHandler(SimpleHTTPRequestHandler):
                 if targetname == 'anpylar.js':
                     logging.debug('serving development anpylar.js')
                     anpylar_js = self._make_bundle()
-                    return self._sendcontent(anpylar_js, 'text/javascript')
+                    return self._sendchunked(anpylar_js, 'text/javascript')
 
             logging.debug('Other file, returning')
             return self._checkfile(target)  # no index file, return it
 
         # else
         logging.debug('Neither root nor real file sought, checking imports')
-        bname = targetname
+        if cliargs.dev_stdlib_on_demand:
+            content = self._stdlib_index().find(relpath)
+            if content is not None:
+                logging.debug('Serving stdlib module on demand: %s', relpath)
+                return self._sendstdlib(content, relpath)
+
+        return self._missing(targetname, query)
+
+    def _missing(self, bname, query):
+        # neither the index nor a file was sought
         _, ext = posixpath.splitext(bname)
         logging.debug('bname is: %s and ext %s:', bname, ext)
         if ext == '.py' and query:  # import attempt and was no file
@@ -319,6 +689,9 @@ class RequestHandler(SimpleHTTPRequestHandler):
         self.cliargs = cliargs = self.server.cliargs  # cache lookup
         logging.debug('-' * 50)
         logging.debug('POST request')
+        if cliargs.dev and self.path.startswith(_DEV_URL):
+            return self._dev_post()
+
         if not cliargs.api_url:
             logging.debug('POST and no api_url defined')
             logging.debug('POST headers: %s', str(self.headers))
@@ -344,12 +717,63 @@ class RequestHandler(SimpleHTTPRequestHandler):
         clength = int(self.headers['Content-Length'])
         data = self.rfile.read(clength)
         d = json.loads(data)
-        cliargs.api_hidx = idx = cliargs.api_hidx + 1  # inc id
-        d[cliargs.api_index] = idx
-        cliargs.api_idata[idx] = d
-        content = json.dumps(d)
+        with cliargs._api_lock:  # requests run in threads
+            cliargs.api_hidx = idx = cliargs.api_hidx + 1  # inc id
+            d[cliargs.api_index] = idx
+            cliargs.api_idata[idx] = d
+            content = json.dumps(d)
         return self._sendfile(self._sendcontent(content, 'application/json'))
 
+    def _dev_post(self):
+        cliargs = self.cliargs
+        rootpath = urlparse(self.path).path
+        logging.debug('development service post: %s', rootpath)
+        if rootpath == _DEV_TIMINGS and cliargs.dev_timings:
+            service = self._post_timings
+        elif rootpath == _DEV_IMPORTS and cliargs._trace is not None:
+            service = self._post_imports
+        else:
+            return self._notfound()
+
+        try:
+            clength = int(self.headers['Content-Length'] or 0)
+            if clength < 0:
+                raise ValueError('negative Content-Length')
+
+            d = json.loads(self.rfile.read(clength).decode('utf-8'))
+        except ValueError as e:  # also for the decoding
+            return self._badrequest('Ill-formed body: {}'.format(e))
+
+        if not isinstance(d, dict):
+            return self._badrequest('The body is not a json object')
+
+        return service(d)
+
+    def _post_timings(self, d):
+        timings = self.cliargs._timings
+        bhash = timings.add(d)
+        logging.info('Startup timings %s', timings.format(bhash))
+        return self._nocontent()
+
+    def _post_imports(self, d):
+        trace = self.cliargs._trace
+        modules = d.get('modules', [])
+        if (not isinstance(modules, list) or
+                not all(isinstance(x, str) for x in modules)):
+            return self._badrequest('modules is not a list of names')
+
+        newmods = trace.add(modules)
+        if newmods:
+            logging.info('Import trace: %d new modules (total %d) in %s',
+                         len(newmods), len(trace.modules), trace.path)
+
+        return self._nocontent()
+
+    def _nocontent(self):
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.end_headers()
+        return None
+
     def do_DELETE(self):
         self.cliargs = cliargs = self.server.cliargs  # cache lookup
         logging.debug('-' * 50)
@@ -373,7 +797,9 @@ class RequestHandler(SimpleHTTPRequestHandler):
         logging.debug('api url matched for delete')
 
         key = int(posixpath.basename(posixpath.normpath(rootpath)))
-        del cliargs_api_idata[key]
+        with cliargs._api_lock:  # requests run in threads
+            del cliargs.api_idata[key]
+
         content = json.dumps({})
         return self._sendfile(self._sendcontent(content, 'application/json'))
 
@@ -404,11 +830,15 @@ class RequestHandler(SimpleHTTPRequestHandler):
         clength = int(self.headers['Content-Length'])
         data = self.rfile.read(clength)
         d = json.loads(data)
-        cliargs.api_idata[key].update(**d)
+        with cliargs._api_lock:  # requests run in threads
+            cliargs.api_idata[key].update(**d)
+
         content = json.dumps(d)
         return self._sendfile(self._sendcontent(content, 'application/json'))
 
     def _make_bundle(self):
+        # generator: nothing is done until the headers are out and the 1st
+        # fragment is requested
         cliargs = self.cliargs
         logging.debug('Creating on-the-fly anpylar.js')
         bundler = Bundler()
@@ -460,16 +890,30 @@ class RequestHandler(SimpleHTTPRequestHandler):
             # no dir ... either specific vfs or internal, is in the bundle
             bundler.do_anpylar_vfs()
 
+        if cliargs._events is not None:
+            logging.debug('- subscribing to live-reload events')
+            bundler.set_dev_options(events=_DEV_EVENTS)
+
+        if cliargs.dev_timings:
+            logging.debug('- instrumenting startup timings')
+            bundler.set_dev_options(timings=_DEV_TIMINGS)
+
+        if cliargs._trace is not None:
+            logging.debug('- recording imports to: %s', cliargs._trace.path)
+            bundler.set_dev_options(imports=_DEV_IMPORTS)
+
+        if cliargs.dev_stdlib_on_demand:
+            logging.debug('- stdlib modules will be served on demand')
+            bundler.set_stdlib_on_demand(True)
+
         if cliargs.dev_optimize:
             logging.debug('- Optimizing bundle')
             bundler.optimize_stdlib()
 
-        fout = io.StringIO()
-        bundler.write_bundle(fout)
-        fout.seek(0)  # reset the stream to read the value from the start
-        content = fout.getvalue()
-        logging.debug('size of fout is: %d', len(content))
-        return content
+        try:
+            yield from bundler.iter_bundle()
+        finally:
+            bundler.close()
 
 
 def run(pargs=None, name=None):
@@ -503,6 +947,13 @@ def run(pargs=None, name=None):
             sys.exit(1)
 
     logging.debug('args.dev is %s', str(args.dev))
+    args._stdlib_index = None  # built upon first on demand request
+    args._stdlib_lock = threading.Lock()
+    args._api_lock = threading.Lock()  # api_hidx/api_idata
+    args._timings = StartupTimings()
+    args._trace = None
+    if args.dev_import_trace:
+        args._trace = ImportTrace(os.path.normpath(args.dev_import_trace))
 
     if args.api_url:
         if not args.api_url.startswith('/'):
@@ -542,8 +993,28 @@ def run(pargs=None, name=None):
     srvaddr = ('', args.port)
     handlercls = SimpleHTTPRequestHandler if args.simple else RequestHandler
 
+    args._events = None
+    if args.dev and not args.simple and not args.no_live_reload:
+        args._events = start_live_reload(args)
+
     logging.info('%s: Server Starts - %s', time.asctime(), str(srvaddr))
 
+    args._archive = None
+    if os.path.isfile(args.application) and is_archive(args.application):
+        if args.dev:
+            logging.error('Development options cannot serve an archive')
+            sys.exit(1)
+
+        logging.info('Serving from archive: %s', args.application)
+        try:
+            args._archive = ArchiveReader(args.application)
+        except (OSError, ValueError, zipfile.BadZipFile,
+                tarfile.TarError) as e:
+            logging.error('Cannot read archive %s: %s', args.application, e)
+            sys.exit(1)
+
+        logging.info('Archive members: %d', len(args._archive.members))
+
     # rework the application path for sanity
     args._spath = args.application.replace('\\', '/')
     if args._spath[-1] != '/':
@@ -552,7 +1023,7 @@ def run(pargs=None, name=None):
     # to allow restarting the server in short succession
     socketserver.TCPServer.allow_reuse_address = True
 
-    httpd = HTTPServer(srvaddr, handlercls)
+    httpd = ThreadingHTTPServer(srvaddr, handlercls)
     httpd.cliargs = args
 
     if args.browser:  # try to open a browser if needed
@@ -572,6 +1043,42 @@ def run(pargs=None, name=None):
     logging.info('%s: Server Stops - %s', time.asctime(), str(srvaddr))
 
 
+def start_live_reload(args):
+    appdir = os.path.normpath(args.application)
+
+    # The dev packages may live outside of the application
+    roots = [appdir] + [os.path.normpath(x) for x in args.dev_pkg_dir]
+    if args.dev_anpylar_dir:
+        roots.append(os.path.normpath(args.dev_anpylar_dir))
+    if args.auto_serve:
+        roots.append(args.auto_serve)
+
+    def relname(path):
+        for root in roots:
+            if root == appdir:
+                base = root
+            else:  # package dirs are named after themselves
+                base = os.path.dirname(root)
+
+            rel = os.path.relpath(path, base)
+            if not rel.startswith(os.pardir):
+                return rel.replace(os.sep, '/')
+
+        return os.path.basename(path)
+
+    channel = EventChannel()
+
+    def notify(changed):
+        names = sorted(set(relname(x) for x in changed))
+        logging.info('Live-reload: changes in %s', ', '.join(names))
+        channel.publish('change', {'changed': names})
+
+    logging.debug('Live-reload watching: %s', str(roots))
+    watcher = FileWatcher(roots, interval=args.reload_interval)
+    watcher.start(notify)
+    return channel
+
+
 def parse_args(pargs=None, name=None):
     if not name:
         name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
@@ -585,7 +1092,8 @@ def parse_args(pargs=None, name=None):
     )
 
     parser.add_argument('application', nargs='?', default='.',
-                        help='Application directory to serve')
+                        help=('Application directory to serve or a zip/tar '
+                              'archive (as written by webpack --archive)'))
 
     pgroup = parser.add_argument_group(title='Server Options')
     pgroup.add_argument('--sname', required=False, default='127.0.0.1',
@@ -604,6 +1112,18 @@ def parse_args(pargs=None, name=None):
     pgroup.add_argument('--browser', required=False, action='store_true',
                         help='Try to open a browser to the served app')
 
+    pgroup.add_argument('--no-live-reload', required=False,
+                        action='store_true',
+                        help=('In development mode, do not notify the '
+                              'browser of changes in the served files. '
+                              'Changed stylesheets are swapped in place, '
+                              'any other change (html templates too) '
+                              'reloads the page'))
+
+    pgroup.add_argument('--reload-interval', required=False, default=1.0,
+                        type=float,
+                        help='Seconds between checks for changed files')
+
     pgroup = parser.add_argument_group(
         title='Development options',
         description=('If any of the options in this group is set, the server '
@@ -647,6 +1167,23 @@ def parse_args(pargs=None, name=None):
     pgroup.add_argument('--dev-optimize', action='store_true',
                         help='Optimized the generated bundle')
 
+    pgroup.add_argument('--dev-stdlib-on-demand', action='store_true',
+                        help=('Leave the stdlib out of the bundle and serve '
+                              'each stdlib module when brython imports it, '
+                              'letting the browser cache it'))
+
+    pgroup.add_argument('--dev-timings', action='store_true',
+                        help=('Instrument the bundle to report the startup '
+                              'timings of the browser (parse, vfs, '
+                              'bootstrap) which are aggregated per bundle. '
+                              'Summary available at ' + _DEV_TIMINGS))
+
+    pgroup.add_argument('--dev-import-trace', action='store', default='',
+                        help=('Record the modules imported by the browser '
+                              'in the given trace file (extended if it '
+                              'exists) to be used by webpack/bundle with '
+                              '--trace'))
+
     pgroup = parser.add_argument_group(title='API options')
     pgroup.add_argument('--api-url', default='',
                         help='URL path when serving an API request')
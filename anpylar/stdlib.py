@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import argparse
+import logging
+import os.path
+import sys
+
+from .logconfig import logconfig
+from .packaging import Bundler, StdlibContainer
+from .utils import readfile_error
+
+STDLIB_EXT = '.stdlib'
+
+
+def run(pargs=None, name=None):
+    args, parser = parse_args(pargs=pargs, name=name)
+
+    logconfig(args.quiet, args.verbose)  # configure logging
+
+    src = args.brython_stdlib or Bundler.PATHS[Bundler.BRSTD_JS]
+    output = args.output
+    if not output:
+        output = os.path.splitext(os.path.basename(src))[0] + STDLIB_EXT
+
+    logging.info('Reading stdlib from: %s', src)
+    content = readfile_error(src, parser)
+
+    logging.info('Writing stdlib container out to: %s', output)
+    count = StdlibContainer.convert(content, os.path.normpath(output))
+    logging.info('Stored %d modules', count)
+
+    logging.info('Done')
+
+
+def parse_args(pargs=None, name=None):
+    if not name:
+        name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+
+    parser = argparse.ArgumentParser(
+        prog=name,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Convert a brython_stdlib.js into an indexed container '
+                     'which bundle, webpack and serve read without parsing '
+                     'the entire stdlib. Pass it with --brython_stdlib')
+    )
+
+    parser.add_argument('output', nargs='?', default='',
+                        help=('Name for the container. Default: the name of '
+                              'the stdlib with a {} extension'
+                              .format(STDLIB_EXT)))
+
+    parser.add_argument('--brython_stdlib', action='store', default=None,
+                        help=('brython_stdlib.js to convert. Default: the '
+                              'one shipped with anpylar'))
+
+    pgroup = parser.add_mutually_exclusive_group()
+    pgroup.add_argument('--quiet', '-q', action='store_true',
+                        help='Remove output (errors will be reported)')
+    pgroup.add_argument('--verbose', '-v', action='store_true',
+                        help='Increase verbosity level')
+
+    args = parser.parse_args(pargs)
+    return args, parser
+
+
+if __name__ == '__main__':
+    run()
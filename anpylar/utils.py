@@ -8,21 +8,38 @@
 import errno
 import os
 import sys
+import threading
+
+_local = threading.local()  # silent: errors are not printed in this thread
+
+
+class CommandError(SystemExit):
+    # Raised by print_error. Ends a command line run with exit code 1 and
+    # carries the error for those who catch it (like the api)
+    def __init__(self, error):
+        super().__init__(error)
+        self.code = 1
+        self.error = error
+
+
+def set_silent_errors(onoff=True):
+    _local.silent = onoff
 
 
 # prints the error and the parser help and bails out
 def print_error(error, parser=None):
-    print('-' * 50)
-    print(error)
-    print('-' * 50)
-    print()
-    if parser:
-        try:
-            parser.print_help()
-        except:
-            pass  # avoid new errors
+    if not getattr(_local, 'silent', False):
+        print('-' * 50)
+        print(error)
+        print('-' * 50)
+        print()
+        if parser:
+            try:
+                parser.print_help()
+            except:
+                pass  # avoid new errors
 
-    sys.exit(1)
+    raise CommandError(error)
 
 
 # calculates the name of the item's names by lowercasing and inserting an _
@@ -100,6 +117,13 @@ def readfile_error(filename, parser=None, encoding='utf-8',
         print_error(e, parser)
 
 
+def jobs_error(jobs, parser=None):
+    # --jobs: 0 -> as many as cpus, negative values are rejected
+    if jobs < 0:
+        e = 'Invalid number of jobs (0 or more): {}'.format(jobs)
+        print_error(e, parser)
+
+
 def read_license(filename, parser=None):
     output = ''
     if filename:
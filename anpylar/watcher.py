@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import logging
+import os
+import os.path
+import threading
+
+
+class FileWatcher:
+    # Polls a set of files/directories and reports which files have been
+    # added, modified or removed since the last check. Only the standard
+    # library is used: a stat of every file with each poll
+
+    IGNORE_DIRS = ('__pycache__', '__webpack__')
+
+    def __init__(self, paths, interval=1.0, ignores=IGNORE_DIRS):
+        self.paths = [os.path.normpath(x) for x in paths]
+        self.interval = interval
+        self.ignores = set(ignores)
+        self._snapshot = self.scan()
+        self._stop = threading.Event()
+
+    def scan(self):
+        snapshot = {}
+        for path in self.paths:
+            if os.path.isfile(path):
+                self._stat(path, snapshot)
+                continue
+
+            for root, dnames, fnames in os.walk(path):
+                # prune in place to avoid walking down into ignored dirs
+                dnames[:] = [x for x in dnames
+                             if x not in self.ignores and x[0] != '.']
+
+                for fname in fnames:
+                    self._stat(os.path.join(root, fname), snapshot)
+
+        return snapshot
+
+    def _stat(self, path, snapshot):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return  # removed in between, will be reported by the comparison
+
+        snapshot[path] = (st.st_mtime, st.st_size)
+
+    def changes(self):
+        snapshot = self.scan()
+        old, self._snapshot = self._snapshot, snapshot
+
+        changed = [k for k, v in snapshot.items() if old.get(k) != v]
+        changed += [k for k in old if k not in snapshot]  # removed ones
+        return sorted(changed)
+
+    def watch(self, callback):
+        while not self._stop.wait(self.interval):
+            try:
+                changed = self.changes()
+            except Exception as e:
+                logging.error('Watcher failed to scan files: %s', str(e))
+                continue
+
+            if changed:
+                logging.debug('Watcher detected changes: %s', str(changed))
+                callback(changed)
+
+    def start(self, callback):
+        t = threading.Thread(target=self.watch, args=(callback,))
+        t.daemon = True  # do not keep the process alive
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+
+def watch_build(build, paths, interval=1.0, ignore=None):
+    # Runs build and again whenever files under paths change, until
+    # interrupted. ignore(path) -> True for files whose changes do not count
+    # (the outputs of the build). A failed build waits for the next change
+    watcher = FileWatcher(paths, interval=interval)
+
+    def rebuild(changed=None):
+        if changed is not None:
+            if ignore is not None:
+                changed = [x for x in changed if not ignore(x)]
+
+            if not changed:
+                return
+
+            logging.info('Changes in: %s', ', '.join(changed))
+
+        try:
+            build()
+        except SystemExit as e:
+            if e.code:
+                logging.error('Build failed')
+        except Exception as e:
+            logging.error('Build failed: %s', str(e))
+
+        logging.info('Watching for changes (Ctrl-C to stop)')
+
+    rebuild()
+    try:
+        watcher.watch(rebuild)
+    except KeyboardInterrupt:
+        pass
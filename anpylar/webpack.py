@@ -8,19 +8,37 @@
 import argparse
 import ast
 import collections
+import functools
 import json
 import logging
 import os
 import os.path
+import posixpath
+import re
 import shutil
 import sys
 
+from .cache import BuildCache
+from . import compress
+from .archive import ArchiveWriter, ARCHIVE_EXTS, is_archive
+from .distsync import DistSync, COPY, LINK_MODES, manifest_path
+from .fingerprint import BuildFingerprint, record_path
 from .logconfig import logconfig
-from .packaging import Bundler
+from .packaging import Bundler, make_executor, bootstrap_imports
+from .packaging import AUTO_VFS_JS_EXT, BOOTSTRAP_MODULE, COLD_JS_EXT
+from .packaging import HASH_LEN, hashed_name, is_hashed_name
+from .result import BuildResult
 from .utils import readfile_error, makedir_error, makefile_error
+from .utils import jobs_error
+from .watcher import watch_build
 
 
 _DISTPATH_ = '__webpack__'
+_MANIFEST_ = 'manifest.json'
+
+# the script loading the bundle in index.html
+_APL_SCRIPT_RE = (r'<script\b[^>]*\bsrc=(["\'])anpylar\.js\1[^>]*>'
+                  r'\s*</script>')
 
 
 # main code
@@ -29,29 +47,81 @@ def run(pargs=None, name=None):
 
     logconfig(args.quiet, args.verbose)  # configure logging
 
+    if not args.watch:
+        build(args, parser)
+        return
+
+    # The same cache across builds keeps the entries in memory and the
+    # pakets of the last build let only the changed files be processed
+    cache = None if args.no_cache else BuildCache(args.cache_dir or None)
+    pakets = {}
+
+    target = os.path.normpath(args.target)
+    distpath = dist_path(args, target)
+    APL_path = os.path.join(target, 'anpylar.js')
+    watch_build(functools.partial(build, args, parser, cache=cache,
+                                  pakets=pakets),
+                input_paths(args, target), interval=args.watch_interval,
+                ignore=output_filter(target, distpath, APL_path))
+
+
+def build(args, parser, cache=None, result=None, pakets=None):
+    # Returns a BuildResult (the one given, if any). pakets: dict of the
+    # paketized directories kept between builds (see Bundler.set_reuse)
+    if result is None:
+        result = BuildResult('webpack')
+
+    jobs_error(args.jobs, parser)
+    result.phase('prepare')
     target = os.path.normpath(args.target)
     if not os.path.exists(target):
         logging.error('Target does not exist: %s', target)
         sys.exit(1)
 
-    bundler = Bundler(anpylarize=True)
-    bundler.set_br_debug(True)  # default
+    distpath = dist_path(args, target)
 
     # Prepare anpylar.js output path
     APL_path = os.path.join(target, 'anpylar.js')
     logging.debug('anpylar.js path: %s', APL_path)
 
+    fprint, fprint_path = None, record_path(APL_path)
+    if not args.reset_anpylar:
+        fprint = build_fingerprint(args, target, distpath, APL_path)
+        if not args.force and fprint.is_current():
+            logging.info('No changes since the last webpack of: %s', target)
+            result.finish(fprint.recorded, skipped=True)
+            return result
+
+    bundler = Bundler(anpylarize=True)
+    bundler.set_br_debug(True)  # default
+    if not args.no_cache:
+        bundler.set_cache(cache or BuildCache(args.cache_dir or None))
+
+    bundler.set_executor(make_executor(args.jobs))
+    if pakets is not None:
+        bundler.set_reuse(pakets)
+
     # check if only anpylar has to be recreated
     if args.reset_anpylar:
         logging.info('Resetting anpylar.js to complete package')
+        result.phase('bundle')
         bundler.write_bundle(APL_path)
+        result.finish([APL_path])
         sys.exit(0)
 
     if not args.no_package_json:  # package.json not disabled
         logging.info('Processing package.json')
         pjsonpath = os.path.join(target, 'package.json')
         pjsoncontent = readfile_error(pjsonpath, parser=parser)
-        pjson = json.loads(pjsoncontent)
+        try:
+            pjson = json.loads(pjsoncontent)
+        except ValueError as e:
+            logging.error('Failed to load json from: %s: %s', pjsonpath, e)
+            sys.exit(1)
+
+        if not isinstance(pjson, dict):
+            logging.error('Not a json object in: %s', pjsonpath)
+            sys.exit(1)
     else:
         logging.info('Ignoring package.json')
         pjson = {}  # have a safe default in place
@@ -75,14 +145,15 @@ def run(pargs=None, name=None):
 
     # With the list of packages in the hand, update anpylar.js
     logging.debug('Adding packages from package.json to bundle')
+    # The packages installed with pip and prebuilt pakets are vendor packages
     pkgsets = []
-    pkgsets += [(pjsonpkgs, 'package.json')]
-    pkgsets += [(otherpkgs, 'command line')]
+    pkgsets += [(pjsonpkgs, 'package.json', False)]
+    pkgsets += [(otherpkgs, 'command line', False)]
 
     if pjsonpkgdir:  # preferred installation directory for packages
-        pkgsets += [([pjsonpkgdir], 'package.json installation dir')]
+        pkgsets += [([pjsonpkgdir], 'package.json installation dir', True)]
 
-    for pkgset, pkgsetname in pkgsets:
+    for pkgset, pkgsetname, vendor in pkgsets:
         logging.debug('Processing package set: %s', pkgsetname)
         for pkg in pkgset:
             pkgtarget = os.path.normpath(os.path.join(target, pkg))
@@ -96,7 +167,8 @@ def run(pargs=None, name=None):
                 if os.path.exists(pkginit):
                     logging.debug('Adding package dir to bundle: %s:%s',
                                   pkg, pkgtarget)
-                    bundler.add_pkg_dir(pkgtarget, extensions=args.extensions)
+                    bundler.add_pkg_dir(pkgtarget, extensions=args.extensions,
+                                        vendor=vendor)
                 else:
                     # no initfound ... copy all underlying files/directories
                     logging.debug('No __init__.py found for %s', pkgtarget)
@@ -109,7 +181,8 @@ def run(pargs=None, name=None):
                                       dname, dtarget)
 
                         bundler.add_pkg_dir(dtarget,
-                                            extensions=args.extensions)
+                                            extensions=args.extensions,
+                                            vendor=vendor)
 
                     logging.debug('Checking subfiles for auto_vfs/vfs files')
                     for fname in fnames:
@@ -118,51 +191,137 @@ def run(pargs=None, name=None):
                             logging.debug('Adding vfs.js to bundle: %s:%s',
                                           fname, ftarget)
 
-                            bundler.add_vfs_js(ftarget)
+                            bundler.add_vfs_js(ftarget, vendor=True)
                         elif fname.endswith('.auto_vfs.js'):
                             logging.debug('Adding auto_vfs to bundle: %s:%s',
                                           fname, ftarget)
-                            bundler.add_auto_vfs(pkgtarget)
+                            bundler.add_auto_vfs(ftarget, vendor=True)
 
             elif pkg.endswith('.vfs.js'):
                 logging.debug('Adding vfs.js to bundle: %s:%s', pkg, pkgtarget)
-                bundler.add_vfs_js(pkgtarget)
+                bundler.add_vfs_js(pkgtarget, vendor=True)
             elif pkg.endswith('.auto_vfs.js'):
                 logging.debug('Adding auto_vfs.js to bundle: %s:%s',
                               pkg, pkgtarget)
-                bundler.add_auto_vfs(pkgtarget)
+                bundler.add_auto_vfs(pkgtarget, vendor=True)
             else:
                 logging.error('Exiting. Unknown file type for bundle: %s', pkg)
+                bundler.close()
                 sys.exit(1)
 
     if args.only_anpylar and args.no_optimize:
         logging.info('Exiting after (only) updating anpylar (unoptimized)')
+        result.phase('bundle')
         bundler.write_bundle(APL_path)
+        bundler.close()
+        if fprint is not None:
+            fprint.record([APL_path])
+
+        result.finish([APL_path])
         sys.exit(0)
 
     logging.debug('anpylar for __webpack__, set debug info')
     bundler.set_br_debug(pjsondebug)  # set to real value
 
+    index_path = os.path.join(target, 'index.html')
+    if os.path.isfile(index_path):
+        try:
+            roots = bootstrap_imports(readfile_error(index_path), target)
+        except ValueError as e:
+            logging.error('Invalid %s: %s', index_path, str(e))
+            sys.exit(1)
+    else:
+        roots = [BOOTSTRAP_MODULE]
+
+    logging.debug('Application roots: %s', str(roots))
+    if roots is None:
+        logging.info('The modules started by index.html are not known. '
+                     'All modules are kept')
+
+    if not args.no_optimize and not args.no_tree_shake:
+        result.phase('tree-shake')
+        if roots is not None:
+            logging.info('Removing modules unreachable from the application')
+            pruned = bundler.shake_packages(roots + args.keep_module)
+            for pname, psize in pruned:
+                logging.info('Pruned: %s (%d bytes)', pname, psize)
+
+            logging.info('Pruned %d modules/assets, saving %d bytes',
+                         len(pruned), sum(x[1] for x in pruned))
+
+            # the names used from anpylar are those of the reached modules
+            logging.info('Removing anpylar modules not used by the '
+                         'application')
+            pruned = bundler.shake_anpylar()
+            for pname, psize in pruned:
+                logging.info('Pruned: %s (%d bytes)', pname, psize)
+
+            logging.info('Pruned %d anpylar modules, saving %d bytes',
+                         len(pruned), sum(x[1] for x in pruned))
+
+    trace = None
+    if args.trace:
+        logging.info('Reading import traces: %s', ', '.join(args.trace))
+        trace = bundler.read_traces(args.trace)
+
     if not args.no_optimize:
+        result.phase('stdlib')
         logging.info('Optimizing stdlib')
-        bundler.optimize_stdlib()  # optimize stdlib
-
+        bundler.optimize_stdlib(trace=trace, split=args.trace_split)
+
+    chunkprefixes = pjson.get('chunks', None)
+    chunking = args.split_chunks or chunkprefixes is not None
+    if chunking and roots is None:
+        logging.info('Not moving modules to chunks: the modules imported '
+                     'at start up are not known')
+        chunking = False
+
+    if chunking:
+        result.phase('chunks')
+        logging.info('Moving modules imported on demand to chunks')
+        chunks = bundler.split_chunks(roots + args.keep_module,
+                                      prefixes=chunkprefixes)
+        for cname, centries in chunks:
+            logging.info('Chunk: %s (%d modules/assets)', cname, centries)
+
+    result.phase('bundle')
     logging.info('Updating anpylar.js')
     bundler.write_bundle(APL_path)  # write it out
+    bundler.close()  # no more paketizing
+
+    # chunks of previous runs. Without chunking, only those recorded as
+    # written by webpack: the other files named like chunks are the user's
+    recorded = None
+    if not chunking:
+        recorded = fprint.recorded_outputs() if fprint is not None else []
+
+    remove_stale_chunks(target, bundler.chunks, recorded)
+
+    if bundler.chunks:
+        logging.info('Writing chunks to: %s', target)
+        bundler.write_chunks(target)
+
+    outputs = [APL_path]
+    outputs += [os.path.join(target, x) for x in bundler.chunks]
+    coldname = None
+    if trace is not None and args.trace_split and not args.no_optimize:
+        coldpath = os.path.splitext(APL_path)[0] + COLD_JS_EXT
+        logging.info('Writing cold stdlib modules to: %s', coldpath)
+        bundler.write_cold_stdlib(coldpath)
+        outputs.append(coldpath)
+        coldname = os.path.basename(coldpath)
 
     if args.only_anpylar:
         logging.info('Exiting after (only) updating anpylar')
+        if fprint is not None:
+            fprint.record(outputs)
+
+        result.finish(outputs)
         sys.exit(0)  # nothing else can be done
 
+    result.phase('dist')
     logging.info('Preparing to put packages into the distribution')
     # All packages in place
-    if args.dist:
-        distpath = os.path.normpath(args.dist)
-        logging.debug('args.dist provided: normalized to: %s', distpath)
-    else:
-        distpath = os.path.join(target, _DISTPATH_)
-        logging.debug('args.dist not providec. Calculated: %s', distpath)
-
     if os.path.exists(distpath):
         logging.debug('Distribution path exists: %s', distpath)
         if args.no_overwrite:
@@ -170,7 +329,7 @@ def run(pargs=None, name=None):
                            'was allowed'), distpath)
             sys.exit(1)
 
-        else:  # overwrite allowed ... remove
+        elif args.clean and not args.archive:  # overwrite allowed ... remove
             logging.debug('Overwrite of %s allowed', distpath)
             logging.info('Removing previous distribution path: %s', distpath)
             try:
@@ -180,6 +339,25 @@ def run(pargs=None, name=None):
                               distpath, str(e))
                 sys.exit(1)
 
+    if args.archive:
+        # The files are streamed to the archive at the end, in name order
+        if not is_archive(distpath):
+            logging.error('Archive must be one of: %s',
+                          ', '.join(ARCHIVE_EXTS))
+            sys.exit(1)
+
+        out = ArchiveWriter(distpath, precompress=args.precompress)
+    else:
+        # Files are copied only if changed since the last run. Stale files
+        # are removed at the end
+        if not os.path.exists(distpath):
+            logging.debug('Distpath not yet created. Creating: %s', distpath)
+            makedir_error(distpath, parser=parser)
+
+        # the manifest lives next to the fingerprint, out of the dist
+        out = DistSync(distpath, link=args.link,
+                       manifest=manifest_path(APL_path))
+
     logging.info('Proceeding to copying data dirs')
 
     # List of packages read and distribution directory in place
@@ -198,9 +376,11 @@ def run(pargs=None, name=None):
         # add normpath to remove a trailing slash
         root, dnames, fnames = next(os.walk(target))
 
-        # shutil.copytree will fail if the destination directory exists
-        # Create it only if no copydirs do exit (copying files needs it)
-        copydirs = set(dnames) - set(allpkgs)
+        # the distribution may be inside the target (and an archive
+        # may have been preceded by a default distribution)
+        copydirs = set(dnames) - set(allpkgs) - {_DISTPATH_}
+        copydirs = [x for x in copydirs
+                    if not out.is_output(os.path.join(root, x))]
         logging.debug('Directory names: %s', str(dnames))
         logging.debug('Directories to copy: %s', ','.join(copydirs))
 
@@ -208,8 +388,7 @@ def run(pargs=None, name=None):
         for copydir in copydirs:
             logging.debug('Copying directory: %s', copydir)
             srcdir = os.path.join(root, copydir)
-            dstdir = os.path.join(distpath, copydir)
-            shutil.copytree(copydir, dstdir)
+            out.copy_dir(srcdir, copydir)
 
     elif isinstance(datafiles, list):
         # copy only those specified
@@ -220,28 +399,33 @@ def run(pargs=None, name=None):
             logging.debug('checking datafile: %s: %s', datafile, srcdir)
             if os.path.isdir(srcdir):
                 logging.debug('Is dir datafile: %s', srcdir)
-                dstdir = os.path.join(distpath, datafile)
-                shutil.copytree(srcdir, dstdir)
+                out.copy_dir(srcdir, datafile)
             else:
                 logging.debug('No dir datafile: %s', srcdir)
 
-    # shutil.copytree fails to work if distpath exists because it tries to
-    # create it. But if no dir was copied, the path won't exist yet
-    if not os.path.exists(distpath):
-        logging.debug('Distpath not yet created. Creating: %s', distpath)
-        makedir_error(distpath, parser=parser)
-
     if datafiles is None:
         # Copy individual files and other directories
         root, dnames, fnames = next(os.walk(target))
         logging.info('Copying individual files')
+        bookkeeping = {os.path.basename(fprint_path),
+                       os.path.basename(manifest_path(APL_path))}
         for fname in fnames:
             if fname in allpkgs:
                 logging.debug('Skipping. File was in packages: %s', fname)
                 continue  # skip what has already been copied
-            logging.debug('Copying file: %s', fname)
+
+            if fname in bookkeeping:
+                continue  # bookkeeping of webpack
+
+            if fname == 'anpylar.js' and args.split_vendor:
+                logging.debug('Skipping. Bundle will be split: %s', fname)
+                continue
             srcfile = os.path.join(root, fname)
-            shutil.copy(srcfile, distpath)
+            if out.is_output(srcfile):
+                continue  # the archive itself
+
+            logging.debug('Copying file: %s', fname)
+            out.copy_file(srcfile, fname, rewritten=fname == 'index.html')
 
     elif isinstance(datafiles, list):
         # copy only those specified
@@ -250,12 +434,282 @@ def run(pargs=None, name=None):
             srcfile = os.path.join(target, datafile)
             logging.debug('Copying datafile: %s', srcfile)
             if os.path.isfile(srcfile):
-                dstfile = os.path.join(distpath, datafile)
-                shutil.copyfile(srcfile, dstfile)
+                out.copy_file(srcfile, datafile,
+                               rewritten=datafile == 'index.html')
             else:
                 logging.debug('No file with that name found: %s', srcfile)
 
+    # fetched by anpylar_js, whatever the data files of package.json are
+    for chunk in bundler.chunks:
+        out.copy_file(os.path.join(target, chunk), chunk)
+
+    if coldname is not None:  # loaded by index.html, see cold_index
+        out.copy_file(os.path.join(target, coldname), coldname)
+
+    try:
+        out.sync()
+    except OSError as e:
+        logging.error('Cannot copy files to %s: %s', distpath, str(e))
+        sys.exit(1)
+
+    if not args.archive:
+        logging.info('Copied %d files, linked %d, %d unchanged',
+                     out.stats['copied'], out.stats['linked'],
+                     out.stats['unchanged'])
+
+    if coldname is not None:
+        cold_index(out, coldname)
+
+    if args.split_vendor:
+        result.phase('split-vendor')
+        logging.info('Writing vendor and app bundles to: %s', distpath)
+        bundles = [
+            out.write_hashed(part, '.js',
+                             functools.partial(bundler.iter_bundle, part=part))
+            for part in (bundler.VENDOR, bundler.APP)
+        ]
+
+        for bundle in bundles:
+            logging.info('Bundle: %s', bundle)
+
+        split_index(out, bundles)
+
+    if args.hash_names:
+        result.phase('hash-names')
+        logging.info('Naming files referenced by index.html after content')
+        manifest = collections.OrderedDict()
+        if args.split_vendor:
+            for part, bundle in zip((bundler.VENDOR, bundler.APP), bundles):
+                manifest[part + '.js'] = bundle
+
+        for chunk in bundler.chunks:
+            manifest[unhashed_name(chunk)] = chunk
+
+        hash_index(out, manifest)
+
+        logging.info('Writing manifest to: %s', _MANIFEST_)
+        out.write(_MANIFEST_, json.dumps(manifest, indent=4))
+
+    if args.precompress and not args.archive:
+        result.phase('precompress')
+        logging.info('Precompressing files in: %s', distpath)
+        paths = (os.path.join(distpath, *x.split('/'))
+                 for x in out.outputs())
+        results = compress.precompress(compress.iter_compressible(paths))
+        compress.log_summary(results)
+        for path, size, sizes in results:
+            rel = os.path.relpath(path, distpath)
+            for ext, csize in sizes.items():
+                if csize:
+                    out.add(rel + ext)
+
+    if args.archive:
+        result.phase('archive')
+        logging.info('Writing archive: %s', distpath)
+
+    try:
+        out.finish()
+    except OSError as e:
+        logging.error('Cannot write %s: %s', distpath, str(e))
+        sys.exit(1)
+
+    if args.archive:
+        logging.info('Archived %d members, %d bytes',
+                     out.stats['members'], out.stats['size'])
+    elif out.stats['removed']:
+        logging.info('Removed %d stale files', out.stats['removed'])
+
+    if fprint is not None:
+        fprint.record(outputs + [distpath])
+
+    result.finish(outputs + [distpath])
     logging.info('Done')
+    return result
+
+
+def dist_path(args, target):
+    if args.archive:
+        distpath = os.path.normpath(args.archive)
+        logging.debug('args.archive provided: normalized to: %s', distpath)
+    elif args.dist:
+        distpath = os.path.normpath(args.dist)
+        logging.debug('args.dist provided: normalized to: %s', distpath)
+    else:
+        distpath = os.path.join(target, _DISTPATH_)
+        logging.debug('args.dist not providec. Calculated: %s', distpath)
+
+    return distpath
+
+
+def output_filter(target, distpath, apl_path):
+    # Returns a function telling if a path is an output of webpack
+    chunkre = re.compile(r'\.[0-9a-f]{%d}%s$' % (HASH_LEN,
+                                                 re.escape(AUTO_VFS_JS_EXT)))
+    outputs = [apl_path, os.path.splitext(apl_path)[0] + COLD_JS_EXT,
+               distpath, os.path.join(target, _DISTPATH_),
+               record_path(apl_path), manifest_path(apl_path)]
+    outputs = set(os.path.abspath(x) for x in outputs)
+    tabs = os.path.abspath(target)
+
+    def is_output(path):
+        apath = os.path.abspath(path)
+        if apath in outputs:
+            return True
+
+        if os.path.dirname(apath) == tabs:
+            return chunkre.search(apath) is not None
+
+        # files inside an output directory
+        return any(apath.startswith(os.path.join(x, '')) for x in outputs)
+
+    return is_output
+
+
+def input_paths(args, target):
+    # The application, packages living out of it and traces
+    paths = [target]
+    tabs = os.path.abspath(target)
+
+    pkgs = list(args.packages)
+    pjsonpath = os.path.join(target, 'package.json')
+    if not args.no_package_json and os.path.isfile(pjsonpath):
+        try:
+            pjson = json.loads(readfile_error(pjsonpath))
+        except ValueError:
+            pjson = {}  # reported when building
+
+        if not isinstance(pjson, dict):
+            pjson = {}  # reported when building
+
+        pkgs += pjson.get('packages', [])
+        pkgs += filter(None, [pjson.get('pkgdir', '')])
+
+    for pkg in pkgs:
+        pkgpath = os.path.abspath(os.path.join(target, pkg))
+        if not pkgpath.startswith(os.path.join(tabs, '')):
+            paths.append(pkgpath)  # not seen with the application
+
+    paths += [os.path.normpath(x) for x in args.trace]
+    return paths
+
+
+def build_fingerprint(args, target, distpath, apl_path):
+    # The inputs are the files of the application (but for the outputs of
+    # webpack in it), packages living out of it, traces and the options
+    fprint = BuildFingerprint(record_path(apl_path),
+                              ignore=output_filter(target, distpath, apl_path))
+    fprint.add_options(args)
+    for path in input_paths(args, target):
+        fprint.add_path(path)
+
+    return fprint
+
+
+def unhashed_name(name):
+    # name.<hash>.ext -> name.ext
+    return re.sub(r'\.[0-9a-f]{%d}(?=(\.\w+)+$)' % HASH_LEN, '', name)
+
+
+def hash_index(out, manifest):
+    # Renames the local files referenced by index.html to names with a hash
+    # of their content and rewrites the references. manifest (logical name
+    # -> hashed name) is updated with the renamed files. out: DistSync or
+    # ArchiveWriter
+    if not out.isfile('index.html'):
+        logging.warning('No index.html with references to hash')
+        return
+
+    def hashref(m):
+        attr, quote, url = m.groups()
+        path, query = re.match(r'([^?#]*)(.*)', url).groups()
+        if not path or ':' in path or path.startswith('/'):
+            return m.group(0)  # not a local relative file
+
+        if path not in manifest:
+            if is_hashed_name(path) or not out.isfile(path):
+                return m.group(0)
+
+            root, ext = posixpath.splitext(path)
+            hpath = hashed_name(root, ext, out.read(path))
+            logging.debug('Renaming %s to %s', path, hpath)
+            try:
+                out.rename(path, hpath)
+            except OSError as e:
+                logging.error('Cannot rename %s: %s', path, str(e))
+                return m.group(0)
+
+            manifest[path] = hpath
+
+        return '{}={}{}{}{}'.format(attr, quote, manifest[path], query, quote)
+
+    content = out.read('index.html').decode('utf-8')
+    content = re.sub(r'\b(src|href)=(["\'])(.*?)\2', hashref, content)
+    out.write('index.html', content)
+
+
+def cold_index(out, coldname):
+    # Adds a script loading the cold stdlib modules after the anpylar.js
+    # script of index.html. It is deferred: the page does not wait for
+    # modules which were not seen imported. The modules reach the VFS when
+    # both scripts have run, whichever goes first
+    if not out.isfile('index.html'):
+        logging.warning('No index.html to load %s from', coldname)
+        return
+
+    content = out.read('index.html').decode('utf-8')
+    script = '<script src="{}" defer></script>'.format(coldname)
+    content, count = re.subn(_APL_SCRIPT_RE,
+                             lambda m: m.group(0) + '\n  ' + script, content,
+                             count=1)
+    if not count:
+        logging.warning('No anpylar.js script found in index.html to load '
+                        '%s after', coldname)
+        return
+
+    out.write('index.html', content)
+
+
+def split_index(out, bundles):
+    # Replaces the anpylar.js script in index.html with the bundles, which
+    # are deferred (and not async) to be executed in order
+    if not out.isfile('index.html'):
+        logging.warning('No index.html to load the bundles from')
+        return
+
+    content = out.read('index.html').decode('utf-8')
+    scripts = '\n  '.join('<script src="{}" defer></script>'.format(x)
+                          for x in bundles)
+
+    content, count = re.subn(_APL_SCRIPT_RE, lambda m: scripts, content,
+                             count=1)
+    if not count:
+        logging.warning('No anpylar.js script found in index.html')
+        return
+
+    out.write('index.html', content)
+
+
+def remove_stale_chunks(target, chunks, recorded=None):
+    # chunks from previous runs, with other content hashes. recorded: if
+    # given, only files in it (paths) are removed
+    chunkre = re.compile(r'\.[0-9a-f]{%d}%s$' % (HASH_LEN,
+                                                 re.escape(AUTO_VFS_JS_EXT)))
+    if recorded is not None:
+        recorded = set(os.path.abspath(x) for x in recorded)
+
+    root, dnames, fnames = next(os.walk(target))
+    for fname in fnames:
+        if not chunkre.search(fname) or fname in chunks:
+            continue
+
+        fpath = os.path.join(root, fname)
+        if recorded is None or os.path.abspath(fpath) in recorded:
+            logging.debug('Removing stale chunk: %s', fname)
+            try:
+                os.remove(fpath)
+            except OSError as e:
+                logging.error('Cannot remove stale chunk %s: %s',
+                              fname, str(e))
 
 
 def parse_args(pargs=None, name=None):
@@ -287,6 +741,38 @@ def parse_args(pargs=None, name=None):
     parser.add_argument('--no-overwrite', action='store_true',
                         help='Do not overwrite existing dist directory')
 
+    parser.add_argument('--archive', action='store', default='',
+                        help=('Write the distribution to a zip or tar '
+                              '(.tar.gz/.tgz) archive instead of a '
+                              'directory. The members are sorted and have a '
+                              'fixed timestamp. With --precompress, .gz/.br '
+                              'members are stored too'))
+
+    parser.add_argument('--clean', action='store_true',
+                        help=('Remove an existing dist directory instead of '
+                              'copying only the changed files to it'))
+
+    parser.add_argument('--link', action='store', default=COPY,
+                        choices=LINK_MODES,
+                        help=('How files are put in the dist directory: '
+                              'copies, hardlinks or reflinks (copy-on-write '
+                              'clones, where the filesystem supports them). '
+                              'index.html is always copied'))
+
+    parser.add_argument('--force', action='store_true',
+                        help=('Package even if no input/option changed since '
+                              'the last run'))
+
+    parser.add_argument('--watch', action='store_true',
+                        help=('Package again whenever the application or '
+                              'its packages change. Only the changed files '
+                              'of the packages are read and paketized '
+                              'again, the rest of the build is done anew'))
+
+    parser.add_argument('--watch-interval', action='store', default=1.0,
+                        type=float,
+                        help='Seconds between checks for changes')
+
     parser.add_argument('--extensions', default='.py,.js,.css,.html',
                         help=('Comma separated list of extensions to pack '
                               'when packaging directories'))
@@ -304,6 +790,70 @@ def parse_args(pargs=None, name=None):
                         help=('Do not optimize the size of the anpylar.js '
                               'by packaging only the needed stdlib modules'))
 
+    parser.add_argument('--no-tree-shake', action='store_true',
+                        help=('Do not remove the package and anpylar '
+                              'modules which are not imported from the '
+                              'application entry point (directly or '
+                              'indirectly)'))
+
+    parser.add_argument('--keep-module', action='append', default=[],
+                        help=('Module to keep when removing unreachable '
+                              'modules, like those imported dynamically. '
+                              'Can be specified multiple times'))
+
+    parser.add_argument('--split-chunks', action='store_true',
+                        help=('Move the modules which are not imported at '
+                              'start up (only inside functions) to chunks '
+                              'fetched when first imported. One per '
+                              'subpackage or per prefix listed under '
+                              '"chunks" in package.json (which also '
+                              'activates the splitting)'))
+
+    parser.add_argument('--split-vendor', action='store_true',
+                        help=('Write a vendor bundle (brython, stdlib, '
+                              'anpylar and installed/prebuilt packages) and '
+                              'an app bundle, named after their content, '
+                              'and load them from index.html instead of '
+                              'anpylar.js'))
+
+    parser.add_argument('--hash-names', action='store_true',
+                        help=('Name the files referenced by index.html '
+                              '(anpylar.js, stylesheets, ...) after their '
+                              'content to let them be cached forever and '
+                              'write a manifest.json with the names'))
+
+    parser.add_argument('--precompress', action='store_true',
+                        help=('Write .gz (and .br if the brotli module is '
+                              'available) files next to the compressible '
+                              'files of the distribution, for servers which '
+                              'deliver them directly'))
+
+    parser.add_argument('--trace', action='append', default=[],
+                        help=('Import trace recorded with serve. Only the '
+                              'stdlib modules seen imported are packaged. '
+                              'Can be specified multiple times'))
+
+    parser.add_argument('--trace-split', action='store_true',
+                        help=('With --trace, the modules found by the import '
+                              'analysis which were not seen imported are '
+                              'written to anpylar.cold.js, which the '
+                              'index.html of the distribution loads '
+                              'deferred'))
+
+    pgroup = parser.add_argument_group(title='Parallel processing')
+    pgroup.add_argument('--jobs', '-j', action='store', default=1, type=int,
+                        help=('Number of processes for paketizing files. '
+                              '0 uses as many as cpus are available'))
+
+    pgroup = parser.add_argument_group(title='Cache options')
+    pgroup.add_argument('--no-cache', action='store_true',
+                        help=('Do not use the cache of minified files and '
+                              'scanned imports'))
+
+    pgroup.add_argument('--cache-dir', action='store', default='',
+                        help=('Directory for the cache. Default: '
+                              '$XDG_CACHE_HOME/anpylar or ~/.cache/anpylar'))
+
     pgroup = parser.add_mutually_exclusive_group()
     pgroup.add_argument('--quiet', '-q', action='store_true',
                         help='Remove output (errors will be reported)')
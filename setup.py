@@ -124,6 +124,7 @@ setuptools.setup(
             'anpylar_js.js',
             'brython.js',
             'brython_stdlib.js',
+            'brython_stdlib.graph.json',
         ],
     },
     # Although 'package_data' is the preferred approach, in some case you may
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import pytest
+
+from anpylar import api
+
+from test_webpack import make_app
+
+
+def test_invalid_package_json(tmpdir):
+    target = make_app(tmpdir)
+    tmpdir.join('package.json').write('{"packages": ["app"],}')
+    with pytest.raises(api.BuildError) as e:
+        api.webpack(target, no_cache=True)
+
+    assert 'package.json' in str(e.value)
+
+
+def test_package_json_not_an_object(tmpdir):
+    target = make_app(tmpdir)
+    tmpdir.join('package.json').write('["app"]')
+    with pytest.raises(api.BuildError):
+        api.webpack(target, no_cache=True)
+
+
+def test_unknown_option():
+    for name in ('bogus', 'watch', 'package'):
+        with pytest.raises(TypeError) as e:
+            api.webpack('.', **{name: True})
+
+        assert 'unexpected option: ' + name in str(e.value)
+
+
+@pytest.mark.parametrize('opts,message', [
+    (dict(link='bogus'), 'invalid choice for option link'),
+    (dict(jobs='many'), 'invalid int value for option jobs'),
+])
+def test_invalid_option_value(tmpdir, opts, message):
+    target = make_app(tmpdir)
+    with pytest.raises(ValueError) as e:
+        api.webpack(target, no_cache=True, **opts)
+
+    assert message in str(e.value)
+
+
+def test_list_option_takes_a_list(tmpdir):
+    target = make_app(tmpdir)
+    with pytest.raises(TypeError) as e:
+        api.webpack(target, no_cache=True, packages='app')
+
+    assert 'option packages takes a list' in str(e.value)
+
+
+def test_option_values_converted(tmpdir):
+    target = make_app(tmpdir)
+    args, parser = api._args(api._webpack, 'webpack', [target],
+                             dict(jobs='2', link='hard'))
+    assert args.jobs == 2
+    assert args.link == 'hard'
+
+
+@pytest.mark.parametrize('command', ['webpack', 'bundle', 'paketize'])
+def test_negative_jobs(tmpdir, command):
+    target = make_app(tmpdir)
+    func = getattr(api, command)
+    path = str(tmpdir.join('out.js')) if command == 'bundle' else target
+    with pytest.raises(api.BuildError) as e:
+        func(path, no_cache=True, jobs=-1)
+
+    assert 'Invalid number of jobs' in str(e.value)
+
+
+def test_negative_jobs_command_line(tmpdir, capsys):
+    target = make_app(tmpdir)
+    with pytest.raises(SystemExit) as e:
+        api._webpack.run([target, '--no-cache', '--jobs', '-1'])
+
+    assert e.value.code == 1
+    assert 'Invalid number of jobs (0 or more): -1' in capsys.readouterr().out
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import os
+import stat
+import tarfile
+import zipfile
+
+import pytest
+
+from anpylar.archive import ArchiveWriter, FILE_MODE
+
+
+CONTENT = ('var x = 1;\n' * 200).encode('utf-8')
+
+
+@pytest.mark.parametrize('name', ['out.zip', 'out.tar.gz'])
+def test_archive_mode(tmpdir, name):
+    path = str(tmpdir.join(name))
+    writer = ArchiveWriter(path)
+    writer.write('index.html', '<html></html>\n')
+    writer.finish()
+    assert stat.S_IMODE(os.stat(path).st_mode) == FILE_MODE
+
+
+@pytest.mark.parametrize('name', ['out.zip', 'out.tar'])
+def test_archive_precompress_window(tmpdir, name):
+    # more members than the window of variants compressed ahead
+    path = str(tmpdir.join(name))
+    writer = ArchiveWriter(path, precompress=True, workers=2)
+    rels = ['m{:02d}.js'.format(i) for i in range(20)]
+    for rel in rels:
+        writer.write(rel, CONTENT)
+
+    writer.write_iter('gen.js', lambda: [CONTENT])
+    writer.finish()
+
+    if name.endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            names = zf.namelist()
+            assert zf.read('m07.js') == CONTENT
+    else:
+        with tarfile.open(path) as tf:
+            names = tf.getnames()
+            assert tf.extractfile('m07.js').read() == CONTENT
+
+    assert names == sorted(names)
+    for rel in rels + ['gen.js']:
+        assert rel in names
+        assert rel + '.gz' in names
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import os
+
+from anpylar.cache import BuildCache
+
+
+def cache_files(path):
+    return [fname for _, _, fnames in os.walk(path) for fname in fnames]
+
+
+def test_put_and_get(tmpdir):
+    cache = BuildCache(str(tmpdir))
+    cache.put('ab' * 20, {'x': 1})
+
+    assert BuildCache(str(tmpdir)).get('ab' * 20) == {'x': 1}
+    assert cache_files(str(tmpdir)) == ['ab' * 20 + '.json']
+
+
+def test_failed_put_leaves_no_file(tmpdir, monkeypatch):
+    def fail(src, dst):
+        raise OSError('no space left')
+
+    monkeypatch.setattr(os, 'replace', fail)
+    cache = BuildCache(str(tmpdir))
+    cache.put('ab' * 20, {'x': 1})
+
+    assert cache_files(str(tmpdir)) == []
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import os
+import stat
+
+import pytest
+
+from anpylar.distsync import DistSync, COPY, HARDLINK, REFLINK
+
+
+@pytest.mark.parametrize('link', [COPY, HARDLINK, REFLINK])
+def test_copies_keep_mode(tmpdir, link):
+    src = tmpdir.join('src.js')
+    src.write('var x = 1\n')
+    src.chmod(0o644)
+    dist = tmpdir.mkdir('dist')
+
+    sync = DistSync(str(dist), link=link)
+    sync.copy_file(str(src), 'src.js')
+    sync.sync()
+    sync.finish()
+
+    mode = stat.S_IMODE(os.stat(str(dist.join('src.js'))).st_mode)
+    assert mode == 0o644
+    assert dist.join('src.js').read() == 'var x = 1\n'
+
+
+def test_manifest_out_of_dist(tmpdir):
+    src = tmpdir.join('src.js')
+    src.write('var x = 1\n')
+    dist = tmpdir.mkdir('dist')
+    dist.join('.anpylar-sync.json').write('{}')  # from older versions
+
+    sync = DistSync(str(dist))
+    sync.copy_file(str(src), 'src.js')
+    sync.sync()
+    sync.finish()
+
+    assert os.listdir(str(dist)) == ['src.js']
+    assert tmpdir.join('.dist.sync.json').check(file=1)
+
+    sync = DistSync(str(dist))  # second run finds it: nothing copied
+    sync.copy_file(str(src), 'src.js')
+    sync.sync()
+    assert sync.stats['copied'] == 0
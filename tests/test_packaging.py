@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import json
+import os
+
+from anpylar import api
+from anpylar.packaging import JsonFragments, iter_json, parse_source
+
+from test_webpack import make_app
+
+
+def test_json_fragments():
+    vfs = {'a': ['.py', 'import b\n'], 'b': ['.py', 'x = "1"\n', 1]}
+    fragments = JsonFragments()
+    for indent in (None, 4):
+        out = ''.join(iter_json(vfs, indent=indent, fragments=fragments))
+        assert out == json.dumps(vfs, indent=indent)
+
+    assert len(fragments) == 4  # both formats
+
+    # changed entries are encoded again, removed ones dropped
+    vfs = {'a': ['.py', 'import c\n']}
+    out = ''.join(iter_json(vfs, fragments=fragments))
+    assert out == json.dumps(vfs)
+    assert len(fragments) == 2
+
+
+def test_sources_released_after_build(tmpdir):
+    target = make_app(tmpdir)
+    api.webpack(target, no_cache=True)
+    assert parse_source.cache_info().currsize == 0
+
+
+def test_stdlib_decoded_once(tmpdir):
+    from anpylar import daemon
+    from anpylar.packaging import Bundler, StdlibGraph
+
+    daemon.warm(str(tmpdir.join('cache')))
+    with open(Bundler.PATHS[Bundler.BRSTD_JS], encoding='utf-8') as f:
+        chash = StdlibGraph.content_hash(f.read())
+
+    modules = StdlibGraph._modules[chash]
+    target = make_app(tmpdir.mkdir('app'))
+    api.webpack(target, no_cache=True)
+    assert StdlibGraph._modules[chash] is modules
+    assert parse_source.cache_info().currsize == 0
+
+
+def test_paketizer_reuses_unchanged_files(tmpdir, monkeypatch):
+    from anpylar import packaging
+
+    pkg = tmpdir.mkdir('pkg')
+    pkg.join('__init__.py').write('from . import a\n')
+    pkg.join('a.py').write('import os\n')
+    pkg.join('b.py').write('x = 1\n')
+    first = packaging.Paketizer(str(pkg))
+
+    read = []
+    readfile = packaging.readfile_error
+
+    def counting(path, *args, **kwargs):
+        read.append(os.path.basename(path))
+        return readfile(path, *args, **kwargs)
+
+    monkeypatch.setattr(packaging, 'readfile_error', counting)
+    pkg.join('b.py').write('x = 22\n')
+    second = packaging.Paketizer(str(pkg), previous=first)
+    assert read == ['b.py']
+    assert second.modules == packaging.Paketizer(str(pkg)).modules
+
+
+def test_webpack_reuses_pakets(tmpdir):
+    from anpylar import webpack
+
+    target = make_app(tmpdir)
+    pakets = {}
+    args, parser = webpack.parse_args([target, '--no-cache'])
+    webpack.build(args, parser, pakets=pakets)
+    first = dict(pakets)
+    assert list(first) == [os.path.abspath(os.path.join(target, 'app'))]
+
+    tmpdir.join('app', 'app_component.html').write('<h1>Changed</h1>\n')
+    args.force = True
+    webpack.build(args, parser, pakets=pakets)
+    with open(os.path.join(target, 'anpylar.js'), encoding='utf-8') as f:
+        assert 'Changed' in f.read()
+
+    paket = pakets[list(first)[0]]
+    assert paket is not first[list(first)[0]]
+    assert paket.fragments is first[list(first)[0]].fragments
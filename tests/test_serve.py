@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import argparse
+import http.client
+import json
+import threading
+
+import pytest
+
+from anpylar.serve import RequestHandler, ThreadingHTTPServer
+from anpylar.serve import ImportTrace, StartupTimings
+from anpylar.serve import _DEV_IMPORTS, _DEV_TIMINGS, _DEV_URL
+
+
+class FailingHandler(RequestHandler):
+    # streams content which fails half way, as a broken bundle would
+    def do_GET(self):
+        def fragments():
+            yield 'x' * RequestHandler.CHUNK_SIZE
+            raise RuntimeError('broken bundle')
+
+        self._sendfile(self._sendchunked(fragments(), 'text/plain'))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FailingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True,
+                              kwargs=dict(poll_interval=0.05))
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('version', ['HTTP/1.1', 'HTTP/1.0'])
+def test_failed_stream_is_aborted(server, version):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port,
+                                      timeout=5)
+    conn._http_vsn_str = version
+    conn._http_vsn = 11 if version == 'HTTP/1.1' else 10
+    conn.request('GET', '/anpylar.js')
+    response = conn.getresponse()
+    assert response.status == 200
+    with pytest.raises((http.client.IncompleteRead, ConnectionError)):
+        response.read()
+
+    conn.close()
+
+
+class QuietHandler(RequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def dev_server(tmpdir):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+    trace = ImportTrace(str(tmpdir.join('trace.json')))
+    httpd.cliargs = argparse.Namespace(dev=True, api_url='', dev_timings=True,
+                                       _timings=StartupTimings(), _trace=trace)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True,
+                              kwargs=dict(poll_interval=0.05))
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(server, path, body, clength=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port,
+                                      timeout=5)
+    conn.putrequest('POST', path)
+    conn.putheader('Content-Length',
+                   str(len(body)) if clength is None else clength)
+    conn.endheaders(body)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status
+
+
+def test_timings_post(dev_server):
+    sample = {'hash': 'abc', 'parse': 12.5, 'vfs': 3, 'bootstrap': 40}
+    assert post(dev_server, _DEV_TIMINGS, json.dumps(sample).encode()) == 204
+    assert dev_server.cliargs._timings.summary()['abc']['parse']['n'] == 1
+
+
+@pytest.mark.parametrize('body,clength', [
+    (b'[1]', None),
+    (b'"x"', None),
+    (b'{"hash": ', None),
+    (b'\xff', None),
+    (b'{}', 'abc'),
+    (b'{}', '-1'),
+])
+def test_timings_bad_post(dev_server, body, clength):
+    assert post(dev_server, _DEV_TIMINGS, body, clength) == 400
+    assert not dev_server.cliargs._timings.summary()
+
+
+def test_dev_post_unknown(dev_server):
+    # no import trace is being recorded
+    assert post(dev_server, _DEV_URL + 'nothing', b'{}') == 404
+
+
+def test_imports_post(dev_server):
+    body = json.dumps({'modules': ['app', 'json']}).encode()
+    assert post(dev_server, _DEV_IMPORTS, body) == 204
+    assert dev_server.cliargs._trace.modules == {'app', 'json'}
+
+
+@pytest.mark.parametrize('body', [
+    b'["app"]',
+    b'{"modules": "app"}',
+    b'{"modules": ["app", 1]}',
+    b'{"modules": [["app"]]}',
+])
+def test_imports_bad_post(dev_server, body):
+    assert post(dev_server, _DEV_IMPORTS, body) == 400
+    assert not dev_server.cliargs._trace.modules
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 The AnPyLar Team. All Rights Reserved.
+# Use of this source code is governed by an MIT-style license that
+# can be found in the LICENSE file at http://anpylar.com/mit-license
+###############################################################################
+import json
+import os.path
+import tarfile
+
+import pytest
+
+from anpylar import api
+from anpylar.packaging import bootstrap_imports, has_side_effects
+
+
+INDEX = '''<!DOCTYPE html>
+<html>
+<head>
+  <script src="anpylar.js" async></script>
+  {}
+</head>
+<body></body>
+</html>
+'''
+
+APP_MODULE = '''from anpylar import Module
+
+from .app_component import AppComponent
+
+
+class AppModule(Module):
+    components = AppComponent
+'''
+
+APP_COMPONENT = '''from anpylar import Component
+
+
+class AppComponent(Component):
+    title = 'Test'
+'''
+
+
+def make_app(path, script='', pjson=None, extra={}):
+    # minimal application in path with script in the head of index.html.
+    # pjson: additional package.json entries. extra: name -> content
+    pjson = dict({'packages': ['app']}, **(pjson or {}))
+    files = {
+        'package.json': json.dumps(pjson),
+        'index.html': INDEX.format(script),
+        'styles.css': '',
+        'app/__init__.py': 'from .app_module import AppModule\n',
+        'app/app_module.py': APP_MODULE,
+        'app/app_component.py': APP_COMPONENT,
+        'app/app_component.html': '<h1>Test</h1>\n',
+    }
+    files.update(extra)
+    for name, content in files.items():
+        fpath = os.path.join(str(path), *name.split('/'))
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(fpath, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    return str(path)
+
+
+def bundle_modules(target):
+    with open(os.path.join(target, 'anpylar.js'), encoding='utf-8') as f:
+        content = f.read()
+
+    names = ('app', 'app.app_module', 'app.app_component',
+             'app/app_component.html')
+    return {x for x in names if '"{}": ['.format(x) in content}
+
+
+def test_has_side_effects():
+    assert not has_side_effects('"""doc"""\nimport os\nx = 1\n')
+    assert has_side_effects('import os\nos.remove("x")\n')
+    assert has_side_effects('42\n')
+
+
+def test_bootstrap_default():
+    assert bootstrap_imports(INDEX.format('')) == ['app']
+
+
+def test_bootstrap_inline_script():
+    script = '<script type="text/python">\n    import app.app_module\n'
+    script += '</script>'
+    assert bootstrap_imports(INDEX.format(script)) == ['app',
+                                                       'app.app_module']
+
+
+def test_bootstrap_src_script(tmpdir):
+    tmpdir.join('index.py').write('import app\n')
+    script = '<script type="text/python" src="index.py"></script>'
+    assert bootstrap_imports(INDEX.format(script), str(tmpdir)) == ['app']
+
+
+def test_bootstrap_src_script_unresolved(tmpdir):
+    for src in ('missing.py', 'http://example.com/index.py'):
+        script = '<script type="text/python" src="{}"></script>'.format(src)
+        assert bootstrap_imports(INDEX.format(script), str(tmpdir)) is None
+
+
+def test_bootstrap_syntax_error():
+    script = '<script type="text/python">import (</script>'
+    with pytest.raises(ValueError):
+        bootstrap_imports(INDEX.format(script))
+
+
+def test_webpack_src_script(tmpdir):
+    target = make_app(tmpdir, '<script type="text/python" src="index.py">'
+                              '</script>')
+    tmpdir.join('index.py').write('import app\n')
+    api.webpack(target, no_cache=True)
+    assert len(bundle_modules(target)) == 4
+
+
+def test_webpack_src_script_unresolved(tmpdir):
+    target = make_app(tmpdir, '<script type="text/python" src="nope.py">'
+                              '</script>')
+    api.webpack(target, no_cache=True)
+    assert len(bundle_modules(target)) == 4
+    # nothing known about the names the application takes from anpylar
+    with open(os.path.join(target, 'anpylar.js'), encoding='utf-8') as f:
+        content = f.read()
+
+    for name in ('anpylar.module', 'anpylar.router', 'anpylar.http'):
+        assert '"{}": ['.format(name) in content
+
+
+def test_webpack_syntax_error(tmpdir):
+    target = make_app(tmpdir, '<script type="text/python">import (</script>')
+    with pytest.raises(api.BuildError):
+        api.webpack(target, no_cache=True)
+
+
+LAZY_COMPONENT = APP_COMPONENT + '''
+    def render(self, node):
+        from .lazy import Lazy
+'''
+
+
+def test_webpack_chunks_with_data(tmpdir):
+    # chunks reach the dist even if package.json lists what to copy
+    extra = {'app/app_component.py': LAZY_COMPONENT,
+             'app/lazy.py': 'class Lazy:\n    pass\n'}
+    target = make_app(tmpdir, pjson={'data': ['index.html']}, extra=extra)
+    api.webpack(target, no_cache=True, split_chunks=True)
+
+    chunks = [x for x in os.listdir(target) if x.endswith('.auto_vfs.js')]
+    assert len(chunks) == 1
+    assert chunks[0].startswith('app.lazy.')
+    dist = os.path.join(target, '__webpack__')
+    assert chunks[0] in os.listdir(dist)
+
+
+def test_webpack_keeps_chunk_like_files(tmpdir):
+    # without chunking, files named like chunks belong to the user
+    name = 'vendor.0123456789.auto_vfs.js'
+    target = make_app(tmpdir, extra={name: '// user file\n'})
+    api.webpack(target, no_cache=True)
+    assert os.path.isfile(os.path.join(target, name))
+    assert os.path.isfile(os.path.join(target, '__webpack__', name))
+
+
+def test_webpack_split_vendor(tmpdir):
+    # the parts concatenated are anpylar.js, with vendor packages (pkgdir)
+    # after the application ones in package.json
+    extra = {'site/vlib/__init__.py': 'X = 1\n',
+             'app/__init__.py': 'import vlib\nfrom .app_module import '
+                                'AppModule\n'}
+    target = make_app(tmpdir, pjson={'pkgdir': 'site'}, extra=extra)
+    api.webpack(target, no_cache=True, split_vendor=True)
+
+    dist = os.path.join(target, '__webpack__')
+    parts = {}
+    for fname in os.listdir(dist):
+        part = fname.split('.')[0]
+        if fname.endswith('.js') and part in ('vendor', 'app'):
+            with open(os.path.join(dist, fname), encoding='utf-8') as f:
+                parts[part] = f.read()
+
+    with open(os.path.join(target, 'anpylar.js'), encoding='utf-8') as f:
+        content = f.read()
+
+    assert '"vlib": [' in parts['vendor']
+    assert '"app": [' in parts['app']
+    assert parts['vendor'] + parts['app'] == content
+
+
+@pytest.mark.parametrize('split_vendor', [False, True])
+def test_webpack_trace_split_loads_cold(tmpdir, split_vendor):
+    extra = {'app/__init__.py': 'import json\nfrom .app_module import '
+                                'AppModule\n',
+             'trace.json': json.dumps({'modules': ['app']})}
+    target = make_app(tmpdir, pjson={'data': ['index.html']}, extra=extra)
+    api.webpack(target, no_cache=True, trace=[str(tmpdir.join('trace.json'))],
+                trace_split=True, split_vendor=split_vendor)
+
+    dist = os.path.join(target, '__webpack__')
+    assert os.path.isfile(os.path.join(dist, 'anpylar.cold.js'))
+    with open(os.path.join(dist, 'index.html'), encoding='utf-8') as f:
+        index = f.read()
+
+    cold = index.index('<script src="anpylar.cold.js" defer></script>')
+    bundle = 'app.' if split_vendor else 'anpylar.js'
+    assert index.index(bundle) < cold
+
+
+def test_webpack_keeps_stdlib_of_app_packages(tmpdir):
+    # the stdlib modules imported only by a directory package are kept
+    extra = {'app/__init__.py': 'import textwrap\nfrom .app_module import '
+                                'AppModule\n'}
+    target = make_app(tmpdir, extra=extra)
+    api.webpack(target, no_cache=True)
+    with open(os.path.join(target, 'anpylar.js'), encoding='utf-8') as f:
+        content = f.read()
+
+    assert '"textwrap": [' in content
+
+
+def test_webpack_removes_chunks_of_chunked_run(tmpdir):
+    # the chunks of a chunked build are not shipped by a later build
+    extra = {'app/app_component.py': LAZY_COMPONENT,
+             'app/lazy.py': 'class Lazy:\n    pass\n'}
+    target = make_app(tmpdir.mkdir('app'), extra=extra)
+    api.webpack(target, no_cache=True, split_chunks=True)
+    chunks = [x for x in os.listdir(target) if x.endswith('.auto_vfs.js')]
+    assert len(chunks) == 1
+
+    archive = str(tmpdir.join('out.tar.gz'))
+    api.webpack(target, no_cache=True, archive=archive)
+    assert chunks[0] not in os.listdir(target)
+    with tarfile.open(archive) as tf:
+        assert chunks[0] not in tf.getnames()
+        assert 'anpylar.js' in tf.getnames()
+
+
+def test_webpack_sync_manifest_not_deployed(tmpdir):
+    # the bookkeeping of the sync lives next to the fingerprint
+    target = make_app(tmpdir)
+    api.webpack(target, no_cache=True)
+    api.webpack(target, no_cache=True, force=True)
+
+    dist = os.path.join(target, '__webpack__')
+    assert os.path.isfile(os.path.join(target, '.anpylar.js.sync.json'))
+    assert not [x for x in os.listdir(dist) if x.endswith('.json')
+                and x != 'package.json']